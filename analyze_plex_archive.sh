@@ -35,7 +35,12 @@ fi
 if [ -f "$INPUT" ]; then
     echo "📦 Décompression de l'archive..."
     TEMP_DIR=$(mktemp -d /tmp/plex_analyze_XXXXXX)
-    tar -xzf "$INPUT" -C "$TEMP_DIR" 2>/dev/null || {
+    if [[ "$INPUT" == *.zst ]]; then
+        TAR_COMPRESS="zstd -T0"
+    else
+        TAR_COMPRESS="gzip"
+    fi
+    tar -I "$TAR_COMPRESS" -xf "$INPUT" -C "$TEMP_DIR" 2>/dev/null || {
         echo -e "${RED}❌ Erreur lors de la décompression${NC}"
         rm -rf "$TEMP_DIR"
         exit 1
@@ -32,6 +32,9 @@ Usage:
     # Combinaison : test minimal (juste scan Movies, sans Sonic)
     python automate_delta_sync.py --quick-test --section Movies
 
+    # Traiter les sections non-musicales en parallèle (expérimental)
+    python automate_delta_sync.py --parallel-sections 2
+
     # Sauvegarder l'output terminal + collecter les logs Plex
     python automate_delta_sync.py --save-output --collect-logs
 
@@ -43,21 +46,20 @@ Usage:
 """
 
 import argparse
-import json
 import os
-import re
 import sys
-import time
 from datetime import datetime
 
 # Import des modules common
 from common.config import load_env, get_docker_limits, print_phase_header
-from common.executor import execute_command, download_file_from_remote, docker_exec, read_state_file, verify_archive
+from common.executor import execute_command, download_file_parallel, docker_exec, read_state_file, verify_archive
 from common.local import find_latest_db_archive
 from common.plex_setup import (
     apply_system_optimizations,
     setup_rclone_config,
     mount_s3,
+    start_plex_image_pull,
+    report_plex_image_pull,
     start_plex_container,
     wait_plex_fully_ready,
     get_plex_token,
@@ -66,20 +68,26 @@ from common.plex_setup import (
     disable_all_background_tasks,
     enable_music_analysis_only,
     enable_all_analysis,
-    collect_plex_logs
+    collect_plex_logs,
+    prompt_plex_claim,
+    create_final_log_archive
 )
 from common.mount_monitor import MountHealthMonitor
 from common.plex_scan import (
+    parse_library_sections,
     trigger_sonic_analysis,
+    get_unanalyzed_track_ids,
     get_monitoring_params,
     export_metadata,
+    stream_export_metadata,
     wait_section_idle,
     wait_sonic_complete,
     wait_plex_stabilized,
     trigger_section_scan,
-    trigger_section_analyze,
+    run_other_sections,
     export_intermediate,
-    warm_vfs_cache
+    refresh_vfs_dir_cache,
+    get_sonic_diagnostic_from_db
 )
 from common.delta_sync import (
     inject_existing_db,
@@ -153,6 +161,10 @@ Profils d'instance:
                         default='cloud', help='Profil monitoring: local (timeouts courts), cloud (patient)')
     parser.add_argument('--path-mappings', type=str, metavar='FILE',
                         help='Fichier de remapping des chemins (défaut: path_mappings.json)')
+    parser.add_argument('--parallel-sections', type=int, default=1, metavar='N',
+                        help='Sections non-musicales traitées en parallèle (défaut: 1 = séquentiel)')
+    parser.add_argument('--stream-export', action='store_true',
+                        help='Streamer l\'archive finale (tar|zstd via SSH) sans archive temporaire sur l\'instance')
 
     args = parser.parse_args()
 
@@ -186,7 +198,7 @@ Profils d'instance:
             print("Pour créer une archive depuis le ZimaBoard:")
             print("  1. Copiez export_zimaboard_db.sh sur le ZimaBoard")
             print("  2. Exécutez: ./export_zimaboard_db.sh")
-            print("  3. Récupérez l'archive: scp jbo@zimaboard:~/plex_db_only_*.tar.gz ./")
+            print("  3. Récupérez l'archive: scp jbo@zimaboard:~/plex_db_only_*.tar.* ./")
             print("")
             print("Ou spécifiez le chemin: --archive /path/to/archive.tar.gz")
             sys.exit(1)
@@ -214,6 +226,7 @@ Profils d'instance:
         plex_token = None
         can_do_sonic = False
         mount_monitor = None
+        failed_sections = []
 
         # === PHASE 1: CRÉATION INSTANCE ===
         instance_ip = create_instance(env, profile)
@@ -222,6 +235,9 @@ Profils d'instance:
         wait_ssh_ready(instance_ip)
         wait_cloud_init(instance_ip)
 
+        # Pull de l'image Plex en arrière-plan (chevauche configuration, injection et montage)
+        image_pull = start_plex_image_pull(instance_ip, env.get('PLEX_VERSION', 'latest'))
+
         # === PHASE 3: CONFIGURATION ===
         print_phase_header(3, "CONFIGURATION ENVIRONNEMENT")
 
@@ -238,8 +254,7 @@ Profils d'instance:
 
 
         # Préparer les dossiers Plex
-        execute_command(instance_ip, "mkdir -p /opt/plex_data/{config,transcode}")
-        execute_command(instance_ip, "chmod -R 777 /opt/plex_data")
+        execute_command(instance_ip, "mkdir -p /opt/plex_data/{config,transcode} && chmod -R 777 /opt/plex_data")
 
         # === PHASE 4: INJECTION DB ===
         print_phase_header(4, "INJECTION DB EXISTANTE")
@@ -311,11 +326,14 @@ Profils d'instance:
         # === PHASE 6: DÉMARRAGE PLEX ===
         print_phase_header(6, "DÉMARRAGE PLEX")
 
+        # Image Plex prête AVANT le claim (docker run ne doit pas consommer le token)
+        report_plex_image_pull(image_pull)
+
         # Claim token AVANT de démarrer le monitoring
         # (évite les deadlocks et messages parasites pendant l'input)
-        plex_claim = input("\n🔑 Entrez votre PLEX_CLAIM (depuis https://www.plex.tv/claim) : ").strip()
+        plex_claim = prompt_plex_claim()
         if not plex_claim:
-            print("❌ PLEX_CLAIM requis")
+            print("❌ PLEX_CLAIM requis (saisie vide ou délai dépassé)")
             sys.exit(1)
 
         # Démarrer le monitoring du montage APRÈS avoir le claim
@@ -374,14 +392,10 @@ Profils d'instance:
         print_phase_header(7, "VÉRIFICATION BIBLIOTHÈQUES")
 
         # Récupérer les sections depuis l'API
-        section_info = {}
         api_cmd = f"curl -s 'http://localhost:32400/library/sections' -H 'X-Plex-Token: {plex_token}'"
         result = docker_exec(instance_ip, 'plex', api_cmd, capture_output=True, check=False)
 
-        if result.stdout:
-            for match in re.finditer(r'key="(\d+)".*?type="([^"]+)".*?title="([^"]+)"', result.stdout):
-                s_id, s_type, s_title = match.group(1), match.group(2), match.group(3)
-                section_info[s_title] = {"id": s_id, "type": s_type}
+        section_info = parse_library_sections(result.stdout)
 
         print(f"📚 Sections trouvées: {len(section_info)}")
         for name, info in section_info.items():
@@ -400,12 +414,15 @@ Profils d'instance:
             print("❌ Aucune section trouvée!")
             sys.exit(1)
 
+        # Cache de répertoires rclone prérempli avant les scans (LIST S3 groupés)
+        target_ids = [info['id'] for name, info in section_info.items()
+                      if not args.section or name in args.section]
+        refresh_vfs_dir_cache(instance_ip, '/opt/plex_data/config', target_ids)
+
         # === PHASE 8: TRAITEMENT MUSIQUE (Sonic) ===
         # Déterminer si on doit traiter la section Musique
-        should_process_music = (
-            not args.section
-            or any(section_info.get(s, {}).get('type') == 'artist' for s in args.section)
-        )
+        artist_names = {name for name, info in section_info.items() if info['type'] == 'artist'}
+        should_process_music = not args.section or bool(artist_names & set(args.section))
 
         # Initialiser stats_after_scan pour le cas où la phase Music est skippée
         stats_after_scan = stats_before
@@ -472,7 +489,8 @@ Profils d'instance:
                         wait_section_idle(instance_ip, 'plex', plex_token, music_section_id,
                                           section_type='artist', phase='scan', config_path='/opt/plex_data/config',
                                           timeout=metadata_params['absolute_timeout'],
-                                          check_interval=metadata_params['check_interval'])
+                                          check_interval=metadata_params['check_interval'],
+                                          max_interval=metadata_params['check_interval'] * 4)
                         print("   ✅ Refresh metadata terminé.")
 
                         # 8.3b Stabilisation avant Sonic
@@ -485,9 +503,17 @@ Profils d'instance:
                                              timeout=1800)
 
                     # 8.3c Lancer Sonic (sans --force, le refresh a été fait séparément)
+                    # Delta vide : rien à lancer ; sinon Sonic de section (pas de déclencheur
+                    # Sonic par item, Plex ne traite que les pistes encore sans analyse)
                     print("\n8.3c Lancement analyse Sonic...")
+                    unanalyzed_ids = get_unanalyzed_track_ids(instance_ip, '/opt/plex_data/config', music_section_id)
 
-                    trigger_sonic_analysis(instance_ip, music_section_id, 'plex')
+                    if unanalyzed_ids == []:
+                        print("   ✅ Aucune piste à analyser (delta vide)")
+                    else:
+                        if unanalyzed_ids:
+                            print(f"   🎯 {len(unanalyzed_ids)} piste(s) sans analyse Sonic")
+                        trigger_sonic_analysis(instance_ip, music_section_id, 'plex')
 
                     # Monitoring avec profil cloud (24h timeout)
                     monitoring_profile = 'cloud_intensive' if args.monitoring == 'cloud' else 'local_delta'
@@ -543,28 +569,23 @@ Profils d'instance:
             print("\n9.1 Réactivation des analyses (Photos/Vidéos)...")
             enable_all_analysis(instance_ip, 'plex', plex_token)
 
-            # 9.2 Scan sections restantes (SÉQUENTIEL)
-            print("\n9.2 Scan et analyse des sections restantes (séquentiel)...")
-
-            for section_name, info in other_sections:
-                # Scan de la section
-                print(f"\n   🔍 Scan de '{section_name}' (ID: {info['id']}, type: {info['type']})")
-                trigger_section_scan(instance_ip, 'plex', plex_token, info['id'], force=args.force_deep_scan)
-                wait_section_idle(instance_ip, 'plex', plex_token, info['id'],
-                                  section_type=info['type'], phase='scan',
-                                  config_path='/opt/plex_data/config', timeout=14400)
-
-                # Préchauffage du cache VFS avant analyse
-                warm_vfs_cache(instance_ip, '/opt/plex_data/config', info['id'], '/opt/media')
-
-                # Analyse de la section
-                print(f"\n   🔬 Analyse de '{section_name}' (ID: {info['id']})")
-                trigger_section_analyze(instance_ip, 'plex', plex_token, info['id'])
-                wait_section_idle(instance_ip, 'plex', plex_token, info['id'],
-                                  section_type=info['type'], phase='analyze',
-                                  config_path='/opt/plex_data/config', timeout=14400)
-
-            print("\n✅ Scan et analyse autres sections terminés")
+            # 9.2 Scan sections restantes (SÉQUENTIEL par défaut)
+            max_workers = max(1, min(args.parallel_sections, len(other_sections)))
+            health_check_fn = mount_monitor.get_health_check_fn() if mount_monitor else None
+            mode = "séquentiel" if max_workers == 1 else f"parallèle, {max_workers} workers"
+            print(f"\n9.2 Scan et analyse des sections restantes ({mode})...")
+
+            _, failed_sections = run_other_sections(
+                instance_ip, plex_token, other_sections, max_workers=max_workers,
+                health_check_fn=health_check_fn, force=args.force_deep_scan,
+                warm_cache=True, timeout=14400
+            )
+
+            if failed_sections:
+                # Export quand même (travail des autres sections), échec signalé en fin de run
+                print(f"\n❌ Sections en échec: {', '.join(failed_sections)}")
+            else:
+                print("\n✅ Scan et analyse autres sections terminés")
         else:
             print_phase_header(9, "VALIDATION AUTRES SECTIONS - SKIPPÉE")
             print("⏭️  Aucune section à traiter")
@@ -586,28 +607,35 @@ Profils d'instance:
         # 10.2 Arrêt Plex
         print("\n10.2 Arrêt de Plex...")
         stop_plex(instance_ip, container='plex')
-        time.sleep(3)
 
         # 10.3 Export complet
         print("\n10.3 Export complet...")
-        archive_name = f'plex_delta_sync_{RUN_TIMESTAMP}.tar.gz'
+        archive_name = f'plex_delta_sync_{RUN_TIMESTAMP}.tar.zst'
 
-        archive_remote = export_metadata(
-            instance_ip,
-            container='plex',
-            archive_name=archive_name,
-            config_path='/opt/plex_data/config'
-        )
-
-        # Télécharger
         local_archive = f'./{archive_name}'
-        download_file_from_remote(instance_ip, archive_remote, local_archive)
+
+        if args.stream_export:
+            # Compression et transfert simultanés, pas d'archive sur l'instance
+            stream_export_metadata(instance_ip, local_archive, config_path='/opt/plex_data/config')
+        else:
+            archive_remote = export_metadata(
+                instance_ip,
+                container='plex',
+                archive_name=archive_name,
+                config_path='/opt/plex_data/config'
+            )
+
+            # Télécharger
+            download_file_parallel(instance_ip, archive_remote, local_archive)
         verify_archive(local_archive)
 
         # 10.4 Résumé final
         print("\n10.4 Résumé final...")
         print("\n" + "=" * 60)
-        print("✅ DELTA SYNC TERMINÉ")
+        if failed_sections:
+            print("⚠️  DELTA SYNC TERMINÉ AVEC ERREURS")
+        else:
+            print("✅ DELTA SYNC TERMINÉ")
         print("=" * 60)
         print(f"📦 Archive principale : {local_archive}")
 
@@ -630,12 +658,20 @@ Profils d'instance:
         print("\n🔄 Pour appliquer sur le serveur Plex local:")
         print(f"   ./update_to_distant_plex.sh {archive_name}")
 
+        if failed_sections:
+            print(f"\n❌ Sections en échec (non scannées/analysées): {', '.join(failed_sections)}")
+            sys.exit(1)
+
     except KeyboardInterrupt:
         print("\n\n⚠️  Workflow interrompu par l'utilisateur")
+    except (BrokenPipeError, ConnectionResetError) as e:
+        # Coupure réseau/pipe : la pile (subprocess/ssh) n'apporte rien
+        print(f"\n❌ Connexion interrompue: {e}")
     except Exception as e:
         print(f"\n❌ Erreur: {e}")
         import traceback
-        traceback.print_exc()
+        # 25 dernières frames : le site de l'erreur, pas toute la pile d'appel
+        traceback.print_exc(limit=-25)
     finally:
         # Arrêter le monitor s'il n'a pas été arrêté en phase Export
         if mount_monitor is not None:
@@ -660,16 +696,12 @@ Profils d'instance:
             # Diagnostic Sonic (seulement si musique sélectionnée)
             if should_process_music:
                 print("\n🎹 DIAGNOSTIC SONIC:")
-                db_path = "/config/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
-
-                sonic_count_cmd = f'''docker exec plex sqlite3 "{db_path}" "
-                    SELECT
-                        (SELECT COUNT(*) FROM media_item_settings WHERE loudness != 0) as loudness_count,
-                        (SELECT COUNT(*) FROM media_parts WHERE extra_data LIKE '%hasSonicAnalysis%1%') as sonic_flag_count
-                " 2>/dev/null || echo "DB inaccessible"'''
-                sonic_result = execute_command(instance_ip, sonic_count_cmd, capture_output=True, check=False)
+                sonic_diag = get_sonic_diagnostic_from_db(instance_ip, '/opt/plex_data/config')
                 print(f"   Comptage Sonic (loudness vs extra_data):")
-                print(f"   {sonic_result.stdout.strip()}")
+                if sonic_diag:
+                    print(f"   {sonic_diag['loudness']}|{sonic_diag['sonic_flag']}")
+                else:
+                    print("   DB inaccessible")
 
             # Dernières logs
             print("\n📋 Dernières logs Docker:")
@@ -683,39 +715,7 @@ Profils d'instance:
             tee_logger.stop()
 
             # Créer l'archive finale combinée (Plex logs + terminal complet)
-            if os.path.exists(terminal_log_path):
-                import tarfile
-                import tempfile
-                import shutil
-
-                final_archive = f"logs/{RUN_TIMESTAMP}_logs_final_all.tar.gz"
-                os.makedirs("logs", exist_ok=True)
-
-                print(f"\n📦 Création archive finale combinée...")
-                temp_dir = tempfile.mkdtemp(prefix="final_logs_")
-                try:
-                    # Extraire les logs Plex si disponibles
-                    if plex_logs_archive and os.path.exists(plex_logs_archive):
-                        with tarfile.open(plex_logs_archive, 'r:gz') as tar:
-                            tar.extractall(temp_dir)
-                        os.remove(plex_logs_archive)
-
-                    # Ajouter le terminal log complet
-                    shutil.copy(terminal_log_path, os.path.join(temp_dir, f"output_{RUN_TIMESTAMP}.txt"))
-
-                    # Créer l'archive finale
-                    with tarfile.open(final_archive, 'w:gz') as tar:
-                        for item in os.listdir(temp_dir):
-                            tar.add(os.path.join(temp_dir, item), arcname=item)
-
-                    size_mb = os.path.getsize(final_archive) / (1024*1024)
-                    print(f"   ✅ Archive finale: {final_archive} ({size_mb:.1f} MB)")
-
-                finally:
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-
-                # Supprimer le fichier terminal brut
-                os.remove(terminal_log_path)
+            create_final_log_archive(terminal_log_path, plex_logs_archive, RUN_TIMESTAMP)
 
         # Destruction de l'instance
         if not args.keep:
@@ -31,35 +31,45 @@ Usage:
 
     # Garder l'instance après scan (debug)
     python automate_scan.py --instance power --keep
+
+    # Export streamé (tar|zstd via SSH, sans archive sur l'instance)
+    python automate_scan.py --instance power --stream-export
+
+    # Traiter les sections non-musicales en parallèle (expérimental)
+    python automate_scan.py --instance power --parallel-sections 2
 """
 
 # === IMPORTS ===
 import argparse
-import re
 import sys
-import time
 from datetime import datetime
 
 # Imports modules common
 from common.config import load_env, load_libraries, get_docker_limits, print_phase_header
-from common.executor import execute_command, download_file_from_remote, read_state_file, docker_exec, verify_archive
+from common.executor import execute_command, download_file_parallel, read_state_file, docker_exec, verify_archive
 from common.plex_setup import (
     apply_system_optimizations,
     cleanup_plex_data,
     setup_rclone_config,
     mount_s3,
+    start_plex_image_pull,
+    report_plex_image_pull,
     start_plex_container,
     wait_plex_fully_ready,
     get_plex_token,
-    add_library,
+    add_libraries,
+    wait_for_section_count,
     verify_plex_pass_active,
     collect_plex_logs,
+    stop_plex,
     wait_plex_ready_for_libraries,
     disable_all_background_tasks,
     enable_music_analysis_only,
-    enable_all_analysis
+    enable_all_analysis,
+    prompt_plex_claim
 )
 from common.plex_scan import (
+    parse_library_sections,
     trigger_sonic_analysis,
     get_monitoring_params,
     export_metadata,
@@ -68,8 +78,9 @@ from common.plex_scan import (
     wait_plex_stabilized,
     wait_sonic_complete,
     trigger_section_scan,
-    trigger_section_analyze,
-    export_intermediate
+    run_other_sections,
+    export_intermediate,
+    stream_export_metadata
 )
 from common.mount_monitor import MountHealthMonitor
 from common.scaleway import (
@@ -126,6 +137,10 @@ Profils d'instance:
                         help='Traiter uniquement ces sections (répétable, ex: --section Movies)')
     parser.add_argument('--quick-test', action='store_true',
                         help='Mode test rapide : skip Sonic, scan validation uniquement')
+    parser.add_argument('--parallel-sections', type=int, default=1, metavar='N',
+                        help='Sections non-musicales traitées en parallèle (défaut: 1 = séquentiel)')
+    parser.add_argument('--stream-export', action='store_true',
+                        help='Streamer l\'archive finale (tar|zstd via SSH) sans archive temporaire sur l\'instance')
 
     args = parser.parse_args()
 
@@ -158,6 +173,7 @@ Profils d'instance:
 
     instance_ip = None
     mount_monitor = None
+    failed_sections = []
 
     try:
         # === PHASE 1: CRÉATION INSTANCE ===
@@ -167,6 +183,9 @@ Profils d'instance:
         wait_ssh_ready(instance_ip)
         wait_cloud_init(instance_ip)
 
+        # Pull de l'image Plex en arrière-plan (chevauche configuration et montage S3)
+        image_pull = start_plex_image_pull(instance_ip, env.get('PLEX_VERSION', 'latest'))
+
         # === PHASE 3: CONFIGURATION ===
         print("\n" + "=" * 60)
         print("PHASE 3: CONFIGURATION ENVIRONNEMENT")
@@ -199,11 +218,14 @@ Profils d'instance:
         print("PHASE 4: DÉMARRAGE PLEX")
         print("=" * 60)
 
+        # Image Plex prête AVANT le claim (docker run ne doit pas consommer le token)
+        report_plex_image_pull(image_pull)
+
         # Claim token AVANT de démarrer le monitoring
         # (évite les deadlocks et messages parasites pendant l'input)
-        plex_claim = input("\n🔑 Entrez votre PLEX_CLAIM (depuis https://www.plex.tv/claim) : ").strip()
+        plex_claim = prompt_plex_claim()
         if not plex_claim:
-            print("❌ PLEX_CLAIM requis")
+            print("❌ PLEX_CLAIM requis (saisie vide ou délai dépassé)")
             sys.exit(1)
 
         # Démarrer le monitoring du montage APRÈS avoir le claim
@@ -249,29 +271,24 @@ Profils d'instance:
         if not wait_plex_ready_for_libraries(instance_ip, 'plex', plex_token):
             print("⚠️ Plex pas prêt, on continue quand même...")
 
-        success_count = 0
-        for lib in libraries:
-            if add_library(instance_ip, 'plex', lib, plex_token):
-                success_count += 1
-            time.sleep(2)
+        # Toutes les créations en un seul appel, puis poll de visibilité
+        library_result = add_libraries(instance_ip, 'plex', libraries, plex_token)
+        success_count = len(library_result['created'])
 
         print(f"\n📊 Résumé: {success_count}/{len(libraries)} bibliothèques créées")
 
         if success_count > 0:
-            print("⏳ Pause de 10s pour finalisation des bibliothèques...")
-            time.sleep(10)
+            print("⏳ Attente de finalisation des bibliothèques...")
+            wait_for_section_count(instance_ip, 'plex', plex_token, success_count)
 
         # === PHASE 6: TRAITEMENT MUSIQUE (Sonic) ===
         if not args.skip_scan:
             # Récupérer les sections réelles de Plex (avant filtrage --section)
             print("\n📚 Identification des sections...")
-            section_info = {}
             api_cmd = f"curl -s 'http://localhost:32400/library/sections' -H 'X-Plex-Token: {plex_token}'"
             result = docker_exec(instance_ip, 'plex', api_cmd, capture_output=True, check=False)
 
-            for match in re.finditer(r'key="(\d+)".*?type="([^"]+)".*?title="([^"]+)"', result.stdout):
-                s_id, s_type, s_title = match.group(1), match.group(2), match.group(3)
-                section_info[s_title] = {"id": s_id, "type": s_type}
+            section_info = parse_library_sections(result.stdout)
 
             print(f"   📚 Sections trouvées: {len(section_info)}")
             for name, info in section_info.items():
@@ -287,10 +304,8 @@ Profils d'instance:
                     print(f"      Disponibles: {list(available)}")
 
             # Déterminer si on doit traiter la section Musique
-            should_process_music = (
-                not args.section
-                or any(section_info.get(s, {}).get('type') == 'artist' for s in args.section)
-            )
+            artist_names = {name for name, info in section_info.items() if info['type'] == 'artist'}
+            should_process_music = not args.section or bool(artist_names & set(args.section))
 
             if should_process_music:
                 print_phase_header(6, "TRAITEMENT MUSIQUE (Sonic)")
@@ -370,7 +385,8 @@ Profils d'instance:
                         wait_section_idle(instance_ip, 'plex', plex_token, music_section_id,
                                           section_type='artist', phase='scan', config_path='/opt/plex_data/config',
                                           timeout=metadata_params['absolute_timeout'],
-                                          check_interval=metadata_params['check_interval'])
+                                          check_interval=metadata_params['check_interval'],
+                                          max_interval=metadata_params['check_interval'] * 4)
                         print("   ✅ Refresh metadata terminé.")
 
                         # 6.3b Stabilisation avant Sonic
@@ -428,26 +444,23 @@ Profils d'instance:
                 print("\n7.1 Réactivation des analyses (Photos/Vidéos)...")
                 enable_all_analysis(instance_ip, 'plex', plex_token)
 
-                # 7.2 Scan séquentiel des autres sections
-                print("\n7.2 Scan des sections restantes (séquentiel)...")
-
-                for section_name, info in other_sections:
-                    # Étape 1: Scan
-                    print(f"\n   🔍 Scan '{section_name}' (ID: {info['id']}, type: {info['type']})")
-                    trigger_section_scan(instance_ip, 'plex', plex_token, info['id'], force=False)
-                    wait_section_idle(instance_ip, 'plex', plex_token, info['id'],
-                                      section_type=info['type'], phase='scan',
-                                      config_path='/opt/plex_data/config', timeout=3600)
-
-                    # Étape 2: Analyse (thumbnails, chapitres, etc.)
-                    if not args.skip_analysis and not args.quick_test:
-                        print(f"   🔬 Analyse '{section_name}'")
-                        trigger_section_analyze(instance_ip, 'plex', plex_token, info['id'])
-                        wait_section_idle(instance_ip, 'plex', plex_token, info['id'],
-                                          section_type=info['type'], phase='analyze',
-                                          config_path='/opt/plex_data/config', timeout=3600)
-
-                print("\n   ✅ Autres sections terminées")
+                # 7.2 Scan des autres sections (SÉQUENTIEL par défaut)
+                analyze = not args.skip_analysis and not args.quick_test
+                max_workers = max(1, min(args.parallel_sections, len(other_sections)))
+                health_check_fn = mount_monitor.get_health_check_fn() if mount_monitor else None
+                mode = "séquentiel" if max_workers == 1 else f"parallèle, {max_workers} workers"
+                print(f"\n7.2 Scan des sections restantes ({mode})...")
+
+                _, failed_sections = run_other_sections(
+                    instance_ip, plex_token, other_sections, max_workers=max_workers,
+                    health_check_fn=health_check_fn, analyze=analyze
+                )
+
+                if failed_sections:
+                    # Export quand même (travail des autres sections), échec signalé en fin de run
+                    print(f"\n   ❌ Sections en échec: {', '.join(failed_sections)}")
+                else:
+                    print("\n   ✅ Autres sections terminées")
             else:
                 print_phase_header(7, "VALIDATION AUTRES SECTIONS - SKIPPÉE")
                 print("⏭️  Aucune section à traiter")
@@ -470,41 +483,55 @@ Profils d'instance:
 
         # 8.2 Arrêter Plex
         print("\n8.2 Arrêt de Plex...")
-        execute_command(instance_ip, "docker stop -t 60 plex || docker kill plex", check=False)
-        time.sleep(5)
+        stop_plex(instance_ip, container='plex', timeout=60)
 
         # 8.3 Export complet
         print("\n8.3 Export complet...")
-        archive_name = f'plex_metadata_{RUN_TIMESTAMP}.tar.gz'
+        archive_name = f'plex_metadata_{RUN_TIMESTAMP}.tar.zst'
+        local_archive = f'./{archive_name}'
 
-        archive_remote = export_metadata(
-            instance_ip,
-            container='plex',
-            archive_name=archive_name,
-            config_path='/opt/plex_data/config'
-        )
+        if args.stream_export:
+            # Compression et transfert simultanés, pas d'archive sur l'instance
+            stream_export_metadata(instance_ip, local_archive, config_path='/opt/plex_data/config')
+        else:
+            archive_remote = export_metadata(
+                instance_ip,
+                container='plex',
+                archive_name=archive_name,
+                config_path='/opt/plex_data/config'
+            )
 
-        # 8.4 Télécharger l'archive
-        print("\n8.4 Téléchargement de l'archive...")
-        local_archive = f'./{archive_name}'
-        download_file_from_remote(instance_ip, archive_remote, local_archive)
+            # 8.4 Télécharger l'archive
+            print("\n8.4 Téléchargement de l'archive...")
+            download_file_parallel(instance_ip, archive_remote, local_archive)
         verify_archive(local_archive)
 
         # === SUCCÈS ===
         print("\n" + "=" * 60)
-        print("✅ SCAN CLOUD TERMINÉ AVEC SUCCÈS")
+        if failed_sections:
+            print("⚠️  SCAN CLOUD TERMINÉ AVEC ERREURS")
+        else:
+            print("✅ SCAN CLOUD TERMINÉ AVEC SUCCÈS")
         print("=" * 60)
         print(f"📦 Archive: {local_archive}")
         print("")
         print("🔄 Pour appliquer sur le serveur Plex local:")
         print(f"   ./update_to_distant_plex.sh {archive_name}")
 
+        if failed_sections:
+            print(f"\n❌ Sections en échec (non scannées/analysées): {', '.join(failed_sections)}")
+            sys.exit(1)
+
     except KeyboardInterrupt:
         print("\n\n⚠️  Workflow interrompu par l'utilisateur")
+    except (BrokenPipeError, ConnectionResetError) as e:
+        # Coupure réseau/pipe : la pile (subprocess/ssh) n'apporte rien
+        print(f"\n❌ Connexion interrompue: {e}")
     except Exception as e:
         print(f"\n❌ Erreur: {e}")
         import traceback
-        traceback.print_exc()
+        # 25 dernières frames : le site de l'erreur, pas toute la pile d'appel
+        traceback.print_exc(limit=-25)
     finally:
         # Arrêter le monitor s'il n'a pas été arrêté en phase Export
         if mount_monitor is not None:
@@ -516,10 +543,16 @@ Profils d'instance:
             print("🔍 DIAGNOSTIC POST-MORTEM")
             print("=" * 60)
 
+            # Un seul appel : statut OOM (1re ligne) puis dernières logs du conteneur
+            postmortem_cmd = (
+                "docker inspect plex --format '{{.State.OOMKilled}}' 2>/dev/null || echo 'N/A'; "
+                "docker logs plex --tail 50 2>&1 || true"
+            )
+            postmortem_result = execute_command(instance_ip, postmortem_cmd, capture_output=True, check=False)
+            oom_status, _, docker_logs = (postmortem_result.stdout or '').partition('\n')
+
             # Vérifier si le conteneur a été tué par manque de RAM (OOM Killer)
-            oom_cmd = "docker inspect plex --format '{{.State.OOMKilled}}' 2>/dev/null || echo 'N/A'"
-            oom_result = execute_command(instance_ip, oom_cmd, capture_output=True, check=False)
-            is_oom = oom_result.stdout.strip() == 'true'
+            is_oom = oom_status.strip() == 'true'
 
             if is_oom:
                 print("🚨 ALERTE: Conteneur tué par manque de mémoire (OOM)")
@@ -529,7 +562,7 @@ Profils d'instance:
 
             # Afficher les dernières logs système du conteneur
             print("\n📋 Dernières logs Docker:")
-            execute_command(instance_ip, "docker logs plex --tail 50 2>&1 || true", check=False)
+            print(docker_logs, end='')
 
             # Collecter les logs si demandé
             if args.collect_logs or args.save_output:
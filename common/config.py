@@ -3,8 +3,10 @@
 Chargement de la configuration centralisée
 """
 import os
+import sys
 import json
-from datetime import datetime
+import functools
+import time
 from dotenv import load_dotenv
 
 
@@ -22,18 +24,16 @@ def print_phase_header(phase_num, title, width=60):
         PHASE 8: TRAITEMENT MUSIQUE (Sonic) [00:31:55]
         ============================================================
     """
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    print("\n" + "=" * width)
-    print(f"PHASE {phase_num}: {title} [{timestamp}]")
-    print("=" * width)
-
-def load_env():
-    """
-    Charge les variables d'environnement depuis .env
-
-    Returns:
-        dict: Configuration complète
-    """
+    timestamp = time.strftime("%H:%M:%S")
+    separator = "=" * width
+    # Un seul print : un seul passage par TeeLogger.write() pour tout l'en-tête
+    print(f"\n{separator}\nPHASE {phase_num}: {title} [{timestamp}]\n{separator}")
+    # Frontière de phase : vider les buffers (TeeLogger ne flush pas à chaque ligne)
+    sys.stdout.flush()
+
+@functools.lru_cache(maxsize=1)
+def _load_env_cached():
+    """Lecture unique du .env (mémoïsée pour toute la durée du processus)."""
     load_dotenv()
 
     return {
@@ -49,6 +49,19 @@ def load_env():
     }
 
 
+def load_env():
+    """
+    Charge les variables d'environnement depuis .env
+
+    Le fichier n'est lu qu'une fois par processus ; chaque appel retourne
+    une copie (les appelants peuvent la modifier sans effet de bord).
+
+    Returns:
+        dict: Configuration complète
+    """
+    return dict(_load_env_cached())
+
+
 def load_libraries(limit=None):
     """
     Charge la configuration des bibliothèques Plex.
@@ -90,8 +103,83 @@ def get_rclone_remote_name():
     Returns:
         str: Nom du remote (ex: 'mega-s4')
     """
-    load_dotenv()
-    return os.getenv('RCLONE_REMOTE', 'mega-s4')
+    return load_env()['RCLONE_REMOTE']
+
+
+# API de contrôle rclone (rc) : écoute locale uniquement, sans auth
+RCLONE_RC_ADDR = "127.0.0.1:5572"
+
+# Niveau gzip des archives de logs (diagnostic one-shot : vitesse > ratio)
+LOG_ARCHIVE_COMPRESSLEVEL = 1
+
+
+# === PROFILS RCLONE ===
+RCLONE_PROFILES = {
+    'lite': {
+        'cache_size': '5G',
+        'buffer_size': '64M',
+        'read_ahead': '128M',
+        'read_chunk': '32M',
+        'read_chunk_streams': '0',  # Séquentiel (MEGA rate-limiting)
+        'transfers': '2',     # Réduit pour MEGA (rate-limiting)
+        'checkers': '4',      # Réduit pour MEGA
+        'timeout': '60m',
+        'contimeout': '300s',
+        'low_level_retries': '10',
+        'retries': '10',
+        'retries_sleep': '30s',
+        'dir_cache': '24h',
+        'attr_timeout': '8760h',
+    },
+    'standard': {
+        'cache_size': '10G',  # Cache plus large
+        'buffer_size': '128M',
+        'read_ahead': '256M',
+        'read_chunk': '64M',
+        'read_chunk_streams': '0',  # Séquentiel (MEGA rate-limiting)
+        'transfers': '4',     # Réduit de 8 à 4 pour MEGA
+        'checkers': '8',      # Réduit de 16 à 8 pour MEGA
+        'timeout': '120m',    # Timeout plus long
+        'contimeout': '600s', # Connection timeout plus long
+        'low_level_retries': '20',
+        'retries': '20',
+        'retries_sleep': '60s',
+        'dir_cache': '72h',
+        'attr_timeout': '8760h',
+    },
+    'power': {
+        'cache_size': '20G',
+        'buffer_size': '256M',
+        'read_ahead': '512M',
+        'read_chunk': '128M',
+        'read_chunk_streams': '4',  # Lectures de chunks en parallèle
+        'transfers': '16',
+        'checkers': '32',
+        'timeout': '60m',
+        'contimeout': '300s',
+        'low_level_retries': '10',
+        'retries': '10',
+        'retries_sleep': '30s',
+        'dir_cache': '24h',
+        'attr_timeout': '8760h',
+    },
+    'superpower': {
+        'cache_size': '40G',  # Disque 100G : relectures Sonic servies depuis le cache
+        'buffer_size': '512M',
+        'read_ahead': '1G',
+        'read_chunk': '128M',
+        'read_chunk_streams': '8',  # Lectures de chunks en parallèle
+        'transfers': '32',
+        'checkers': '64',
+        'timeout': '60m',
+        'contimeout': '300s',
+        'low_level_retries': '10',
+        'retries': '10',
+        'retries_sleep': '30s',
+        'dir_cache': '24h',
+        'attr_timeout': '8760h',
+    }
+}
 
 
 def get_rclone_profile(profile='lite'):
@@ -110,66 +198,33 @@ def get_rclone_profile(profile='lite'):
     Returns:
         dict: Paramètres rclone optimisés
     """
-    profiles = {
-        'lite': {
-            'cache_size': '5G',
-            'buffer_size': '64M',
-            'read_chunk': '32M',
-            'transfers': '2',     # Réduit pour MEGA (rate-limiting)
-            'checkers': '4',      # Réduit pour MEGA
-            'timeout': '60m',
-            'contimeout': '300s',
-            'low_level_retries': '10',
-            'retries': '10',
-            'retries_sleep': '30s',
-            'dir_cache': '24h',
-            'attr_timeout': '8760h',
-        },
-        'standard': {
-            'cache_size': '10G',  # Cache plus large
-            'buffer_size': '128M',
-            'read_chunk': '64M',
-            'transfers': '4',     # Réduit de 8 à 4 pour MEGA
-            'checkers': '8',      # Réduit de 16 à 8 pour MEGA
-            'timeout': '120m',    # Timeout plus long
-            'contimeout': '600s', # Connection timeout plus long
-            'low_level_retries': '20',
-            'retries': '20',
-            'retries_sleep': '60s',
-            'dir_cache': '72h',
-            'attr_timeout': '8760h',
-        },
-        'power': {
-            'cache_size': '20G',
-            'buffer_size': '256M',
-            'read_chunk': '128M',
-            'transfers': '16',
-            'checkers': '32',
-            'timeout': '60m',
-            'contimeout': '300s',
-            'low_level_retries': '10',
-            'retries': '10',
-            'retries_sleep': '30s',
-            'dir_cache': '24h',
-            'attr_timeout': '8760h',
-        },
-        'superpower': {
-            'cache_size': '20G',
-            'buffer_size': '512M',
-            'read_chunk': '128M',
-            'transfers': '32',
-            'checkers': '64',
-            'timeout': '60m',
-            'contimeout': '300s',
-            'low_level_retries': '10',
-            'retries': '10',
-            'retries_sleep': '30s',
-            'dir_cache': '24h',
-            'attr_timeout': '8760h',
-        }
+    params = RCLONE_PROFILES.get(profile, RCLONE_PROFILES['lite'])
+    return params.copy()
+
+
+# === LIMITES DOCKER PAR PROFIL ===
+DOCKER_LIMITS = {
+    'lite': {
+        'memory': '4g',
+        'memory_swap': '6g',
+        'cpus': '2.0',
+    },
+    'standard': {
+        'memory': '8g',
+        'memory_swap': '10g',
+        'cpus': '4.0',
+    },
+    'power': {
+        'memory': '24g',
+        'memory_swap': '26g',
+        'cpus': '8.0',
+    },
+    'superpower': {
+        'memory': '48g',
+        'memory_swap': '50g',
+        'cpus': '16.0',
     }
-
-    return profiles.get(profile, profiles['lite'])
+}
 
 
 def get_docker_limits(profile='lite'):
@@ -182,27 +237,5 @@ def get_docker_limits(profile='lite'):
     Returns:
         dict: Limites Docker
     """
-    limits = {
-        'lite': {
-            'memory': '4g',
-            'memory_swap': '6g',
-            'cpus': '2.0',
-        },
-        'standard': {
-            'memory': '8g',
-            'memory_swap': '10g',
-            'cpus': '4.0',
-        },
-        'power': {
-            'memory': '24g',
-            'memory_swap': '26g',
-            'cpus': '8.0',
-        },
-        'superpower': {
-            'memory': '48g',
-            'memory_swap': '50g',
-            'cpus': '16.0',
-        }
-    }
-
-    return limits.get(profile, limits['lite'])
+    limits = DOCKER_LIMITS.get(profile, DOCKER_LIMITS['lite'])
+    return limits.copy()
@@ -4,10 +4,19 @@ delta_sync.py - Fonctions pour le workflow Delta Sync
 Permet d'injecter une DB Plex existante dans un nouveau conteneur
 """
 
+import copy
+import glob
+import hashlib
+import json
 import os
+import shlex
 import time
-from pathlib import Path
-from .executor import execute_command, docker_exec, transfer_file_to_remote
+from .executor import execute_command, upload_file_parallel, tar_compress_option, sqlite_read
+
+# Cache des stats DB : mémoire (processus) + sidecar JSON (entre les runs)
+STATS_CACHE_DIR = os.path.expanduser('~/.cache/cloud_bursting')
+STATS_CACHE_MAX_AGE = 30 * 86400  # Sidecars non réécrits depuis 30 jours : DB disparue
+_stats_cache = {}
 
 
 def inject_existing_db(ip, archive_path, plex_config_path, container='plex'):
@@ -18,7 +27,7 @@ def inject_existing_db(ip, archive_path, plex_config_path, container='plex'):
 
     Args:
         ip: 'localhost' ou IP remote
-        archive_path: Chemin vers l'archive .tar.gz (local si ip='localhost', sinon sera transférée)
+        archive_path: Chemin vers l'archive .tar.zst ou .tar.gz (local si ip='localhost', sinon sera transférée)
         plex_config_path: Chemin du volume config Plex (ex: /opt/plex_data/config ou ./tmp/plex-config)
         container: Nom du conteneur (pour vérifier qu'il n'est pas démarré)
 
@@ -47,7 +56,7 @@ def inject_existing_db(ip, archive_path, plex_config_path, container='plex'):
         # Transférer l'archive vers l'instance remote
         print(f"   📤 Transfert de l'archive vers {ip}...")
         archive_remote = f"/tmp/{os.path.basename(archive_path)}"
-        transfer_file_to_remote(archive_path, ip, archive_remote)
+        upload_file_parallel(archive_path, ip, archive_remote)
 
     # 3. Créer la structure de base si nécessaire
     pms_path = f"{plex_config_path}/Library/Application Support/Plex Media Server"
@@ -58,7 +67,7 @@ def inject_existing_db(ip, archive_path, plex_config_path, container='plex'):
 
     # L'archive contient "Plug-in Support/Databases" et optionnellement "Metadata"
     # On extrait directement dans le dossier Plex Media Server
-    extract_cmd = f"tar -xzf '{archive_remote}' -C '{pms_path}'"
+    extract_cmd = f"tar {tar_compress_option(archive_remote)} -xf '{archive_remote}' -C '{pms_path}'"
     result = execute_command(ip, extract_cmd, check=False, capture_output=True)
 
     if result.returncode != 0:
@@ -78,8 +87,7 @@ def inject_existing_db(ip, archive_path, plex_config_path, container='plex'):
     # échoue sur les tables FTS avec tokenizers personnalisés de Plex)
     print(f"   🔍 Vérification de l'intégrité de la DB...")
     # Requête simple sur une table basique pour valider que la DB est lisible
-    integrity_cmd = f"sqlite3 '{db_file}' 'SELECT COUNT(*) FROM library_sections;'"
-    integrity_result = execute_command(ip, integrity_cmd, capture_output=True, check=False)
+    integrity_result = sqlite_read(ip, db_file, "SELECT COUNT(*) FROM library_sections;")
 
     if integrity_result.returncode != 0:
         print(f"   ❌ Erreur sqlite3: {integrity_result.stderr}")
@@ -108,20 +116,111 @@ def inject_existing_db(ip, archive_path, plex_config_path, container='plex'):
     return True
 
 
-def get_library_stats_from_db(ip, plex_config_path):
+def _get_db_signature(ip, db_path):
+    """
+    Signature de la DB : "<clé DB>_<empreinte>".
+
+    La clé identifie la DB (ip, chemin) et permet de purger ses anciens sidecars ;
+    l'empreinte hashe mtime (nanosecondes) et taille de la DB et du WAL.
+    Le WAL est inclus car Plex y écrit avant checkpoint : la DB principale
+    peut rester inchangée alors que le contenu a évolué.
+
+    Returns:
+        str: Signature, ou None si la DB est introuvable
+    """
+    cmd = f"stat -c '%.9Y:%s' '{db_path}' '{db_path}-wal' 2>/dev/null"
+    result = execute_command(ip, cmd, capture_output=True, check=False)
+
+    fingerprint = result.stdout.strip().replace('\n', ',')
+    if not fingerprint:
+        return None
+
+    db_key = hashlib.sha1(f"{ip}:{db_path}".encode()).hexdigest()[:16]
+    fingerprint_hash = hashlib.sha1(fingerprint.encode()).hexdigest()
+    return f"{db_key}_{fingerprint_hash}"
+
+
+def _load_cached_stats(signature):
+    """Retourne les stats en cache (mémoire puis disque), ou None."""
+    if signature in _stats_cache:
+        return _stats_cache[signature]
+
+    cache_file = os.path.join(STATS_CACHE_DIR, f"stats_{signature}.json")
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cached.get('db_sig') != signature:
+        return None
+
+    _stats_cache[signature] = cached['stats']
+    return cached['stats']
+
+
+def _prune_cached_stats(signature):
+    """
+    Supprime les sidecars périmés.
+
+    - versions précédentes de la même DB (même clé, autre empreinte)
+    - sidecars non réécrits depuis STATS_CACHE_MAX_AGE (archive ou instance disparue)
+    """
+    db_key = signature.split('_', 1)[0]
+    current = os.path.join(STATS_CACHE_DIR, f"stats_{signature}.json")
+    cutoff = time.time() - STATS_CACHE_MAX_AGE
+
+    for cache_file in glob.glob(os.path.join(STATS_CACHE_DIR, "stats_*.json")):
+        if cache_file == current:
+            continue
+        try:
+            name = os.path.basename(cache_file)
+            if name.startswith(f"stats_{db_key}_") or os.path.getmtime(cache_file) < cutoff:
+                os.remove(cache_file)
+        except OSError:
+            pass  # Fichier déjà supprimé (run concurrent)
+
+
+def _save_cached_stats(signature, stats):
+    """Enregistre les stats en mémoire et dans le sidecar JSON."""
+    _stats_cache[signature] = stats
+
+    try:
+        os.makedirs(STATS_CACHE_DIR, exist_ok=True)
+        cache_file = os.path.join(STATS_CACHE_DIR, f"stats_{signature}.json")
+        with open(cache_file, 'w') as f:
+            json.dump({'db_sig': signature, 'stats': stats}, f)
+    except OSError:
+        return  # Cache optionnel : on ignore les erreurs d'écriture
+
+    _prune_cached_stats(signature)
+
+
+def get_library_stats_from_db(ip, plex_config_path, use_cache=True):
     """
     Lit les statistiques directement depuis la DB SQLite injectée.
     Utile pour vérifier l'état avant de démarrer Plex.
 
+    Les stats sont mises en cache par signature (mtime ns/taille de la DB et du WAL) :
+    un appel sur une DB inchangée ne coûte qu'un `stat` au lieu des requêtes COUNT.
+
     Args:
         ip: 'localhost' ou IP remote
         plex_config_path: Chemin du volume config Plex
+        use_cache: Réutiliser les stats si la DB n'a pas changé
 
     Returns:
         dict: Stats par type de média
     """
     db_path = f"{plex_config_path}/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
 
+    signature = _get_db_signature(ip, db_path) if use_cache else None
+    if signature:
+        cached = _load_cached_stats(signature)
+        if cached is not None:
+            print(f"\n📊 Stats DB inchangée (cache)")
+            return copy.deepcopy(cached)
+
     stats = {
         'artists': 0,
         'albums': 0,
@@ -134,58 +233,59 @@ def get_library_stats_from_db(ip, plex_config_path):
         'sections': []
     }
 
-    # Utiliser sqlite3 natif (pas besoin de Plex)
-    queries = {
-        'artists': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=8;",
-        'albums': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=9;",
-        'tracks': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=10;",
-        'tracks_with_sonic': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=10 AND extra_data LIKE '%ms:musicAnalysisVersion%';",
-        'movies': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=1;",
-        'shows': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=2;",
-        'episodes': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=4;",
-        'photos': "SELECT COUNT(*) FROM metadata_items WHERE metadata_type=13;",
-    }
+    # Utiliser sqlite3 natif (pas besoin de Plex), en lecture seule.
+    # Un seul appel : compteurs agrégés en un passage sur metadata_items,
+    # puis sections et chemins. Chaque ligne est préfixée par son type.
+    stats_sql = """SELECT 'counts',
+    COUNT(CASE WHEN metadata_type=8 THEN 1 END),
+    COUNT(CASE WHEN metadata_type=9 THEN 1 END),
+    COUNT(CASE WHEN metadata_type=10 THEN 1 END),
+    COUNT(CASE WHEN metadata_type=10 AND extra_data LIKE '%ms:musicAnalysisVersion%' THEN 1 END),
+    COUNT(CASE WHEN metadata_type=1 THEN 1 END),
+    COUNT(CASE WHEN metadata_type=2 THEN 1 END),
+    COUNT(CASE WHEN metadata_type=4 THEN 1 END),
+    COUNT(CASE WHEN metadata_type=13 THEN 1 END)
+FROM metadata_items WHERE metadata_type IN (1, 2, 4, 8, 9, 10, 13);
+SELECT 'section', id, name, section_type FROM library_sections;
+SELECT 'path', library_section_id, root_path FROM section_locations;"""
+    count_keys = ['artists', 'albums', 'tracks', 'tracks_with_sonic',
+                  'movies', 'shows', 'episodes', 'photos']
 
     print(f"\n📊 Lecture des stats depuis la DB injectée...")
 
-    for key, query in queries.items():
-        cmd = f"sqlite3 '{db_path}' \"{query}\""
-        result = execute_command(ip, cmd, capture_output=True, check=False)
-
-        if result.returncode == 0 and result.stdout.strip().isdigit():
-            stats[key] = int(result.stdout.strip())
+    result = sqlite_read(ip, db_path, stats_sql)
 
-    # Sections (bibliothèques)
-    sections_query = "SELECT id, name, section_type FROM library_sections;"
-    result = execute_command(ip, f"sqlite3 '{db_path}' \"{sections_query}\"", capture_output=True, check=False)
-
-    if result.returncode == 0 and result.stdout.strip():
+    # Pas de test sur returncode : une table absente ne doit pas masquer les autres lignes
+    section_paths = {}
+    if result.stdout.strip():
         for line in result.stdout.strip().split('\n'):
             parts = line.split('|')
-            if len(parts) >= 3:
+            kind = parts[0]
+
+            if kind == 'counts':
+                if len(parts) != len(count_keys) + 1:
+                    print(f"   ⚠️  Ligne de comptage inattendue ({len(parts) - 1} valeurs "
+                          f"au lieu de {len(count_keys)}): {line}")
+                    continue
+                for key, value in zip(count_keys, parts[1:]):
+                    if value.isdigit():
+                        stats[key] = int(value)
+
+            elif kind == 'section' and len(parts) >= 4:
                 stats['sections'].append({
-                    'id': parts[0],
-                    'name': parts[1],
-                    'type': parts[2]
+                    'id': parts[1],
+                    'name': parts[2],
+                    'type': parts[3]
                 })
 
-    # Chemins par section
-    paths_query = "SELECT library_section_id, root_path FROM section_locations;"
-    result = execute_command(ip, f"sqlite3 '{db_path}' \"{paths_query}\"", capture_output=True, check=False)
-
-    section_paths = {}
-    if result.returncode == 0 and result.stdout.strip():
-        for line in result.stdout.strip().split('\n'):
-            parts = line.split('|')
-            if len(parts) >= 2:
-                section_id = parts[0]
-                path = parts[1]
-                if section_id not in section_paths:
-                    section_paths[section_id] = []
-                section_paths[section_id].append(path)
+            elif kind == 'path' and len(parts) >= 3:
+                section_paths.setdefault(parts[1], []).append(parts[2])
 
     stats['section_paths'] = section_paths
 
+    if signature:
+        _save_cached_stats(signature, copy.deepcopy(stats))
+
     return stats
 
 
@@ -242,7 +342,7 @@ def verify_paths_match(ip, plex_config_path, mount_point):
 
     # Récupérer les chemins configurés dans la DB
     query = "SELECT DISTINCT root_path FROM section_locations;"
-    result = execute_command(ip, f"sqlite3 '{db_path}' \"{query}\"", capture_output=True, check=False)
+    result = sqlite_read(ip, db_path, query)
 
     db_paths = []
     if result.returncode == 0 and result.stdout.strip():
@@ -258,22 +358,30 @@ def verify_paths_match(ip, plex_config_path, mount_point):
     suggestions = []
     all_match = True
 
-    for db_path_item in db_paths:
-        # Vérifier si le chemin existe avec le montage actuel
-        # Par exemple, si DB a "/media/Music" et montage est "/mnt/s3-media"
-        # on doit vérifier que /mnt/s3-media/Music existe
-
-        # Extraire la partie relative (ex: "Music" de "/media/Music")
-        # Ceci est une heuristique - on suppose que /media/ est le préfixe standard
-        relative = db_path_item.replace('/media/', '').replace('/Media/', '')
-        check_path = f"{mount_point}/{relative}"
-
-        check_cmd = f"test -d '{check_path}' && echo 'exists' || echo 'missing'"
+    # Vérifier si chaque chemin existe avec le montage actuel
+    # Par exemple, si DB a "/media/Music" et montage est "/mnt/s3-media"
+    # on doit vérifier que /mnt/s3-media/Music existe
+
+    # Extraire la partie relative (ex: "Music" de "/media/Music")
+    # Ceci est une heuristique - on suppose que /media/ est le préfixe standard
+    check_paths = [
+        f"{mount_point}/{db_path_item.replace('/media/', '').replace('/Media/', '')}"
+        for db_path_item in db_paths
+    ]
+
+    if check_paths:
+        # Un seul appel pour tous les chemins : une ligne exists/missing par chemin
+        check_cmd = "\n".join(
+            f"test -d {shlex.quote(check_path)} && echo exists || echo missing"
+            for check_path in check_paths
+        )
         check_result = execute_command(ip, check_cmd, capture_output=True, check=False)
+        statuses = (check_result.stdout or '').split()
 
-        if 'missing' in check_result.stdout:
-            all_match = False
-            suggestions.append(f"Chemin manquant: {check_path}")
+        for index, check_path in enumerate(check_paths):
+            if index >= len(statuses) or statuses[index] != 'exists':
+                all_match = False
+                suggestions.append(f"Chemin manquant: {check_path}")
 
     return {
         'match': all_match,
@@ -293,8 +401,6 @@ def load_path_mappings(mappings_file=None):
     Returns:
         dict: {'file': str|None, 'mappings': dict} - fichier trouvé et mappings
     """
-    import json
-
     result = {'file': None, 'mappings': {}}
 
     # Auto-détection si non spécifié
@@ -419,7 +525,7 @@ def remap_library_paths(ip, plex_config_path, mount_point, mappings, backup_dir=
         ip: 'localhost' ou IP remote
         plex_config_path: Chemin du volume config Plex
         mount_point: Point de montage S3 actuel (pour vérifier les nouveaux chemins)
-        mappings: dict {ancien_chemin: nouveau_chemin}
+        mappings: dict {ancien_chemin: nouveau_chemin}, appliqués dans l'ordre
         backup_dir: Répertoire pour le backup (défaut: ./tmp)
 
     Returns:
@@ -472,22 +578,32 @@ def remap_library_paths(ip, plex_config_path, mount_point, mappings, backup_dir=
         result['errors'].append(error_msg)
         return result
 
-    # 2. Appliquer les remappings
+    # 2. Sections existantes (une seule requête pour tous les mappings)
+    sections_query = "SELECT root_path, COUNT(*) FROM section_locations GROUP BY root_path;"
+    sections_result = execute_command(ip, f"sqlite3 '{db_path}' \"{sections_query}\"", capture_output=True, check=False)
+
+    section_counts = {}
+    if sections_result.returncode == 0 and sections_result.stdout.strip():
+        for line in sections_result.stdout.strip().split('\n'):
+            root_path, _, count = line.rpartition('|')
+            if count.isdigit():
+                section_counts[root_path] = int(count)
+
+    # 3. Appliquer les remappings dans l'ordre du fichier : les mappings chaînés
+    # (A → B puis B → C) s'appliquent en séquence. /Media/Music-Various n'est pas
+    # capturé par /Media/Music (la correspondance exige un '/' après le préfixe)
     for old_path, new_path in mappings.items():
         print(f"\n   📂 {old_path} → {new_path}")
 
-        # 2a. Vérifier si l'ancien chemin est dans section_locations
-        check_query = f"SELECT COUNT(*) FROM section_locations WHERE root_path = '{old_path}';"
-        check_result = execute_command(ip, f"sqlite3 '{db_path}' \"{check_query}\"", capture_output=True, check=False)
-
-        sections_count = int(check_result.stdout.strip()) if check_result.returncode == 0 and check_result.stdout.strip().isdigit() else 0
+        # 3a. Vérifier si l'ancien chemin est dans section_locations
+        sections_count = section_counts.get(old_path, 0)
 
         if sections_count == 0:
             print(f"      ⏭️  Aucune section avec ce chemin")
             result['skipped'] += 1
             continue
 
-        # 2b. Vérifier que le nouveau chemin existe sur le montage
+        # 3b. Vérifier que le nouveau chemin existe sur le montage
         relative = new_path.replace('/media/', '').replace('/Media/', '')
         check_path = f"{mount_point}/{relative}"
 
@@ -500,38 +616,45 @@ def remap_library_paths(ip, plex_config_path, mount_point, mappings, backup_dir=
             result['errors'].append(f"{old_path}: {error_msg}")
             continue
 
-        # 2c. Compter les fichiers à remapper dans media_parts
-        count_query = f"SELECT COUNT(*) FROM media_parts WHERE file LIKE '{old_path}%';"
-        count_result = execute_command(ip, f"sqlite3 '{db_path}' \"{count_query}\"", capture_output=True, check=False)
-        files_count = int(count_result.stdout.strip()) if count_result.returncode == 0 and count_result.stdout.strip().isdigit() else 0
-
-        # 2d. Remapper section_locations
-        update_sections = f"UPDATE section_locations SET root_path = '{new_path}' WHERE root_path = '{old_path}';"
-        sections_result = execute_command(ip, f"sqlite3 '{db_path}' \"{update_sections}\"", capture_output=True, check=False)
-
-        if sections_result.returncode != 0:
-            error_msg = f"Erreur SQL section_locations: {sections_result.stderr}"
+        # 3c. section_locations + media_parts en une transaction (un seul appel sqlite3)
+        # Remplacement du préfixe uniquement (REPLACE() toucherait aussi le milieu du chemin)
+        old_sql = old_path.replace("'", "''")
+        new_sql = new_path.replace("'", "''")
+        old_prefix = old_sql.rstrip('/')
+        new_prefix = new_sql.rstrip('/')
+        prefix_len = len(old_path.rstrip('/'))
+        update_sql = f"""PRAGMA synchronous=NORMAL;
+BEGIN;
+UPDATE section_locations SET root_path = '{new_sql}' WHERE root_path = '{old_sql}';
+SELECT changes();
+UPDATE media_parts SET file = '{new_prefix}' || substr(file, {prefix_len + 1})
+  WHERE substr(file, 1, {prefix_len + 1}) = '{old_prefix}/';
+SELECT changes();
+COMMIT;"""
+        # -bail : arrêt à la première erreur, COMMIT jamais atteint → la transaction
+        # ouverte est annulée à la fermeture (pas de remapping à moitié appliqué)
+        update_cmd = f"sqlite3 -bail '{db_path}' <<'SQL'\n{update_sql}\nSQL"
+        update_result = execute_command(ip, update_cmd, capture_output=True, check=False)
+
+        changes = update_result.stdout.split()
+        if update_result.returncode != 0 or len(changes) < 2 or not all(c.isdigit() for c in changes[:2]):
+            error_msg = f"Erreur SQL remapping: {update_result.stderr.strip()}"
             print(f"      ❌ {error_msg}")
             result['errors'].append(f"{old_path}: {error_msg}")
             continue
 
-        print(f"      ✅ section_locations: {sections_count} section(s)")
-        result['sections_remapped'] += sections_count
+        sections_changed, files_changed = int(changes[0]), int(changes[1])
 
-        # 2e. Remapper media_parts (REPLACE pour les chemins de fichiers)
-        if files_count > 0:
-            update_files = f"UPDATE media_parts SET file = REPLACE(file, '{old_path}', '{new_path}') WHERE file LIKE '{old_path}%';"
-            files_result = execute_command(ip, f"sqlite3 '{db_path}' \"{update_files}\"", capture_output=True, check=False)
+        # Comptes à jour pour les mappings suivants (changes() = lignes réellement déplacées)
+        section_counts.pop(old_path, None)
+        section_counts[new_path] = section_counts.get(new_path, 0) + sections_changed
 
-            if files_result.returncode != 0:
-                error_msg = f"Erreur SQL media_parts: {files_result.stderr}"
-                print(f"      ⚠️  {error_msg}")
-                result['errors'].append(f"{old_path}: {error_msg}")
-            else:
-                print(f"      ✅ media_parts: {files_count} fichier(s)")
-                result['files_remapped'] += files_count
+        print(f"      ✅ section_locations: {sections_changed} section(s)")
+        print(f"      ✅ media_parts: {files_changed} fichier(s)")
+        result['sections_remapped'] += sections_changed
+        result['files_remapped'] += files_changed
 
-    # 3. Résumé
+    # 4. Résumé
     print(f"\n   📊 Remapping terminé:")
     print(f"      Sections: {result['sections_remapped']}")
     print(f"      Fichiers: {result['files_remapped']}")
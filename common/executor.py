@@ -2,10 +2,202 @@
 """
 Abstraction d'exécution : local vs remote
 """
+import atexit
+import random
+import selectors
 import subprocess
 import shutil
 import os
+import shlex
+import sqlite3
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+# ============================================================================
+# CONNEXION SSH PERSISTANTE (multiplexage OpenSSH)
+# ============================================================================
+
+# Socket de contrôle partagé par toutes les commandes vers un même hôte.
+# %C = hash (user, host, port) : chemin court, compatible limite 108 chars.
+SSH_CONTROL_PATH = os.path.join(tempfile.gettempdir(), "cb-ssh-%C")
+SSH_CONTROL_PERSIST = 600  # secondes d'inactivité avant fermeture du maître
+SSH_MASTER_RETRY_COOLDOWN = 60  # secondes sans nouvelle tentative après un échec du maître
+
+# Options communes ssh/scp (sans multiplexage) ; tuples : partagés, jamais mutés
+SSH_BASE_OPTIONS = (
+    "-o", "StrictHostKeyChecking=no",
+    "-o", "UserKnownHostsFile=/dev/null",
+    "-o", "ServerAliveInterval=30",
+    "-o", "ServerAliveCountMax=5",
+)
+
+SSH_OPTIONS = (*SSH_BASE_OPTIONS, "-o", f"ControlPath={SSH_CONTROL_PATH}")
+
+# Options des commandes clientes : réutilisent le maître, ne l'ouvrent jamais
+SSH_CLIENT_OPTIONS = (*SSH_OPTIONS, "-o", "ControlMaster=no")
+
+# Hôtes avec une connexion maître ouverte → dernier usage (time.monotonic)
+_ssh_masters = {}
+# Hôtes dont l'ouverture du maître a échoué → date de l'échec (time.monotonic)
+_ssh_master_failures = {}
+# Threads concurrents (MountHealthMonitor, --parallel-sections) : un seul maître par hôte
+_ssh_masters_lock = threading.Lock()
+
+
+def _ssh_master_alive(ip):
+    """Vérifie (ssh -O check, local, sans réseau) que le maître répond encore."""
+    result = subprocess.run(
+        ["ssh", *SSH_OPTIONS, "-O", "check", f"root@{ip}"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=False,
+        timeout=10
+    )
+    return result.returncode == 0
+
+
+def _ensure_ssh_master(ip, force=False):
+    """
+    Ouvre une connexion SSH maître vers l'hôte si aucune n'est active.
+
+    Les appels suivants (ssh/scp avec ControlMaster=no) réutilisent le socket
+    de contrôle : un seul handshake TCP+auth pour toute la durée du run.
+    Le maître est lancé avec stdio sur /dev/null pour ne pas bloquer les
+    subprocess.run(capture_output=True) qui attendent la fermeture des pipes.
+    Après une inactivité proche de ControlPersist (ex: saisie du PLEX_CLAIM),
+    le maître a pu expirer : il est vérifié puis rouvert si besoin, sinon
+    toutes les commandes suivantes retomberaient sur des connexions directes.
+
+    Après un échec d'ouverture, aucune nouvelle tentative pendant
+    SSH_MASTER_RETRY_COOLDOWN (sauf force=True) : les commandes passent en
+    connexion directe (ControlMaster=no sans socket) au lieu de payer jusqu'à
+    30s sous le verrou global à chaque appel.
+    """
+    with _ssh_masters_lock:
+        now = time.monotonic()
+        last_used = _ssh_masters.get(ip)
+        if last_used is not None:
+            if now - last_used < SSH_CONTROL_PERSIST - 60 or _ssh_master_alive(ip):
+                _ssh_masters[ip] = now
+                return
+            del _ssh_masters[ip]
+
+        failed_at = _ssh_master_failures.get(ip)
+        if not force and failed_at is not None and now - failed_at < SSH_MASTER_RETRY_COOLDOWN:
+            return
+
+        _open_ssh_master(ip)
+
+
+def _open_ssh_master(ip):
+    """Lance le maître en arrière-plan (-N -f) et enregistre le succès ou l'échec."""
+    master_cmd = ["ssh", *SSH_OPTIONS,
+                  "-o", "ControlMaster=yes",
+                  "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
+                  "-o", "ConnectTimeout=10",
+                  "-N", "-f", f"root@{ip}"]
+    try:
+        result = subprocess.run(
+            master_cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+            timeout=30
+        )
+    except subprocess.TimeoutExpired:
+        _ssh_master_failures[ip] = time.monotonic()
+        return
+
+    if result.returncode == 0:
+        _ssh_masters[ip] = time.monotonic()
+        _ssh_master_failures.pop(ip, None)
+    else:
+        _ssh_master_failures[ip] = time.monotonic()
+
+
+def _ssh_options(ip):
+    """Options ssh/scp réutilisant la connexion maître de l'hôte."""
+    _ensure_ssh_master(ip)
+    return SSH_CLIENT_OPTIONS
+
+
+def open_ssh_connection(ip):
+    """
+    Ouvre la connexion SSH maître vers l'hôte si elle n'existe pas encore.
+
+    Sert aussi de sonde de disponibilité : si elle réussit, la connexion
+    reste ouverte et sert aux commandes suivantes. Sonde explicite : ignore
+    le délai de nouvelle tentative après un échec.
+
+    Returns:
+        bool: True si la connexion maître est active
+    """
+    _ensure_ssh_master(ip, force=True)
+    return ip in _ssh_masters
+
+
+def close_ssh_connections():
+    """Ferme les connexions SSH maîtres ouvertes (appelé à la sortie)."""
+    for ip in list(_ssh_masters):
+        subprocess.run(
+            ["ssh", *SSH_OPTIONS, "-O", "exit", f"root@{ip}"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+            timeout=10
+        )
+        _ssh_masters.pop(ip, None)
+
+
+atexit.register(close_ssh_connections)
+
+# ============================================================================
+# POLLING (backoff exponentiel + jitter)
+# ============================================================================
+
+class PollBackoff:
+    """
+    Intervalle de polling exponentiel plafonné, avec jitter.
+
+    sleep() attend l'intervalle courant (±jitter) puis l'augmente
+    (× factor, plafonné à max_interval). reset() revient à l'intervalle
+    initial : à appeler quand l'état observé vient de changer.
+
+    Usage:
+        backoff = PollBackoff(initial=2, max_interval=30)
+        while not ready():
+            backoff.sleep()
+    """
+
+    def __init__(self, initial=1.0, max_interval=30.0, factor=1.5, jitter=0.1):
+        self.initial = initial
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.interval = initial
+
+    def reset(self):
+        """Revient à l'intervalle initial (re-poll rapide)."""
+        self.interval = self.initial
+
+    def sleep(self, wait=time.sleep):
+        """
+        Attend l'intervalle courant puis l'augmente. Retourne le délai attendu.
+
+        wait: fonction d'attente prenant le délai en secondes (ex:
+        threading.Event.wait pour une attente interruptible).
+        """
+        delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        wait(delay)
+        self.interval = min(self.interval * self.factor, self.max_interval)
+        return delay
+
 
 # ============================================================================
 # FONCTIONS PRIVÉES (implémentations spécifiques)
@@ -25,10 +217,7 @@ def _execute_remote(ip, command, check=True, capture_output=False, text=True, ti
     """Exécution distante via SSH"""
     ssh_cmd = [
         "ssh",
-        "-o", "StrictHostKeyChecking=no",
-        "-o", "UserKnownHostsFile=/dev/null",
-        "-o", "ServerAliveInterval=30",
-        "-o", "ServerAliveCountMax=5",
+        *_ssh_options(ip),
         f"root@{ip}",
         command
     ]
@@ -69,13 +258,77 @@ def execute_command(ip, command, check=True, capture_output=False, text=True, ve
         return _execute_remote(ip, command, check, capture_output, text, timeout)
 
 
+def popen_command(ip, command):
+    """
+    Lance une commande longue (ex: tail -F) et retourne le processus en streaming.
+
+    Remote : passe par la connexion SSH maître (pas de nouveau handshake).
+
+    Args:
+        ip: 'localhost' pour local, sinon IP de l'instance remote
+        command: Commande shell à exécuter
+
+    Returns:
+        subprocess.Popen: stdout en mode texte, lu ligne par ligne par l'appelant
+    """
+    if ip == 'localhost':
+        cmd = ["bash", "-c", command]
+    else:
+        cmd = ["ssh", *_ssh_options(ip), f"root@{ip}", command]
+
+    return subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        bufsize=1
+    )
+
+
+def iter_lines_with_deadline(proc, timeout):
+    """
+    Lit stdout d'un processus popen_command() ligne par ligne, avec délai maximal.
+
+    Lecture sur le descripteur via selectors (jamais de readline() bloquant) :
+    un flux distant figé alors que SSH reste vivant est détecté.
+
+    Args:
+        proc: subprocess.Popen (stdout en PIPE)
+        timeout: Silence maximal en secondes avant de rendre None
+
+    Yields:
+        str: Ligne lue, '' à la fin du flux (puis arrêt), None si aucun
+             octet reçu pendant timeout secondes
+    """
+    fd = proc.stdout.fileno()
+    buffer = b""
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        while True:
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                yield line.decode(errors='replace') + "\n"
+            if not selector.select(timeout):
+                yield None
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                if buffer:
+                    yield buffer.decode(errors='replace')
+                yield ""
+                return
+            buffer += chunk
+
+
 def execute_script(ip, script_content, remote_path='/tmp/exec_script.sh'):
     """
     Exécute un script bash complexe de manière robuste.
 
     Stratégie :
     - Local : écrit dans /tmp, exécute, nettoie
-    - Remote : écrit localement, copie via SCP, exécute via SSH, nettoie
+    - Remote : un seul appel SSH : le script arrive sur stdin, est écrit dans
+      remote_path, exécuté puis supprimé (pas de scp ni d'appel de nettoyage)
 
     Bénéfice : Évite les problèmes d'échappement de quotes/pipes en SSH
 
@@ -110,24 +363,16 @@ def execute_script(ip, script_content, remote_path='/tmp/exec_script.sh'):
         # Exécution remote
         print(f"📜 [REMOTE @ {ip}] Exécution d'un script ({len(script_content)} bytes)")
 
-        # 1. Écrire le script localement
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False) as f:
-            f.write(script_content)
-            local_script_path = f.name
-
-        try:
-            # 2. Copier sur la machine distante
-            transfer_file_to_remote(local_script_path, ip, remote_path)
-
-            # 3. Exécuter
-            result = execute_command(ip, f"bash {remote_path}")
-
-            # 4. Nettoyer le script distant
-            execute_command(ip, f"rm -f {remote_path}", check=False)
-
-            return result
-        finally:
-            os.unlink(local_script_path)
+        # cat consomme tout stdin avant l'exécution : le script lui-même
+        # voit un stdin vide (pas de lecture accidentelle de son propre code)
+        wrapper = (f"cat > {remote_path} && bash {remote_path} < /dev/null; "
+                   f"rc=$?; rm -f {remote_path}; exit $rc")
+        return subprocess.run(
+            ["ssh", *_ssh_options(ip), f"root@{ip}", wrapper],
+            input=script_content,
+            check=True,
+            text=True
+        )
 
 
 def docker_exec(ip, container, command, check=True, capture_output=False):
@@ -169,10 +414,7 @@ def transfer_file_to_remote(local_path, ip, remote_path):
 
     scp_cmd = [
         "scp",
-        "-o", "StrictHostKeyChecking=no",
-        "-o", "UserKnownHostsFile=/dev/null",
-        "-o", "ServerAliveInterval=30",
-        "-o", "ServerAliveCountMax=5",
+        *_ssh_options(ip),
         local_path,
         f"root@{ip}:{remote_path}"
     ]
@@ -211,16 +453,216 @@ def download_file_from_remote(ip, remote_path, local_path):
     print(f"📥 [SCP] root@{ip}:{remote_path} → {local_path}")
     scp_cmd = [
         "scp",
-        "-o", "StrictHostKeyChecking=no",
-        "-o", "UserKnownHostsFile=/dev/null",
-        "-o", "ServerAliveInterval=30",
-        "-o", "ServerAliveCountMax=5",
+        *_ssh_options(ip),
         f"root@{ip}:{remote_path}",
         local_path
     ]
     subprocess.run(scp_cmd, check=True)
 
 
+def _download_range(ip, remote_path, local_path, offset, length):
+    """
+    Télécharge une plage d'octets d'un fichier distant dans le fichier local.
+
+    Connexion SSH dédiée (ControlPath=none) : chaque plage a son propre flux TCP,
+    contrairement au multiplexage qui partage une seule connexion.
+
+    Returns:
+        int: Nombre d'octets écrits
+    """
+    dd_cmd = (f"dd if='{remote_path}' bs=4M iflag=skip_bytes,count_bytes "
+              f"skip={offset} count={length} status=none")
+    ssh_cmd = ["ssh", *SSH_BASE_OPTIONS, "-o", "ControlPath=none", f"root@{ip}", dd_cmd]
+
+    written = 0
+    with open(local_path, 'r+b') as f:
+        f.seek(offset)
+        proc = subprocess.Popen(ssh_cmd, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL)
+        while True:
+            chunk = proc.stdout.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+            written += len(chunk)
+        proc.wait()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ssh/dd code {proc.returncode} (offset {offset})")
+    return written
+
+
+def download_file_parallel(ip, remote_path, local_path, streams=8, min_size_mb=256):
+    """
+    Télécharge un gros fichier distant en N flux SSH parallèles (plages d'octets).
+
+    Un seul flux scp ne sature pas un lien WAN à forte latence (BDP par connexion) :
+    N connexions TCP indépendantes multiplient le débit utile.
+    Retombe sur download_file_from_remote() en local, pour les petits fichiers,
+    ou si un flux échoue.
+
+    Args:
+        ip: IP source ('localhost' → copie simple)
+        remote_path: Chemin du fichier sur la machine distante
+        local_path: Chemin de destination local
+        streams: Nombre de flux parallèles
+        min_size_mb: Taille minimale (Mo) pour activer le multi-flux
+    """
+    if ip == 'localhost':
+        return download_file_from_remote(ip, remote_path, local_path)
+
+    result = execute_command(ip, f"stat -c %s '{remote_path}'", capture_output=True, check=False)
+    size_str = result.stdout.strip() if result.stdout else ''
+    if result.returncode != 0 or not size_str.isdigit():
+        return download_file_from_remote(ip, remote_path, local_path)
+
+    size = int(size_str)
+    if size < min_size_mb * 1024 * 1024:
+        return download_file_from_remote(ip, remote_path, local_path)
+
+    part_size = -(-size // streams)  # Division arrondie au supérieur
+    ranges = [(offset, min(part_size, size - offset)) for offset in range(0, size, part_size)]
+
+    print(f"📥 [SSH x{len(ranges)}] root@{ip}:{remote_path} → {local_path} ({size / (1024 * 1024):.0f} MB)")
+
+    # Pré-allocation : chaque flux écrit à son offset
+    with open(local_path, 'wb') as f:
+        f.truncate(size)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [pool.submit(_download_range, ip, remote_path, local_path, offset, length)
+                       for offset, length in ranges]
+            total = sum(future.result() for future in futures)
+        if total != size:
+            raise RuntimeError(f"{total}/{size} octets reçus")
+    except Exception as e:
+        print(f"   ⚠️  Téléchargement parallèle échoué ({e}), fallback scp")
+        return download_file_from_remote(ip, remote_path, local_path)
+
+    print(f"   ✅ Téléchargement terminé")
+
+
+def _upload_range(local_path, ip, remote_path, offset, length):
+    """
+    Envoie une plage d'octets du fichier local à son offset dans le fichier distant.
+
+    Connexion SSH dédiée (ControlPath=none), comme _download_range().
+
+    Returns:
+        int: Nombre d'octets envoyés
+    """
+    dd_cmd = (f"dd of='{remote_path}' bs=4M iflag=fullblock oflag=seek_bytes "
+              f"seek={offset} conv=notrunc status=none")
+    ssh_cmd = ["ssh", *SSH_BASE_OPTIONS, "-o", "ControlPath=none", f"root@{ip}", dd_cmd]
+
+    sent = 0
+    with open(local_path, 'rb') as f:
+        f.seek(offset)
+        proc = subprocess.Popen(ssh_cmd, stdin=subprocess.PIPE)
+        try:
+            while sent < length:
+                chunk = f.read(min(1024 * 1024, length - sent))
+                if not chunk:
+                    break
+                proc.stdin.write(chunk)
+                sent += len(chunk)
+        finally:
+            proc.stdin.close()
+            proc.wait()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ssh/dd code {proc.returncode} (offset {offset})")
+    return sent
+
+
+def upload_file_parallel(local_path, ip, remote_path, streams=8, min_size_mb=256):
+    """
+    Envoie un gros fichier local en N flux SSH parallèles (plages d'octets).
+
+    Symétrique de download_file_parallel() : N connexions TCP indépendantes
+    au lieu d'un seul flux scp limité par le BDP sur un lien WAN.
+    Retombe sur transfer_file_to_remote() en local, pour les petits fichiers,
+    ou si un flux échoue.
+
+    Args:
+        local_path: Chemin local du fichier
+        ip: IP de destination ('localhost' → rien à faire)
+        remote_path: Chemin sur la machine distante
+        streams: Nombre de flux parallèles
+        min_size_mb: Taille minimale (Mo) pour activer le multi-flux
+    """
+    size = os.path.getsize(local_path)
+    if ip == 'localhost' or size < min_size_mb * 1024 * 1024:
+        return transfer_file_to_remote(local_path, ip, remote_path)
+
+    part_size = -(-size // streams)  # Division arrondie au supérieur
+    ranges = [(offset, min(part_size, size - offset)) for offset in range(0, size, part_size)]
+
+    print(f"📤 [SSH x{len(ranges)}] {local_path} → root@{ip}:{remote_path} ({size / (1024 * 1024):.0f} MB)")
+
+    # Pré-allocation distante : chaque flux écrit à son offset
+    remote_dir = os.path.dirname(remote_path)
+    prepare_cmd = f"truncate -s {size} '{remote_path}'"
+    if remote_dir:
+        prepare_cmd = f"mkdir -p '{remote_dir}' && {prepare_cmd}"
+
+    try:
+        execute_command(ip, prepare_cmd)
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [pool.submit(_upload_range, local_path, ip, remote_path, offset, length)
+                       for offset, length in ranges]
+            total = sum(future.result() for future in futures)
+        if total != size:
+            raise RuntimeError(f"{total}/{size} octets envoyés")
+    except Exception as e:
+        print(f"   ⚠️  Envoi parallèle échoué ({e}), fallback scp")
+        return transfer_file_to_remote(local_path, ip, remote_path)
+
+    print(f"   ✅ Envoi terminé")
+
+
+def stream_tar_download(ip, base_path, members, local_path):
+    """
+    Crée une archive distante en la streamant directement dans un fichier local.
+
+    `tar | zstd` tourne sur la machine distante et la sortie est écrite au fil
+    de l'eau via la connexion SSH : la compression chevauche le transfert et
+    aucune archive temporaire n'est écrite sur le disque de l'instance.
+    Un seul flux TCP : sur un lien WAN à forte latence, l'export classique
+    + download_file_parallel() peut rester plus rapide.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        base_path: Répertoire de base de l'archive (tar -C)
+        members: Chemins relatifs à base_path (absents ignorés)
+        local_path: Archive locale à créer (.tar.zst ou .tar.gz)
+
+    Returns:
+        bool: True si l'archive a été reçue complètement
+    """
+    members_str = " ".join(shlex.quote(member) for member in members)
+    tar_cmd = (f"tar {tar_compress_option(local_path)} -cf - --ignore-failed-read "
+               f"-C {shlex.quote(base_path)} {members_str}")
+
+    if ip == 'localhost':
+        cmd = ["bash", "-c", tar_cmd]
+    else:
+        cmd = ["ssh", *_ssh_options(ip), f"root@{ip}", tar_cmd]
+
+    print(f"📥 [STREAM] {ip}:{base_path} → {local_path}")
+    with open(local_path, 'wb') as f:
+        result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=False, check=False)
+
+    # tar : 1 = fichiers modifiés pendant la lecture (archive exploitable)
+    if result.returncode > 1:
+        print(f"   ❌ Stream échoué (code {result.returncode}): {result.stderr.decode(errors='replace').strip()[:300]}")
+        return False
+
+    size_mb = os.path.getsize(local_path) / (1024 * 1024)
+    print(f"   ✅ Archive reçue ({size_mb:.1f} MB)")
+    return True
+
+
 # ============================================================================
 # GESTION DE FICHIERS D'ÉTAT
 # ============================================================================
@@ -245,19 +687,135 @@ def write_state_file(path, content):
     """
     Écrit un fichier d'état simple (texte)
 
+    Écriture atomique (fichier temporaire + fsync + os.replace) : un crash
+    ne laisse jamais un .current_instance_id tronqué, donc une instance facturée
+    que destroy_instance() ne saurait plus retrouver.
+
     Args:
         path: Chemin du fichier à écrire
         content: Contenu à écrire (sera converti en string)
     """
-    with open(path, "w") as f:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
         f.write(str(content))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Archives produites par le workflow : zstd multi-thread (3-5x plus rapide que gzip)
+ARCHIVE_EXT = ".tar.zst"
+
+
+def tar_compress_option(archive_path):
+    """
+    Option de compression tar selon l'extension de l'archive.
+
+    zstd : -T0 utilise tous les cœurs (tar ajoute -d à l'extraction),
+    --long=27 trouve les répétitions sur 128 Mo (DB Plex). Fenêtre = limite
+    par défaut du décompresseur : un simple zstd -d suffit à l'extraction.
+    gzip : conservé pour les archives .tar.gz existantes.
+
+    Args:
+        archive_path: Chemin de l'archive (.tar.zst ou .tar.gz)
+
+    Returns:
+        str: Option à insérer dans la commande tar
+    """
+    if archive_path.endswith('.zst'):
+        return "-I 'zstd -T0 -3 --long=27'"
+    return "-z"
+
+
+# Lectures sur la DB Plex (456k+ pistes) : pages résolues via mmap plutôt que
+# read(), cache de pages plus large, tris/agrégats temporaires en mémoire.
+# mmap_size est une réservation d'espace virtuel, pas une allocation RAM.
+SQLITE_READ_PRAGMAS = (
+    "PRAGMA mmap_size=34359738368;",
+    "PRAGMA cache_size=-262144;",
+    "PRAGMA temp_store=MEMORY;",
+)
+
+
+def sqlite_read_command(db_path, sql):
+    """
+    Construit une commande sqlite3 en lecture seule avec les PRAGMAs de lecture.
+
+    La requête passe par un heredoc (pas d'échappement shell) ; la sortie des
+    PRAGMAs (mmap_size renvoie sa valeur) est redirigée vers /dev/null.
+
+    Args:
+        db_path: Chemin de la DB SQLite
+        sql: Requête(s) SQL
+
+    Returns:
+        str: Commande à passer à execute_command()
+    """
+    pragmas = "\n".join(SQLITE_READ_PRAGMAS)
+    return (f"sqlite3 -readonly '{db_path}' <<'SQL'\n"
+            f".output /dev/null\n{pragmas}\n.output\n"
+            f"{sql}\nSQL")
+
+
+def sqlite_read(ip, db_path, sql):
+    """
+    Exécute des requêtes SQLite en lecture seule, sortie au format du CLI sqlite3.
+
+    Local : module sqlite3 en processus (ni shell ni fork/exec du binaire) ;
+    remote : sqlite_read_command() via SSH. Comme le CLI sans -bail, une
+    requête en erreur n'empêche pas les suivantes (returncode 1, stderr).
+
+    Args:
+        ip: 'localhost' ou IP remote
+        db_path: Chemin de la DB SQLite
+        sql: Requête(s) SQL séparées par ';'
+
+    Returns:
+        subprocess.CompletedProcess: stdout = une ligne "col|col|..." par rangée
+    """
+    if ip != 'localhost':
+        return execute_command(ip, sqlite_read_command(db_path, sql), capture_output=True, check=False)
+
+    args = ["sqlite3", "-readonly", db_path]
+    try:
+        conn = sqlite3.connect(f"file:{quote(db_path)}?mode=ro", uri=True)
+    except sqlite3.Error as e:
+        return subprocess.CompletedProcess(args, 1, "", f"Error: {e}\n")
+
+    rows = []
+    errors = []
+    try:
+        for pragma in SQLITE_READ_PRAGMAS:
+            conn.execute(pragma).fetchall()
+
+        # Découpage sur ';' hors chaînes : complete_statement() valide chaque requête
+        statement = ""
+        for chunk in sql.split(';'):
+            statement += chunk + ';'
+            if not sqlite3.complete_statement(statement):
+                continue
+            if statement.strip(' \n;'):
+                try:
+                    for row in conn.execute(statement):
+                        rows.append('|'.join('' if value is None else str(value) for value in row))
+                except sqlite3.Error as e:
+                    errors.append(f"Error: {e}")
+            statement = ""
+    finally:
+        conn.close()
+
+    stdout = "".join(f"{row}\n" for row in rows)
+    stderr = "".join(f"{error}\n" for error in errors)
+    return subprocess.CompletedProcess(args, 1 if errors else 0, stdout, stderr)
 
 
 def verify_archive(archive_path):
-    """Vérifie l'intégrité d'une archive tar.gz."""
+    """Vérifie l'intégrité d'une archive tar (.tar.zst ou .tar.gz)."""
+    # argv direct : pas de /bin/sh intermédiaire ni de quoting du chemin
+    tar_cmd = ["tar", *shlex.split(tar_compress_option(archive_path)), "-tf", archive_path]
     result = subprocess.run(
-        ["tar", "-tzf", archive_path],
-        capture_output=True, check=False, timeout=120
+        tar_cmd,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False, timeout=120
     )
     if result.returncode != 0:
         raise RuntimeError(f"Archive corrompue : {archive_path}")
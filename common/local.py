@@ -14,9 +14,8 @@ Fonctions principales:
 """
 
 import os
-import glob
+import fnmatch
 import time
-from pathlib import Path
 
 from .executor import execute_command
 
@@ -111,21 +110,33 @@ def find_latest_db_archive(patterns=None, directory='.'):
     """
     if patterns is None:
         patterns = [
+            "plex_db_only_*.tar.zst",
+            "plex_db_metadata_*.tar.zst",
+            "plex_metadata_*.tar.zst",
+            "plex_delta_sync_*.tar.zst",
             "plex_db_only_*.tar.gz",
             "plex_db_metadata_*.tar.gz",
             "plex_metadata_*.tar.gz",
             "plex_delta_sync_*.tar.gz",
         ]
 
-    # Rechercher toutes les archives correspondantes
+    # Un seul parcours du répertoire, un seul stat par archive candidate
     archives = []
-    for pattern in patterns:
-        search_pattern = os.path.join(directory, pattern)
-        archives.extend(glob.glob(search_pattern))
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not any(fnmatch.fnmatchcase(entry.name, pattern) for pattern in patterns):
+                    continue
+                try:
+                    if entry.is_file():
+                        archives.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+    except FileNotFoundError:
+        return None
 
     if not archives:
         return None
 
-    # Trier par date de modification (plus récent en premier)
-    archives.sort(key=os.path.getmtime, reverse=True)
-    return archives[0]
+    # Plus récente par date de modification
+    return max(archives)[1]
@@ -5,9 +5,19 @@ Monitoring continu du montage rclone pendant les phases longues.
 Ce module fournit un thread daemon qui surveille la santé du montage S3 via rclone
 et tente un remontage automatique en cas de défaillance détectée.
 """
+import re
 import threading
+import time
 from datetime import datetime
-from .plex_setup import verify_rclone_mount_healthy, remount_s3_if_needed
+from .executor import PollBackoff
+from .plex_setup import verify_rclone_mount_healthy, remount_s3_if_needed, stream_log
+
+# Lignes du log rclone annonçant un montage dégradé (déclenchent un check immédiat)
+RCLONE_ERROR_PATTERN = re.compile(
+    r'Transport endpoint is not connected|vfs cache: failed|IO error|'
+    r'connection reset|no such host|context deadline exceeded',
+    re.IGNORECASE
+)
 
 
 class MountHealthMonitor:
@@ -15,8 +25,9 @@ class MountHealthMonitor:
     Thread daemon surveillant le montage rclone pendant les phases longues.
 
     Caractéristiques:
-    - Vérifie la santé du montage à intervalles réguliers (défaut: 2 min)
+    - Vérifie la santé du montage (défaut: 2 min, espacé jusqu'à 10 min tant qu'il est sain)
     - Tente un remontage automatique en cas de défaillance
+    - Suit le log rclone en continu : une erreur déclenche un check immédiat
     - Fournit une fonction injectable dans les wait loops (health_check_fn)
     - Thread daemon: s'arrête automatiquement si le programme principal se termine
     - Lock partagé pour éviter les race conditions avec ensure_mount_healthy()
@@ -47,7 +58,7 @@ class MountHealthMonitor:
 
     def __init__(self, ip, mount_point, rclone_remote, profile,
                  cache_dir, log_file, check_interval=120, remount_retries=3,
-                 initial_delay=0):
+                 initial_delay=0, early_check_min_interval=30, max_check_interval=600):
         """
         Initialise le moniteur de santé.
 
@@ -61,6 +72,10 @@ class MountHealthMonitor:
             check_interval: Intervalle entre vérifications en secondes (défaut: 120)
             remount_retries: Nombre max de tentatives de remontage (défaut: 3)
             initial_delay: Délai avant le premier check en secondes (défaut: 0)
+            early_check_min_interval: Délai minimal entre deux checks déclenchés
+                                      par le log rclone (défaut: 30s)
+            max_check_interval: Intervalle max atteint par backoff tant que le
+                                montage est sain (défaut: 600s)
         """
         self.ip = ip
         self.mount_point = mount_point
@@ -71,10 +86,16 @@ class MountHealthMonitor:
         self.check_interval = check_interval
         self.remount_retries = remount_retries
         self.initial_delay = initial_delay
+        self.early_check_min_interval = early_check_min_interval
+        self.max_check_interval = max(check_interval, max_check_interval)
 
         # État interne
         self._running = False
         self._stop_event = threading.Event()
+        self._wake_event = threading.Event()  # Réveil anticipé (erreur rclone ou stop)
+        self._last_early_check = 0
+        # Montage sain : checks espacés (le suivi du log rclone couvre les pannes)
+        self._backoff = PollBackoff(initial=check_interval, max_interval=self.max_check_interval)
         self._thread = None
         self._lock = threading.Lock()
         self._last_health = {'healthy': True, 'error': None, 'response_time': 0}
@@ -84,6 +105,7 @@ class MountHealthMonitor:
         self._stats = {
             'checks_total': 0,
             'checks_failed': 0,
+            'early_checks': 0,
             'remounts_attempted': 0,
             'remounts_successful': 0,
             'start_time': None,
@@ -132,7 +154,13 @@ class MountHealthMonitor:
         self._stats['start_time'] = datetime.now()
         self._thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self._thread.start()
-        print(f"   [MountMonitor] Démarré (check toutes les {self.check_interval}s)")
+
+        # Suivi du log rclone (détection quasi immédiate des erreurs)
+        if self.log_file:
+            stream_log(self.ip, self.log_file, self._on_log_line, self._stop_event)
+
+        print(f"   [MountMonitor] Démarré (check toutes les {self.check_interval}s, "
+              f"jusqu'à {self.max_check_interval}s si sain)")
 
     def stop(self):
         """Arrête le monitoring et affiche les statistiques."""
@@ -141,6 +169,7 @@ class MountHealthMonitor:
 
         self._running = False
         self._stop_event.set()
+        self._wake_event.set()
         self._stats['stop_time'] = datetime.now()
 
         if self._thread and self._thread.is_alive():
@@ -164,16 +193,46 @@ class MountHealthMonitor:
 
         while self._running:
             try:
-                self._perform_health_check()
+                healthy = self._perform_health_check()
             except Exception as e:
                 print(f"   [MountMonitor] Erreur: {e}")
-
-            # Attendre l'intervalle (interrompu immédiatement par stop())
-            if self._stop_event.wait(timeout=self.check_interval):
+                healthy = False
+
+            # Problème : retour à l'intervalle de base (re-check rapide)
+            if not healthy:
+                self._backoff.reset()
+
+            # Attendre l'intervalle (interrompu par stop() ou une erreur rclone)
+            self._backoff.sleep(self._wake_event.wait)
+            if self._wake_event.is_set():
+                self._wake_event.clear()
+                self._backoff.reset()
+            if self._stop_event.is_set():
                 break
 
+    def _on_log_line(self, line):
+        """Callback du suivi de log : réveille la boucle sur erreur rclone."""
+        if not RCLONE_ERROR_PATTERN.search(line):
+            return
+
+        # Anti-rebond : une rafale d'erreurs ne déclenche qu'un seul check
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_early_check < self.early_check_min_interval:
+                return
+            self._last_early_check = now
+            self._stats['early_checks'] += 1
+
+        print(f"\n   [MountMonitor] 🔍 Erreur rclone détectée, vérification immédiate")
+        self._wake_event.set()
+
     def _perform_health_check(self):
-        """Effectue une vérification de santé et remonte si nécessaire."""
+        """
+        Effectue une vérification de santé et remonte si nécessaire.
+
+        Returns:
+            bool: True si le montage était sain (aucun remontage tenté)
+        """
         # Vérification SANS lock (opération I/O longue, timeout 30s)
         health = verify_rclone_mount_healthy(
             self.ip,
@@ -182,7 +241,7 @@ class MountHealthMonitor:
         )
 
         if not self._running:
-            return
+            return True
 
         # Mise à jour de l'état AVEC lock (rapide)
         with self._lock:
@@ -191,7 +250,7 @@ class MountHealthMonitor:
             self._last_health = health
 
         if health['healthy']:
-            return
+            return True
 
         # Problème détecté
         with self._lock:
@@ -201,7 +260,7 @@ class MountHealthMonitor:
         if not self._global_remount_lock.acquire(blocking=False):
             print(f"\n   [MountMonitor] ⏳ Remontage en cours par un autre processus, attente...")
             self._print_pending_reminder()
-            return
+            return False
 
         try:
             print(f"\n   [MountMonitor] ⚠️  Problème détecté: {health['error']}")
@@ -238,6 +297,8 @@ class MountHealthMonitor:
         finally:
             self._global_remount_lock.release()
 
+        return False
+
     def get_health_check_fn(self):
         """
         Retourne une fonction injectable dans les wait loops.
@@ -274,6 +335,8 @@ class MountHealthMonitor:
 
         print(f"\n   [MountMonitor] Statistiques:")
         print(f"      Vérifications : {stats['checks_total']}")
+        if stats['early_checks'] > 0:
+            print(f"      Sur erreur log : {stats['early_checks']}")
         if stats['checks_failed'] > 0:
             print(f"      Échecs détectés: {stats['checks_failed']}")
             print(f"      Remontages     : {stats['remounts_successful']}/{stats['remounts_attempted']}")
@@ -5,8 +5,63 @@ Logique de scan, monitoring et export Plex
 import time
 import re
 import os
+import json
+import shlex
+import subprocess
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from .executor import execute_command, docker_exec
+from .executor import execute_command, docker_exec, popen_command, iter_lines_with_deadline, ARCHIVE_EXT, tar_compress_option, sqlite_read_command, PollBackoff, stream_tar_download
+from .config import RCLONE_RC_ADDR
+
+
+# === PATTERNS XML (compilés une fois à l'import) ===
+ACTIVITY_TAG_PATTERN = re.compile(r'<Activity[^>]+librarySectionID="(\d+)"[^>]*>')
+KEY_ATTR_PATTERN = re.compile(r'key="(\d+)"')
+TYPE_ATTR_PATTERN = re.compile(r'type="([^"]+)"')
+TITLE_ATTR_PATTERN = re.compile(r'title="([^"]+)"')
+PROGRESS_ATTR_PATTERN = re.compile(r'progress="([^"]+)"')
+SUBTITLE_ATTR_PATTERN = re.compile(r'subtitle="([^"]+)"')
+
+# Ligne d'état émise par le flux de surveillance Sonic (stream_sonic_status)
+SONIC_STATUS_PATTERN = re.compile(r'^TS=(\d+) CNT=(\d*) CPU=(\S*) SONIC=([01])$')
+
+
+def parse_library_sections(xml_text):
+    """
+    Extrait les sections de la réponse XML de /library/sections.
+
+    Parse XML en une passe (attributs lus par nom) : indépendant de l'ordre
+    des attributs, contrairement à une regex key=.*?type=.*?title=.
+
+    Args:
+        xml_text: Corps de la réponse API
+
+    Returns:
+        dict: {titre: {'id': str, 'type': str, 'refreshing': bool}}
+              (vide si réponse invalide)
+    """
+    sections = {}
+    if not xml_text:
+        return sections
+
+    try:
+        root = ET.fromstring(xml_text)
+    except ET.ParseError:
+        return sections
+
+    for directory in root.iter('Directory'):
+        key = directory.get('key')
+        title = directory.get('title')
+        if key and title:
+            sections[title] = {
+                "id": key,
+                "type": directory.get('type', ''),
+                "refreshing": directory.get('refreshing') == '1'
+            }
+
+    return sections
 
 
 # === PROFILS DE MONITORING ===
@@ -79,6 +134,34 @@ def get_monitoring_params(profile='cloud_standard'):
     return params
 
 
+def wait_scanner_exit(ip, container, timeout=600, poll_interval=1):
+    """
+    Attend la fin du 'Plex Media Scanner' via une seule commande distante bloquante.
+
+    La boucle pgrep tourne côté instance : un seul aller-retour SSH au lieu
+    d'un docker exec par seconde.
+
+    Args:
+        ip: IP de l'instance ou 'localhost'
+        container: Nom du conteneur Plex
+        timeout: Durée maximale d'attente en secondes
+        poll_interval: Intervalle entre deux pgrep côté distant
+
+    Returns:
+        bool: True si le scanner est terminé, False si le timeout est atteint
+    """
+    wait_cmd = (
+        f"timeout {int(timeout)} sh -c "
+        f"'while docker exec {container} pgrep -f \"Plex Media Scanner\" >/dev/null 2>&1; "
+        f"do sleep {poll_interval}; done'"
+    )
+    try:
+        result = execute_command(ip, wait_cmd, check=False, capture_output=True, timeout=timeout + 30)
+    except subprocess.TimeoutExpired:
+        return False
+    return result.returncode == 0
+
+
 def scan_section_incrementally(ip, container, plex_token, library_section_id, library_section_type, mount_path_internal, mount_path_local, filter_prefixes=None):
     """
     Scan synchrone via CLI (Plus robuste pour les noms avec accents/virgules).
@@ -113,7 +196,6 @@ def scan_section_incrementally(ip, container, plex_token, library_section_id, li
 
     for i, item_name in enumerate(items, 1):
         # Construction du chemin interne
-        # On utilise shlex.quote plus tard via docker_exec pour gérer les espaces/quotes
         plex_path = os.path.join(mount_path_internal, item_name).replace("\\", "/")
 
         print(f"   [{i}/{len(items)}] 🚀 Scan: {item_name}...", end='', flush=True)
@@ -122,37 +204,21 @@ def scan_section_incrementally(ip, container, plex_token, library_section_id, li
         # Au lieu de l'API (curl), on utilise le CLI Scanner
         # Syntaxe: Plex Media Scanner --scan --refresh --section X --directory "/path/to/folder"
 
-        # On doit échapper les guillemets doubles pour la commande bash
-        safe_path = plex_path.replace('"', '\\"')
-
-        scan_cmd = (
-            f"'/usr/lib/plexmediaserver/Plex Media Scanner' "
-            f"--refresh --section {library_section_id} "
-            f"--directory \"{safe_path}\""
-        )
+        # argv quoté par shlex : noms avec apostrophes, $, ` ou guillemets
+        # passent tels quels (un échappement raté relançait le scan à vide)
+        scan_cmd = shlex.join([
+            "/usr/lib/plexmediaserver/Plex Media Scanner",
+            "--refresh", "--section", str(library_section_id),
+            "--directory", plex_path
+        ])
 
         # On lance en mode "Check=False" car le scanner retourne parfois des codes non-zero non critiques
         docker_exec(ip, container, scan_cmd, check=False)
 
-        # 2. ATTENTE ACTIVE
-        # On attend un peu que le process apparaisse
-        time.sleep(1)
-
-        wait_cycles = 0
-        while True:
-            # On vérifie si le scanner tourne
-            res = docker_exec(ip, container, "pgrep -f 'Plex Media Scanner'", capture_output=True, check=False)
-            if not res.stdout.strip():
-                break
-
-            if wait_cycles % 5 == 0: print(".", end='', flush=True)
-            time.sleep(1)
-            wait_cycles += 1
-
-            if wait_cycles > 600: # 10 minutes max par artiste
-                print(" ⚠️ Timeout! (Kill)", end='')
-                docker_exec(ip, container, "pkill -f 'Plex Media Scanner'", check=False)
-                break
+        # 2. ATTENTE BLOQUANTE (un seul aller-retour SSH)
+        if not wait_scanner_exit(ip, container, timeout=600): # 10 minutes max par artiste
+            print(" ⚠️ Timeout! (Kill)", end='')
+            docker_exec(ip, container, "pkill -f 'Plex Media Scanner'", check=False)
 
         # 3. Rapport
         new_total = get_track_count(ip, container, plex_token, library_section_id)
@@ -238,29 +304,18 @@ def get_library_item_counts(ip, container, plex_token):
     if not result.stdout:
         return {'sections': sections, 'totals': totals}
 
-    # Parser les sections
-    for directory_match in re.finditer(r'<Directory[^>]+>', result.stdout):
-        tag = directory_match.group(0)
-
-        # Extraire chaque attribut individuellement
-        key_match = re.search(r'key="(\d+)"', tag)
-        type_match = re.search(r'type="(\w+)"', tag)
-        title_match = re.search(r'title="([^"]+)"', tag)
-        refreshing_match = re.search(r'refreshing="(\d)"', tag)
-
-        if not all([key_match, type_match, title_match]):
+    # Parser les sections (une passe XML, attributs lus par nom)
+    for section_title, parsed in parse_library_sections(result.stdout).items():
+        section_id = parsed['id']
+        section_type = parsed['type']
+        if not section_type:
             continue  # Skip si attributs manquants
 
-        section_id = key_match.group(1)
-        section_type = type_match.group(1)
-        section_title = title_match.group(1)
-        refreshing = refreshing_match.group(1) == "1" if refreshing_match else False
-
         section_info = {
             'id': section_id,
             'title': section_title,
             'type': section_type,
-            'refreshing': refreshing,
+            'refreshing': parsed['refreshing'],
             'items': {}
         }
 
@@ -423,10 +478,8 @@ def monitor_discovery_phase_clean(ip, container, plex_token, libraries, check_in
 
         # Parser chaque section
         sections = {}
-        import re
-        for match in re.finditer(r'<Directory.*?key="(\d+)".*?title="([^"]+)".*?>', result.stdout):
-            section_id = match.group(1)
-            section_name = match.group(2)
+        for section_name, parsed in parse_library_sections(result.stdout).items():
+            section_id = parsed['id']
 
             count_cmd = f"curl -s 'http://localhost:32400/library/sections/{section_id}/all' -H 'X-Plex-Token: {plex_token}' | grep -o 'ratingKey' | wc -l"
             count_result = docker_exec(ip, container, count_cmd, capture_output=True, check=False)
@@ -680,8 +733,7 @@ def debug_plex_scan_status(ip, container='plex', plex_token=None, verbose=False)
         result = docker_exec(ip, container, curl_cmd, capture_output=True, check=False)
         if result.returncode == 0 and result.stdout:
             # Extraire le nom de la section si possible
-            import re
-            name_match = re.search(r'title="([^"]+)"', result.stdout)
+            name_match = TITLE_ATTR_PATTERN.search(result.stdout)
             section_name = name_match.group(1) if name_match else "Inconnu"
             print(f"Section {section_id}: {section_name}")
         else:
@@ -722,8 +774,7 @@ def get_plex_sections(ip, container='plex', plex_token=None):
 
     if result.returncode == 0 and result.stdout and 'Directory' in result.stdout:
         # Extraire les IDs des sections
-        import re
-        section_ids = re.findall(r'key="(\d+)"', result.stdout)
+        section_ids = KEY_ATTR_PATTERN.findall(result.stdout)
         return section_ids
     else:
         print(f"⚠️  Aucune section trouvée dans la réponse: {result.stdout}")
@@ -762,6 +813,10 @@ def is_sonic_running(ip, container='plex'):
     return 'running' in result.stdout
 
 
+# Séparateur des sorties agrégées dans un seul appel SSH
+PROBE_SEPARATOR = "__CB_PROBE_SEP__"
+
+
 def get_container_cpu(ip, container='plex'):
     """Retourne le % CPU du conteneur Docker."""
     cpu_result = execute_command(
@@ -773,6 +828,46 @@ def get_container_cpu(ip, container='plex'):
     return float(cpu_str) if cpu_str and cpu_str != 'N/A' else 0.0
 
 
+def get_plex_activity(ip, container, plex_token):
+    """
+    Activité globale de Plex (toutes sections) en UN SEUL aller-retour SSH.
+
+    Regroupe CPU conteneur, /activities et processus Scanner, comme
+    get_section_activity() le fait pour une section.
+
+    Returns:
+        dict: {'active_tasks': int, 'scanner_running': bool, 'cpu_percent': float}
+    """
+    # [P]lex : évite que pgrep -f détecte le sh -c qui contient le motif
+    probes = (
+        f"curl -s 'http://localhost:32400/activities' -H 'X-Plex-Token: {plex_token}'; "
+        f"echo; echo {PROBE_SEPARATOR}; "
+        f"pgrep -f '[P]lex Media Scanner' > /dev/null && echo running || echo stopped"
+    )
+    cmd = (
+        f"docker stats {container} --no-stream --format '{{{{.CPUPerc}}}}'; "
+        f"echo {PROBE_SEPARATOR}; "
+        f"docker exec {container} sh -c \"{probes}\""
+    )
+    result = execute_command(ip, cmd, capture_output=True, check=False)
+
+    parts = (result.stdout or '').split(PROBE_SEPARATOR)
+    parts += [''] * (3 - len(parts))
+    cpu_output, activities_output, scanner_output = parts[:3]
+
+    cpu_str = cpu_output.strip().replace('%', '')
+    try:
+        cpu_percent = float(cpu_str)
+    except ValueError:
+        cpu_percent = 0.0
+
+    return {
+        'active_tasks': activities_output.count('<Activity'),
+        'scanner_running': scanner_output.strip() == 'running',
+        'cpu_percent': cpu_percent
+    }
+
+
 def wait_plex_stabilized(ip, container, plex_token, cooldown_checks=3, check_interval=60, cpu_threshold=20.0, timeout=1800):
     """
     Attend que Plex soit complètement stabilisé (aucune activité de fond).
@@ -790,6 +885,10 @@ def wait_plex_stabilized(ip, container, plex_token, cooldown_checks=3, check_int
         cpu_threshold: Seuil CPU en % sous lequel Plex est considéré idle (défaut: 20%)
         timeout: Timeout absolu en secondes (défaut: 1800 = 30min)
 
+    Tant que l'activité ne change pas, l'intervalle s'allonge jusqu'à
+    2 × check_interval ; il revient à check_interval dès qu'elle change
+    ou que Plex est idle (fenêtre de cooldown inchangée).
+
     Returns:
         bool: True si stabilisé, False si timeout
     """
@@ -797,23 +896,23 @@ def wait_plex_stabilized(ip, container, plex_token, cooldown_checks=3, check_int
 
     start_time = time.time()
     idle_count = 0
+    backoff = PollBackoff(initial=check_interval, max_interval=check_interval * 2)
+    last_state = None
 
     while time.time() - start_time < timeout:
-        # Vérifier les activités globales
-        activities_cmd = f"curl -s 'http://localhost:32400/activities' -H 'X-Plex-Token: {plex_token}'"
-        activities_result = docker_exec(ip, container, activities_cmd, capture_output=True, check=False)
-        active_tasks = activities_result.stdout.count('<Activity') if activities_result.stdout else 0
-
-        # Vérifier les processus Scanner
-        scanner_cmd = "pgrep -f 'Plex Media Scanner' > /dev/null && echo 'running' || echo 'stopped'"
-        scanner_result = docker_exec(ip, container, scanner_cmd, capture_output=True, check=False)
-        scanner_running = 'running' in scanner_result.stdout
-
-        # Vérifier le CPU
-        cpu_percent = get_container_cpu(ip, container)
+        # Activités globales + Scanner + CPU (une seule sonde SSH)
+        activity = get_plex_activity(ip, container, plex_token)
+        active_tasks = activity['active_tasks']
+        scanner_running = activity['scanner_running']
+        cpu_percent = activity['cpu_percent']
 
         is_idle = (active_tasks == 0 and not scanner_running and cpu_percent < cpu_threshold)
 
+        state = (active_tasks, scanner_running)
+        if is_idle or state != last_state:
+            backoff.reset()
+        last_state = state
+
         if is_idle:
             idle_count += 1
             print(f"   [{time.strftime('%H:%M:%S')}] ⏸️  Idle {idle_count}/{cooldown_checks} (CPU: {cpu_percent:.1f}%)")
@@ -831,7 +930,7 @@ def wait_plex_stabilized(ip, container, plex_token, cooldown_checks=3, check_int
             status_parts.append(f"CPU: {cpu_percent:.1f}%")
             print(f"   [{time.strftime('%H:%M:%S')}] 🔄 Activité: {', '.join(status_parts)}")
 
-        time.sleep(check_interval)
+        backoff.sleep()
 
     print(f"   [{time.strftime('%H:%M:%S')}] ⚠️  Timeout stabilisation ({timeout}s)")
     return False
@@ -841,6 +940,9 @@ def get_section_activity(ip, container, plex_token, section_id):
     """
     Vérifie l'activité d'UNE section spécifique avec détails.
 
+    Toutes les sondes (CPU conteneur, flag refreshing, /activities, processus
+    Scanner) sont exécutées en UN SEUL aller-retour SSH au lieu de quatre.
+
     Args:
         ip: 'localhost' ou IP remote
         container: Nom du conteneur
@@ -853,32 +955,56 @@ def get_section_activity(ip, container, plex_token, section_id):
             'activities': int,
             'activity_details': list,  # Liste des activités avec détails
             'scanner_running': bool,
+            'cpu_percent': float,
             'is_idle': bool
         }
     """
-    # Vérifier le flag refreshing sur la section
-    cmd = f"curl -s 'http://localhost:32400/library/sections/{section_id}' -H 'X-Plex-Token: {plex_token}'"
-    result = docker_exec(ip, container, cmd, capture_output=True, check=False)
-    refreshing = 'refreshing="1"' in result.stdout if result.stdout else False
+    # [P]lex : évite que pgrep -f détecte le sh -c qui contient le motif
+    probes = (
+        f"curl -s 'http://localhost:32400/library/sections/{section_id}' -H 'X-Plex-Token: {plex_token}'; "
+        f"echo; echo {PROBE_SEPARATOR}; "
+        f"curl -s 'http://localhost:32400/activities' -H 'X-Plex-Token: {plex_token}'; "
+        f"echo; echo {PROBE_SEPARATOR}; "
+        f"pgrep -f '[P]lex Media Scanner' > /dev/null && echo running || echo stopped"
+    )
+    cmd = (
+        f"docker stats {container} --no-stream --format '{{{{.CPUPerc}}}}'; "
+        f"echo {PROBE_SEPARATOR}; "
+        f"docker exec {container} sh -c \"{probes}\""
+    )
+    result = execute_command(ip, cmd, capture_output=True, check=False)
+
+    parts = (result.stdout or '').split(PROBE_SEPARATOR)
+    parts += [''] * (4 - len(parts))
+    cpu_output, section_output, activities_output, scanner_output = parts[:4]
 
-    # Récupérer les activités détaillées pour cette section
-    activities_cmd = f"curl -s 'http://localhost:32400/activities' -H 'X-Plex-Token: {plex_token}'"
-    activities_result = docker_exec(ip, container, activities_cmd, capture_output=True, check=False)
+    # CPU du conteneur
+    cpu_str = cpu_output.strip().replace('%', '')
+    try:
+        cpu_percent = float(cpu_str)
+    except ValueError:
+        cpu_percent = 0.0
+
+    # Flag refreshing sur la section
+    refreshing = 'refreshing="1"' in section_output
 
+    # Activités détaillées pour cette section
     activities = 0
     activity_details = []
 
-    if activities_result.stdout:
+    if activities_output:
         # Parser chaque activité liée à cette section
-        for match in re.finditer(r'<Activity[^>]+librarySectionID="' + str(section_id) + r'"[^>]*>', activities_result.stdout):
+        for match in ACTIVITY_TAG_PATTERN.finditer(activities_output):
+            if match.group(1) != str(section_id):
+                continue
             tag = match.group(0)
             activities += 1
 
             # Extraire les détails
-            title_match = re.search(r'title="([^"]+)"', tag)
-            type_match = re.search(r'type="([^"]+)"', tag)
-            progress_match = re.search(r'progress="([^"]+)"', tag)
-            subtitle_match = re.search(r'subtitle="([^"]+)"', tag)
+            title_match = TITLE_ATTR_PATTERN.search(tag)
+            type_match = TYPE_ATTR_PATTERN.search(tag)
+            progress_match = PROGRESS_ATTR_PATTERN.search(tag)
+            subtitle_match = SUBTITLE_ATTR_PATTERN.search(tag)
 
             detail = {
                 'title': title_match.group(1) if title_match else 'Inconnu',
@@ -888,10 +1014,8 @@ def get_section_activity(ip, container, plex_token, section_id):
             }
             activity_details.append(detail)
 
-    # Vérifier les processus Scanner
-    scanner_cmd = "pgrep -f 'Plex Media Scanner' > /dev/null && echo 'running' || echo 'stopped'"
-    scanner_result = docker_exec(ip, container, scanner_cmd, capture_output=True, check=False)
-    scanner_running = 'running' in scanner_result.stdout
+    # Processus Scanner
+    scanner_running = 'running' in scanner_output
 
     is_idle = not (refreshing or activities > 0 or scanner_running)
 
@@ -900,11 +1024,106 @@ def get_section_activity(ip, container, plex_token, section_id):
         'activities': activities,
         'activity_details': activity_details,
         'scanner_running': scanner_running,
+        'cpu_percent': cpu_percent,
         'is_idle': is_idle
     }
 
 
-def wait_section_idle(ip, container, plex_token, section_id, section_type=None, phase='scan', config_path=None, timeout=3600, check_interval=30, consecutive_idle=3, health_check_fn=None):
+def activity_ended_for_section(line, section_id):
+    """
+    Indique si une ligne du flux d'événements Plex annonce la fin d'une activité de la section.
+
+    Args:
+        line: Ligne brute du flux SSE (seules les lignes "data: {...}" comptent)
+        section_id: ID de la section suivie
+
+    Returns:
+        bool: True si une ActivityNotification "ended" concerne la section
+              (ou n'est rattachée à aucune section)
+    """
+    if not line.startswith('data:'):
+        return False
+    try:
+        payload = json.loads(line[5:])
+    except ValueError:
+        return False
+    if not isinstance(payload, dict):
+        return False
+
+    container = payload.get('NotificationContainer', payload)
+    if not isinstance(container, dict):
+        return False
+
+    # Une notification seule arrive en objet, plusieurs en liste
+    notifications = container.get('ActivityNotification', [])
+    if isinstance(notifications, dict):
+        notifications = [notifications]
+    if not isinstance(notifications, list):
+        return False
+
+    for notification in notifications:
+        if not isinstance(notification, dict) or notification.get('event') != 'ended':
+            continue
+        activity = notification.get('Activity')
+        context = activity.get('Context') if isinstance(activity, dict) else None
+        if not isinstance(context, dict):
+            context = {}
+        if str(context.get('librarySectionID', section_id)) == str(section_id):
+            return True
+    return False
+
+
+def watch_section_events(ip, plex_token, section_id, wake_event, stop_event):
+    """
+    Suit le flux d'événements Plex et réveille l'appelant à la fin d'une activité.
+
+    Un seul curl longue durée sur /:/eventsource/notifications (port 32400
+    publié sur l'hôte) : wake_event est positionné dès qu'une activité de la
+    section se termine, sans attendre le prochain tick de polling. Si le flux
+    est indisponible, le thread s'arrête et le polling reste seul en place.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        plex_token: Token d'authentification Plex
+        section_id: ID de la section suivie
+        wake_event: threading.Event positionné à chaque fin d'activité
+        stop_event: threading.Event arrêtant le flux quand il est positionné
+
+    Returns:
+        threading.Thread: Thread daemon de lecture (déjà démarré)
+    """
+    url = f"http://localhost:32400/:/eventsource/notifications?filters=activity&X-Plex-Token={plex_token}"
+    # exec : curl remplace le shell, terminate() l'atteint directement
+    proc = popen_command(ip, f"exec curl -sN '{url}' 2>/dev/null")
+
+    def reader():
+        try:
+            for line in proc.stdout:
+                if stop_event.is_set():
+                    break
+                # Un événement malformé ne doit pas arrêter le suivi
+                try:
+                    ended = activity_ended_for_section(line.strip(), section_id)
+                except Exception as e:
+                    print(f"   [{time.strftime('%H:%M:%S')}] ⚠️  Événement Plex ignoré: {e}")
+                    continue
+                if ended:
+                    wake_event.set()
+        finally:
+            proc.terminate()
+
+    def stopper():
+        # Débloque reader() si aucun événement n'arrive après l'arrêt
+        stop_event.wait()
+        proc.terminate()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    threading.Thread(target=stopper, daemon=True).start()
+    return thread
+
+
+def wait_section_idle(ip, container, plex_token, section_id, section_type=None, phase='scan', config_path=None, timeout=3600, check_interval=30, consecutive_idle=3, health_check_fn=None, max_interval=None):
     """
     Attend qu'une section soit VRAIMENT inactive (API + CPU).
 
@@ -925,6 +1144,15 @@ def wait_section_idle(ip, container, plex_token, section_id, section_type=None,
         consecutive_idle: Nombre de checks idle consécutifs requis (défaut: 3)
         health_check_fn: Fonction optionnelle pour vérifier la santé du montage
                          Doit retourner {'healthy': bool, 'error': str|None}
+        max_interval: Intervalle maximum du backoff (défaut: 2 × check_interval)
+
+    Tant que l'activité (API, scanner, compteurs DB) ne change pas, l'intervalle
+    s'allonge jusqu'à max_interval ; il revient à check_interval dès qu'elle
+    change ou que la section est idle (fenêtre de confirmation inchangée).
+    La fin d'une activité Plex (flux d'événements) déclenche un check immédiat :
+    il peut invalider l'idle, mais seuls les ticks nominaux le comptent, et l'idle
+    n'est confirmé qu'après idle_window secondes depuis la première observation
+    (une rafale de notifications ne raccourcit pas la fenêtre).
 
     Returns:
         bool: True si idle atteint, False si timeout ou health check échoué
@@ -976,80 +1204,120 @@ def wait_section_idle(ip, container, plex_token, section_id, section_type=None,
 
     start_time = time.time()
     idle_count = 0
+    idle_since = None  # Première observation idle de la série en cours
+    woken = False      # Check déclenché par un événement (hors tick nominal)
+    backoff = PollBackoff(initial=check_interval,
+                          max_interval=max(check_interval, max_interval or check_interval * 2))
+    last_state = None
 
-    while time.time() - start_time < timeout:
-        elapsed = int(time.time() - start_time)
-
-        # Vérifier la santé du montage si callback fourni
-        if health_check_fn:
-            health = health_check_fn()
-            if not health.get('healthy', True):
-                print(f"   [{time.strftime('%H:%M:%S')}] ⚠️  Health check failed: {health.get('error')}")
-                return False
-
-        activity = get_section_activity(ip, container, plex_token, section_id)
-        cpu_percent = get_container_cpu(ip, container)
+    # Fin d'activité poussée par Plex → check immédiat (le polling reste le filet)
+    wake_event = threading.Event()
+    stop_event = threading.Event()
+    watch_section_events(ip, plex_token, section_id, wake_event, stop_event)
 
-        # Idle = API idle ET CPU bas (évite faux idle quand FFMPEG/Butler travaille)
-        is_truly_idle = activity['is_idle'] and cpu_percent < cpu_threshold
-
-        # Grace period : ne pas compter les idles dans les premières secondes
-        in_grace = elapsed < grace_period
-
-        if is_truly_idle and not in_grace:
-            idle_count += 1
-            print(f"   [{time.strftime('%H:%M:%S')}] ⏸️  Idle {idle_count}/{consecutive_idle} (CPU: {cpu_percent:.1f}%)")
-
-            if idle_count >= consecutive_idle:
-                print(f"   [{time.strftime('%H:%M:%S')}] ✅ Section {section_id} inactive après {elapsed//60}min")
-                return True
-        else:
-            idle_count = 0
-            status_parts = []
-
-            if in_grace:
-                status_parts.append("⏳ Grace period")
-
-            if activity['refreshing']:
-                status_parts.append("🔄 Refreshing")
-
-            # Message différencié selon la phase (remplace "Scanner actif")
-            if activity['scanner_running']:
-                status_parts.append(f"{phase_icon} {phase_msg}")
-
-            # Afficher les détails des activités API Plex
-            if activity['activity_details']:
-                for detail in activity['activity_details']:
-                    progress_str = f" ({detail['progress']}%)" if detail['progress'] > 0 else ""
-                    subtitle_str = f" - {detail['subtitle']}" if detail['subtitle'] else ""
-                    status_parts.append(f"📋 {detail['title']}{progress_str}{subtitle_str}")
-            elif activity['activities'] > 0:
-                status_parts.append(f"📋 {activity['activities']} activité(s)")
-
-            # Comptage de progression DB (si config_path fourni)
-            if config_path and section_type and initial_count > 0:
-                current_count = get_section_item_count_from_db(ip, config_path, section_id, section_type)
-                if phase == 'scan':
-                    # Pendant scan: montrer le delta d'items ajoutés
-                    delta = current_count - initial_count
-                    status_parts.append(f"+{delta} items")
-                else:
-                    # Pendant analyze: montrer le pourcentage analysé
-                    analyzed = get_section_analyzed_count_from_db(ip, config_path, section_id, section_type)
-                    pct = int(analyzed / current_count * 100) if current_count > 0 else 0
-                    status_parts.append(f"{analyzed}/{current_count} ({pct}%)")
-
-            # Toujours afficher le CPU
-            status_parts.append(f"CPU: {cpu_percent:.1f}%")
-
-            elapsed_str = f"{elapsed//60:02d}:{elapsed%60:02d}"
-            print(f"   [{time.strftime('%H:%M:%S')}] {elapsed_str} | {' | '.join(status_parts)}")
-
-        time.sleep(check_interval)
+    try:
+        while time.time() - start_time < timeout:
+            elapsed = int(time.time() - start_time)
+
+            # Vérifier la santé du montage si callback fourni
+            if health_check_fn:
+                health = health_check_fn()
+                if not health.get('healthy', True):
+                    print(f"   [{time.strftime('%H:%M:%S')}] ⚠️  Health check failed: {health.get('error')}")
+                    return False
+
+            # Une seule sonde SSH par tick (API + Scanner + CPU)
+            activity = get_section_activity(ip, container, plex_token, section_id)
+            cpu_percent = activity['cpu_percent']
+
+            # Idle = API idle ET CPU bas (évite faux idle quand FFMPEG/Butler travaille)
+            is_truly_idle = activity['is_idle'] and cpu_percent < cpu_threshold
+
+            # Grace period : ne pas compter les idles dans les premières secondes
+            in_grace = elapsed < grace_period
+
+            # Comptage de progression DB (si config_path fourni, inutile en idle confirmé)
+            progress = None
+            if config_path and section_type and initial_count > 0 and not (is_truly_idle and not in_grace):
+                progress = get_section_progress_from_db(ip, config_path, section_id, section_type)
+
+            # Activité inchangée → backoff ; changement ou idle → intervalle nominal
+            state = (
+                activity['refreshing'],
+                activity['scanner_running'],
+                activity['activities'],
+                tuple((d['title'], d['progress']) for d in activity['activity_details']),
+                (progress['total'], progress['analyzed']) if progress else None,
+            )
+            if is_truly_idle or state != last_state:
+                backoff.reset()
+            last_state = state
+
+            if is_truly_idle and not in_grace:
+                # Réveil par événement : re-check sans avancer la confirmation
+                if not woken:
+                    idle_count += 1
+                    if idle_since is None:
+                        idle_since = time.time()
+                wake_str = " (réveil)" if woken else ""
+                print(f"   [{time.strftime('%H:%M:%S')}] ⏸️  Idle {idle_count}/{consecutive_idle}{wake_str} (CPU: {cpu_percent:.1f}%)")
+
+                idle_for = time.time() - idle_since if idle_since is not None else 0
+                if idle_count >= consecutive_idle and idle_for >= idle_window:
+                    print(f"   [{time.strftime('%H:%M:%S')}] ✅ Section {section_id} inactive après {elapsed//60}min")
+                    return True
+            else:
+                idle_count = 0
+                idle_since = None
+                status_parts = []
+
+                if in_grace:
+                    status_parts.append("⏳ Grace period")
+
+                if activity['refreshing']:
+                    status_parts.append("🔄 Refreshing")
+
+                # Message différencié selon la phase (remplace "Scanner actif")
+                if activity['scanner_running']:
+                    status_parts.append(f"{phase_icon} {phase_msg}")
+
+                # Afficher les détails des activités API Plex
+                if activity['activity_details']:
+                    for detail in activity['activity_details']:
+                        progress_str = f" ({detail['progress']}%)" if detail['progress'] > 0 else ""
+                        subtitle_str = f" - {detail['subtitle']}" if detail['subtitle'] else ""
+                        status_parts.append(f"📋 {detail['title']}{progress_str}{subtitle_str}")
+                elif activity['activities'] > 0:
+                    status_parts.append(f"📋 {activity['activities']} activité(s)")
+
+                if progress:
+                    current_count = progress['total']
+                    if phase == 'scan':
+                        # Pendant scan: montrer le delta d'items ajoutés
+                        delta = current_count - initial_count
+                        status_parts.append(f"+{delta} items")
+                    else:
+                        # Pendant analyze: montrer le pourcentage analysé
+                        analyzed = progress['analyzed']
+                        pct = int(analyzed / current_count * 100) if current_count > 0 else 0
+                        status_parts.append(f"{analyzed}/{current_count} ({pct}%)")
+
+                # Toujours afficher le CPU
+                status_parts.append(f"CPU: {cpu_percent:.1f}%")
+
+                elapsed_str = f"{elapsed//60:02d}:{elapsed%60:02d}"
+                print(f"   [{time.strftime('%H:%M:%S')}] {elapsed_str} | {' | '.join(status_parts)}")
+
+            # Attente interrompue par la fin d'une activité Plex
+            backoff.sleep(wake_event.wait)
+            woken = wake_event.is_set()
+            wake_event.clear()
 
-    elapsed = int(time.time() - start_time)
-    print(f"   [{time.strftime('%H:%M:%S')}] 🚨 Timeout de sécurité après {elapsed//60}min (anomalie)")
-    return False
+        elapsed = int(time.time() - start_time)
+        print(f"   [{time.strftime('%H:%M:%S')}] 🚨 Timeout de sécurité après {elapsed//60}min (anomalie)")
+        return False
+    finally:
+        stop_event.set()
 
 
 def get_section_item_count_from_db(ip, config_path, section_id, section_type):
@@ -1081,7 +1349,7 @@ def get_section_item_count_from_db(ip, config_path, section_id, section_type):
 
     sql_query = f"SELECT COUNT(*) FROM metadata_items WHERE library_section_id={section_id} AND metadata_type={metadata_type}"
 
-    cmd = f"sqlite3 '{db_path}' \"{sql_query}\""
+    cmd = sqlite_read_command(db_path, sql_query)
     result = execute_command(ip, cmd, capture_output=True, check=False)
 
     try:
@@ -1090,6 +1358,102 @@ def get_section_item_count_from_db(ip, config_path, section_id, section_type):
         return 0
 
 
+def get_section_progress_from_db(ip, config_path, section_id, section_type):
+    """
+    Compte les items ET les items analysés d'une section en une seule requête.
+
+    Équivaut à get_section_item_count_from_db() + get_section_analyzed_count_from_db()
+    mais en un seul appel sqlite3 (un aller-retour SSH par tick de monitoring).
+
+    Args:
+        ip: 'localhost' ou IP remote
+        config_path: Chemin vers la config Plex
+        section_id: ID de la section
+        section_type: Type de section ('artist', 'movie', 'show', 'photo')
+
+    Returns:
+        dict: {'total': int, 'analyzed': int}
+    """
+    db_path = f"{config_path}/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
+
+    type_map = {
+        'artist': 10,
+        'movie': 1,
+        'show': 4,
+        'photo': 13
+    }
+
+    metadata_type = type_map.get(section_type)
+    if not metadata_type:
+        return {'total': 0, 'analyzed': 0}
+
+    sql_query = f"""
+        SELECT COUNT(*),
+               COUNT(CASE WHEN user_thumb_url IS NOT NULL AND user_thumb_url != '' THEN 1 END)
+        FROM metadata_items
+        WHERE library_section_id={section_id}
+        AND metadata_type={metadata_type};
+    """
+
+    result = execute_command(ip, sqlite_read_command(db_path, sql_query), capture_output=True, check=False)
+
+    try:
+        total, analyzed = result.stdout.strip().split('|')
+        return {'total': int(total), 'analyzed': int(analyzed)}
+    except (ValueError, AttributeError):
+        return {'total': 0, 'analyzed': 0}
+
+
+def get_sonic_diagnostic_from_db(ip, config_path):
+    """
+    Collecte les compteurs du diagnostic Sonic post-mortem en une seule requête.
+
+    Regroupe le comptage loudness, le flag hasSonicAnalysis de media_parts et
+    les préférences d'analyse. Lecture directe de la DB côté hôte (read-only) :
+    fonctionne aussi quand le conteneur Plex est déjà arrêté.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        config_path: Chemin vers la config Plex (côté hôte)
+
+    Returns:
+        dict: {'loudness': int, 'sonic_flag': int, 'prefs': [(name, value)]}
+              ou None si la DB est inaccessible
+    """
+    db_path = f"{config_path}/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
+
+    sql_query = """
+        SELECT 'counts',
+               (SELECT COUNT(*) FROM media_item_settings WHERE loudness != 0),
+               (SELECT COUNT(*) FROM media_parts WHERE extra_data LIKE '%hasSonicAnalysis%1%');
+        SELECT 'pref', name, value FROM preferences
+        WHERE name LIKE '%sonic%' OR name LIKE '%loudness%' OR name LIKE '%musicAnalysis%'
+        LIMIT 10;
+    """
+
+    result = execute_command(ip, sqlite_read_command(db_path, sql_query), capture_output=True, check=False)
+
+    diagnostic = None
+    prefs = []
+    for line in (result.stdout or '').splitlines():
+        parts = line.strip().split('|')
+        if parts[0] == 'counts':
+            try:
+                if len(parts) != 3:
+                    raise ValueError(f"{len(parts) - 1} valeurs au lieu de 2")
+                diagnostic = {'loudness': int(parts[1]), 'sonic_flag': int(parts[2])}
+            except ValueError as e:
+                print(f"   ⚠️  Ligne de comptage Sonic inattendue ({e}): {line}")
+        elif parts[0] == 'pref' and len(parts) >= 3:
+            prefs.append((parts[1], '|'.join(parts[2:])))
+
+    if diagnostic is None:
+        return None
+
+    diagnostic['prefs'] = prefs
+    return diagnostic
+
+
 def get_section_analyzed_count_from_db(ip, config_path, section_id, section_type):
     """
     Compte les items analysés d'une section (thumbnails générés, metadata enrichies).
@@ -1130,7 +1494,7 @@ def get_section_analyzed_count_from_db(ip, config_path, section_id, section_type
         AND user_thumb_url IS NOT NULL AND user_thumb_url != ''
     """
 
-    cmd = f"sqlite3 '{db_path}' \"{sql_query}\""
+    cmd = sqlite_read_command(db_path, sql_query)
     result = execute_command(ip, cmd, capture_output=True, check=False)
 
     try:
@@ -1158,10 +1522,7 @@ def get_sonic_count_from_db(ip, config_path):
         AND extra_data LIKE '%ms:musicAnalysisVersion%';
     """
 
-    if ip == 'localhost':
-        cmd = f"sqlite3 '{db_path}' \"{sql_query}\""
-    else:
-        cmd = f"sqlite3 '{db_path}' \"{sql_query}\""
+    cmd = sqlite_read_command(db_path, sql_query)
 
     result = execute_command(ip, cmd, capture_output=True, check=False)
 
@@ -1171,6 +1532,72 @@ def get_sonic_count_from_db(ip, config_path):
         return 0
 
 
+# Flux Sonic : silence toléré (en intervalles) et relances avant repli en sondes
+STREAM_SILENCE_CHECKS = 3
+MAX_STREAM_RELAUNCHES = 5
+
+
+def stream_sonic_status(ip, config_path, container='plex', interval=120):
+    """
+    Lance le flux d'état Sonic : une boucle distante émet une ligne par intervalle.
+
+    Les trois sondes (compteur DB, CPU conteneur, processus Sonic) tournent
+    côté instance dans un seul processus longue durée : un canal SSH pour
+    toute l'analyse au lieu de trois appels par check.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        config_path: Chemin vers la config Plex (contient la DB)
+        container: Nom du conteneur
+        interval: Intervalle entre deux lignes en secondes
+
+    Returns:
+        subprocess.Popen: Lignes 'TS=… CNT=… CPU=… SONIC=0|1' (voir parse_sonic_status)
+    """
+    db_path = f"{config_path}/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
+
+    sql_query = """
+        SELECT COUNT(*) FROM metadata_items
+        WHERE metadata_type=10
+        AND extra_data LIKE '%ms:musicAnalysisVersion%';
+    """
+
+    cmd = (
+        "while true; do\n"
+        f"cnt=$({sqlite_read_command(db_path, sql_query)}\n)\n"
+        f"cpu=$(docker stats {container} --no-stream --format '{{{{.CPUPerc}}}}')\n"
+        f"if docker exec {container} pgrep -f 'server-action sonic' >/dev/null 2>&1; then sonic=1; else sonic=0; fi\n"
+        "echo \"TS=$(date +%s) CNT=${cnt} CPU=${cpu%\\%} SONIC=${sonic}\"\n"
+        f"sleep {int(interval)}\n"
+        "done"
+    )
+    return popen_command(ip, cmd)
+
+
+def parse_sonic_status(line):
+    """
+    Parse une ligne du flux stream_sonic_status().
+
+    Returns:
+        dict|None: {'count': int, 'cpu_percent': float, 'sonic_running': bool},
+                   None si la ligne n'est pas une ligne d'état
+    """
+    match = SONIC_STATUS_PATTERN.match(line.strip())
+    if not match:
+        return None
+
+    try:
+        cpu_percent = float(match.group(3))
+    except ValueError:
+        cpu_percent = 0.0
+
+    return {
+        'count': int(match.group(2) or 0),
+        'cpu_percent': cpu_percent,
+        'sonic_running': match.group(4) == '1'
+    }
+
+
 def get_unanalyzed_track_count(ip, config_path, section_id=None):
     """
     Compte les pistes NON analysées par Sonic dans une section.
@@ -1215,8 +1642,8 @@ def get_unanalyzed_track_count(ip, config_path, section_id=None):
         """
 
     # Exécuter les requêtes
-    total_result = execute_command(ip, f"sqlite3 '{db_path}' \"{total_query}\"", capture_output=True, check=False)
-    analyzed_result = execute_command(ip, f"sqlite3 '{db_path}' \"{analyzed_query}\"", capture_output=True, check=False)
+    total_result = execute_command(ip, sqlite_read_command(db_path, total_query), capture_output=True, check=False)
+    analyzed_result = execute_command(ip, sqlite_read_command(db_path, analyzed_query), capture_output=True, check=False)
 
     try:
         total = int(total_result.stdout.strip())
@@ -1239,6 +1666,39 @@ def get_unanalyzed_track_count(ip, config_path, section_id=None):
         }
 
 
+def get_unanalyzed_track_ids(ip, config_path, section_id):
+    """
+    Liste les IDs des pistes NON analysées par Sonic (le "delta set").
+
+    Sert à sauter le lancement Sonic quand le delta est vide. Sonic ne se
+    déclenche qu'au niveau section (--server-action sonic, pas d'équivalent
+    par item) ; Plex n'y traite que les pistes encore sans analyse.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        config_path: Chemin vers la config Plex
+        section_id: ID de la section musique
+
+    Returns:
+        list[int]: IDs metadata_items des pistes à analyser, ou None si erreur DB
+    """
+    db_path = f"{config_path}/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
+
+    query = f"""
+        SELECT id FROM metadata_items
+        WHERE metadata_type=10
+        AND library_section_id={section_id}
+        AND (extra_data IS NULL OR extra_data NOT LIKE '%ms:musicAnalysisVersion%');
+    """
+
+    result = execute_command(ip, sqlite_read_command(db_path, query), capture_output=True, check=False)
+
+    if result.returncode != 0:
+        return None
+
+    return [int(line) for line in result.stdout.split() if line.isdigit()]
+
+
 def wait_sonic_complete(ip, config_path, section_id, container='plex', timeout=86400, check_interval=120, health_check_fn=None):
     """
     Attend la fin du Sonic avec indicateur DB fiable.
@@ -1253,6 +1713,10 @@ def wait_sonic_complete(ip, config_path, section_id, container='plex', timeout=8
         health_check_fn: Fonction optionnelle pour vérifier la santé du montage
                          Doit retourner {'healthy': bool, 'error': str|None}
 
+    L'état arrive par stream_sonic_status(). Un flux coupé ou silencieux plus de
+    STREAM_SILENCE_CHECKS intervalles est relancé ; au-delà de MAX_STREAM_RELAUNCHES
+    relances, on bascule sur des sondes ponctuelles (un appel par check).
+
     Returns:
         dict: {
             'success': bool,
@@ -1287,91 +1751,126 @@ def wait_sonic_complete(ip, config_path, section_id, container='plex', timeout=8
     stall_count = 0
     max_stall = 30  # 30 checks sans delta = 1h sans progression
 
-    while time.time() - start_time < timeout:
-        elapsed = int(time.time() - start_time)
+    # Un seul flux distant pour toute l'attente (une ligne d'état par check)
+    stream_deadline = check_interval * STREAM_SILENCE_CHECKS
+    stream = stream_sonic_status(ip, config_path, container, check_interval)
+    lines = iter_lines_with_deadline(stream, stream_deadline)
+    relaunches = 0
 
-        # Vérifier la santé du montage si callback fourni
-        if health_check_fn:
-            health = health_check_fn()
-            if not health.get('healthy', True):
-                duration_minutes = int(elapsed / 60)
-                print(f"\n   [{time.strftime('%H:%M:%S')}] ⚠️  Health check failed: {health.get('error')}")
-                final_count = get_sonic_count_from_db(ip, config_path)
-                return {
-                    'success': False,
-                    'initial_count': initial_count,
-                    'final_count': final_count,
-                    'delta': final_count - initial_count,
-                    'duration_minutes': duration_minutes,
-                    'reason': 'health_check_failed'
+    try:
+        while time.time() - start_time < timeout:
+            if stream is not None:
+                line = next(lines)
+                if not line:
+                    # Flux coupé (SSH perdu) ou figé (SSH vivant, boucle distante bloquée)
+                    stream.terminate()
+                    lines.close()
+                    reason = "silencieux" if line is None else "interrompu"
+                    relaunches += 1
+                    if relaunches > MAX_STREAM_RELAUNCHES:
+                        print(f"   [{time.strftime('%H:%M:%S')}] ⚠️  Flux de surveillance {reason}, bascule en sondes ponctuelles")
+                        stream = None
+                        continue
+                    print(f"   [{time.strftime('%H:%M:%S')}] ⚠️  Flux de surveillance {reason}, relance ({relaunches}/{MAX_STREAM_RELAUNCHES})...")
+                    time.sleep(min(check_interval, 30))
+                    stream = stream_sonic_status(ip, config_path, container, check_interval)
+                    lines = iter_lines_with_deadline(stream, stream_deadline)
+                    continue
+
+                status = parse_sonic_status(line)
+                if status is None:
+                    continue
+            else:
+                # Repli : trois sondes par check
+                time.sleep(check_interval)
+                status = {
+                    'count': get_sonic_count_from_db(ip, config_path),
+                    'cpu_percent': get_container_cpu(ip, container),
+                    'sonic_running': is_sonic_running(ip, container)
                 }
 
-        # Compter les pistes analysées
-        current_count = get_sonic_count_from_db(ip, config_path)
-        delta_since_last = current_count - last_count
-        delta_total = current_count - initial_count
-
-        # Vérifier le CPU du conteneur
-        cpu_percent = get_container_cpu(ip, container)
-
-        # Vérifier si Sonic tourne
-        sonic_running = is_sonic_running(ip, container)
-
-        # Affichage progression
-        eta_str = "calcul..."
-        if delta_total > 0 and elapsed > 0:
-            # Estimation grossière basée sur le rythme actuel
-            rate = delta_total / (elapsed / 60)  # pistes/min
-            if rate > 0:
-                # On ne peut pas estimer un ETA sans connaître le total de pistes
-                eta_str = f"{rate:.1f} pistes/min"
-
-        status_parts = [
-            f"Analysées: {current_count} (+{delta_total})",
-            f"Delta: +{delta_since_last}",
-            f"CPU: {cpu_percent:.1f}%",
-            f"Sonic: {'🎹' if sonic_running else '⏹️ '}",
-            f"Rythme: {eta_str}"
-        ]
-
-        elapsed_str = f"{elapsed//60:02d}:{elapsed%60:02d}"
-        print(f"   [{time.strftime('%H:%M:%S')}] {elapsed_str} | {' | '.join(status_parts)}")
-
-        # Détection de stall
-        if delta_since_last == 0 and cpu_percent < 5.0 and not sonic_running:
-            stall_count += 1
-            print(f"   [{time.strftime('%H:%M:%S')}] ⏸️  Stall détecté: {stall_count}/{max_stall}")
-
-            if stall_count >= max_stall:
-                duration_minutes = int(elapsed / 60)
-                print(f"\n   [{time.strftime('%H:%M:%S')}] ✅ Analyse Sonic terminée (stall confirmé)")
-                return {
-                    'success': True,
-                    'initial_count': initial_count,
-                    'final_count': current_count,
-                    'delta': delta_total,
-                    'duration_minutes': duration_minutes,
-                    'reason': 'stall'
-                }
-        else:
-            stall_count = 0
+            elapsed = int(time.time() - start_time)
+
+            # Vérifier la santé du montage si callback fourni
+            if health_check_fn:
+                health = health_check_fn()
+                if not health.get('healthy', True):
+                    duration_minutes = int(elapsed / 60)
+                    print(f"\n   [{time.strftime('%H:%M:%S')}] ⚠️  Health check failed: {health.get('error')}")
+                    final_count = get_sonic_count_from_db(ip, config_path)
+                    return {
+                        'success': False,
+                        'initial_count': initial_count,
+                        'final_count': final_count,
+                        'delta': final_count - initial_count,
+                        'duration_minutes': duration_minutes,
+                        'reason': 'health_check_failed'
+                    }
+
+            # Pistes analysées, CPU du conteneur, processus Sonic (même ligne d'état)
+            current_count = status['count']
+            delta_since_last = current_count - last_count
+            delta_total = current_count - initial_count
+            cpu_percent = status['cpu_percent']
+            sonic_running = status['sonic_running']
+
+            # Affichage progression
+            eta_str = "calcul..."
+            if delta_total > 0 and elapsed > 0:
+                # Estimation grossière basée sur le rythme actuel
+                rate = delta_total / (elapsed / 60)  # pistes/min
+                if rate > 0:
+                    # On ne peut pas estimer un ETA sans connaître le total de pistes
+                    eta_str = f"{rate:.1f} pistes/min"
+
+            status_parts = [
+                f"Analysées: {current_count} (+{delta_total})",
+                f"Delta: +{delta_since_last}",
+                f"CPU: {cpu_percent:.1f}%",
+                f"Sonic: {'🎹' if sonic_running else '⏹️ '}",
+                f"Rythme: {eta_str}"
+            ]
 
-        last_count = current_count
-        time.sleep(check_interval)
+            elapsed_str = f"{elapsed//60:02d}:{elapsed%60:02d}"
+            print(f"   [{time.strftime('%H:%M:%S')}] {elapsed_str} | {' | '.join(status_parts)}")
 
-    # Timeout absolu
-    duration_minutes = int((time.time() - start_time) / 60)
-    final_count = get_sonic_count_from_db(ip, config_path)
-    print(f"\n   [{time.strftime('%H:%M:%S')}] ⚠️  Timeout absolu atteint ({timeout//3600}h)")
+            # Détection de stall
+            if delta_since_last == 0 and cpu_percent < 5.0 and not sonic_running:
+                stall_count += 1
+                print(f"   [{time.strftime('%H:%M:%S')}] ⏸️  Stall détecté: {stall_count}/{max_stall}")
+
+                if stall_count >= max_stall:
+                    duration_minutes = int(elapsed / 60)
+                    print(f"\n   [{time.strftime('%H:%M:%S')}] ✅ Analyse Sonic terminée (stall confirmé)")
+                    return {
+                        'success': True,
+                        'initial_count': initial_count,
+                        'final_count': current_count,
+                        'delta': delta_total,
+                        'duration_minutes': duration_minutes,
+                        'reason': 'stall'
+                    }
+            else:
+                stall_count = 0
 
-    return {
-        'success': False,
-        'initial_count': initial_count,
-        'final_count': final_count,
-        'delta': final_count - initial_count,
-        'duration_minutes': duration_minutes,
-        'reason': 'timeout'
-    }
+            last_count = current_count
+
+        # Timeout absolu
+        duration_minutes = int((time.time() - start_time) / 60)
+        final_count = get_sonic_count_from_db(ip, config_path)
+        print(f"\n   [{time.strftime('%H:%M:%S')}] ⚠️  Timeout absolu atteint ({timeout//3600}h)")
+
+        return {
+            'success': False,
+            'initial_count': initial_count,
+            'final_count': final_count,
+            'delta': final_count - initial_count,
+            'duration_minutes': duration_minutes,
+            'reason': 'timeout'
+        }
+    finally:
+        if stream is not None:
+            stream.terminate()
 
 
 def warm_vfs_cache(ip, config_path, section_id, mount_point):
@@ -1403,38 +1902,43 @@ def warm_vfs_cache(ip, config_path, section_id, mount_point):
         f"WHERE mdi.library_section_id = {section_id};"
     )
 
-    result = execute_command(ip, f"sqlite3 '{db_path}' \"{query}\"", capture_output=True, check=False)
+    # Convertir les chemins DB (/Media/...) en chemins hôte (mount_point/...)
+    # et écrire dans un fichier temporaire pour xargs, côté instance : seul
+    # le nombre de fichiers remonte (pas la liste, 456k+ chemins en musique)
+    # On utilise sed directement sur la sortie sqlite3 pour éviter les problèmes de quotes
+    mount_escaped = mount_point.rstrip('/').replace('/', '\\/')
+    write_cmd = (
+        f"{{ {sqlite_read_command(db_path, query)}\n}} "
+        f"| sed 's/^\\/Media\\//{mount_escaped}\\//' > /tmp/vfs_warmup_files.txt; "
+        "wc -l < /tmp/vfs_warmup_files.txt"
+    )
+    result = execute_command(ip, write_cmd, capture_output=True, check=False)
 
-    if not result.stdout or not result.stdout.strip():
+    count_str = (result.stdout or '').strip()
+    total = int(count_str) if count_str.isdigit() else 0
+    if total == 0:
         print(f"   ⚠️  Aucun fichier trouvé en DB pour section {section_id}")
+        execute_command(ip, "rm -f /tmp/vfs_warmup_files.txt", check=False)
         return {'total': 0, 'warmed': 0, 'errors': 0}
 
-    files = result.stdout.strip().split('\n')
-    total = len(files)
     print(f"   📊 {total} fichiers à préchauffer")
 
-    # Convertir les chemins DB (/Media/...) en chemins hôte (mount_point/...)
-    # et écrire dans un fichier temporaire pour xargs
-    # On utilise sed directement sur la sortie sqlite3 pour éviter les problèmes de quotes
-    mount_escaped = mount_point.rstrip('/').replace('/', '\\/')
-    write_cmd = f"sqlite3 '{db_path}' \"{query}\" | sed 's/^\\/Media\\//{mount_escaped}\\//' > /tmp/vfs_warmup_files.txt"
-    execute_command(ip, write_cmd, check=False)
-
     # Lire 64K de chaque fichier en parallèle (4 workers)
     # -d'\\n' force xargs à séparer par ligne (gère les espaces dans les noms)
+    # Les OK/FAIL sont comptés par awk sur l'instance (une ligne en retour),
+    # puis le fichier temporaire est supprimé dans le même appel
     warmup_cmd = (
         "xargs -d'\\n' -P4 -I{} sh -c 'head -c 65536 \"{}\" > /dev/null 2>&1 && echo OK || echo FAIL' "
-        "< /tmp/vfs_warmup_files.txt"
+        "< /tmp/vfs_warmup_files.txt "
+        "| awk '{ c[$1]++ } END { printf \"%d %d\\n\", c[\"OK\"], c[\"FAIL\"] }'; "
+        "rm -f /tmp/vfs_warmup_files.txt"
     )
     warmup_result = execute_command(ip, warmup_cmd, capture_output=True, check=False, timeout=600)
 
     # Compter les résultats
-    lines = warmup_result.stdout.strip().split('\n') if warmup_result.stdout else []
-    warmed = sum(1 for l in lines if l.strip() == 'OK')
-    errors = sum(1 for l in lines if l.strip() == 'FAIL')
-
-    # Nettoyage
-    execute_command(ip, "rm -f /tmp/vfs_warmup_files.txt", check=False)
+    counts = (warmup_result.stdout or '').split()
+    warmed = int(counts[0]) if len(counts) == 2 else 0
+    errors = int(counts[1]) if len(counts) == 2 else 0
 
     if errors > 0:
         print(f"   ⚠️  Préchauffage terminé : {warmed}/{total} OK, {errors} erreurs")
@@ -1444,6 +1948,95 @@ def warm_vfs_cache(ip, config_path, section_id, mount_point):
     return {'total': total, 'warmed': warmed, 'errors': errors}
 
 
+def refresh_vfs_dir_cache(ip, config_path, section_ids, timeout=900):
+    """
+    Préremplit le cache de répertoires rclone pour les sections avant le scan.
+
+    Lance un `vfs/refresh recursive=true` asynchrone (API rc) par dossier racine :
+    rclone enchaîne les LIST S3 en interne au lieu d'un aller-retour S3 par
+    répertoire quand le Scanner Plex parcourt l'arborescence.
+    Le montage doit avoir été lancé avec --rc (mount_s3).
+
+    Args:
+        ip: 'localhost' ou IP remote
+        config_path: Chemin vers la config Plex (contient la DB)
+        section_ids: IDs des sections à préparer
+        timeout: Attente max en secondes (le refresh continue ensuite en tâche de fond)
+
+    Returns:
+        dict: {'dirs': N, 'completed': N, 'errors': N, 'duration_seconds': int}
+    """
+    summary = {'dirs': 0, 'completed': 0, 'errors': 0, 'duration_seconds': 0}
+    if not section_ids:
+        return summary
+
+    db_path = f"{config_path}/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
+    ids_sql = ", ".join(str(int(section_id)) for section_id in section_ids)
+    query = f"SELECT DISTINCT root_path FROM section_locations WHERE library_section_id IN ({ids_sql});"
+    result = execute_command(ip, sqlite_read_command(db_path, query), capture_output=True, check=False)
+
+    # Chemins conteneur (/Media/...) → chemins relatifs à la racine du remote
+    dirs = []
+    for root_path in result.stdout.split('\n') if result.stdout else []:
+        root_path = root_path.strip().rstrip('/')
+        if root_path == '/Media':
+            dirs.append('')
+        elif root_path.startswith('/Media/'):
+            dirs.append(root_path[len('/Media/'):])
+
+    if not dirs:
+        print("   ⚠️  Aucun dossier /Media à rafraîchir")
+        return summary
+
+    summary['dirs'] = len(dirs)
+    rc_cmd = f"rclone rc --url http://{RCLONE_RC_ADDR}/"
+    start_time = time.time()
+    print(f"📂 [{time.strftime('%H:%M:%S')}] Préchargement du cache de répertoires rclone ({len(dirs)} dossier(s))...")
+
+    # Lancement asynchrone : un job rclone par dossier
+    jobs = {}
+    for directory in dirs:
+        dir_arg = shlex.quote(f"dir={directory}") if directory else ""
+        launch = execute_command(
+            ip, f"{rc_cmd} vfs/refresh recursive=true {dir_arg} _async=true",
+            capture_output=True, check=False
+        )
+        try:
+            jobs[json.loads(launch.stdout)['jobid']] = directory or '/'
+        except (ValueError, KeyError, TypeError):
+            summary['errors'] += 1
+            print(f"   ⚠️  vfs/refresh refusé pour '{directory or '/'}': {(launch.stderr or launch.stdout).strip()[:200]}")
+
+    # Attente de fin des jobs (backoff : les gros arbres prennent plusieurs minutes)
+    backoff = PollBackoff(initial=2, max_interval=30)
+    while jobs and time.time() - start_time < timeout:
+        backoff.sleep()
+        for jobid, directory in list(jobs.items()):
+            status = execute_command(ip, f"{rc_cmd} job/status jobid={jobid}", capture_output=True, check=False)
+            try:
+                job = json.loads(status.stdout)
+            except ValueError:
+                continue
+            if not job.get('finished'):
+                continue
+
+            del jobs[jobid]
+            if job.get('success'):
+                summary['completed'] += 1
+                print(f"   ✅ '{directory}' en cache ({job.get('duration', 0):.0f}s)")
+            else:
+                summary['errors'] += 1
+                print(f"   ⚠️  '{directory}': {job.get('error', 'erreur inconnue')}")
+
+    summary['duration_seconds'] = int(time.time() - start_time)
+    if jobs:
+        print(f"   ⏳ {len(jobs)} refresh encore en cours après {timeout}s (poursuivis en arrière-plan)")
+    else:
+        print(f"   ✅ Cache de répertoires prêt en {summary['duration_seconds']}s")
+
+    return summary
+
+
 def trigger_section_scan(ip, container, plex_token, section_id, force=False):
     """
     Déclenche le scan d'UNE section.
@@ -1498,10 +2091,176 @@ def trigger_section_analyze(ip, container, plex_token, section_id):
         return False
 
 
+def process_other_section(ip, plex_token, section_name, info, force=False, analyze=True,
+                          warm_cache=False, timeout=3600, health_check_fn=None, stop_event=None,
+                          config_path='/opt/plex_data/config', mount_point='/opt/media'):
+    """
+    Scan + analyse d'une section non-musicale (avec préchauffage VFS optionnel).
+
+    Utilisée en boucle séquentielle (défaut) ou dans un ThreadPoolExecutor
+    (--parallel-sections N). Les appels sont des I/O (SSH/HTTP), pas de GIL.
+
+    Une attente non aboutie (timeout ou montage défaillant) rend la section
+    non terminée. Si le montage S3 est en cause (health_check_fn), stop_event
+    est levé pour que les sections suivantes ne démarrent pas sur un montage cassé.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        plex_token: Token d'authentification Plex
+        section_name: Titre de la section
+        info: dict {'id', 'type'} (cf. parse_library_sections)
+        force: Scan profond (force=1)
+        analyze: Lancer l'analyse après le scan
+        warm_cache: Préchauffer le cache VFS avant l'analyse
+        timeout: Timeout de chaque attente (scan, analyse) en secondes
+        health_check_fn: Fonction de vérification du montage (optionnel)
+        stop_event: threading.Event partagé entre sections (optionnel)
+        config_path: Chemin config Plex sur l'hôte
+        mount_point: Point de montage S3 sur l'hôte (cf. warm_vfs_cache)
+
+    Returns:
+        dict: {'section': str, 'duration_minutes': float, 'completed': bool}
+    """
+    start_time = time.time()
+
+    def _result(completed):
+        return {
+            'section': section_name,
+            'duration_minutes': round((time.time() - start_time) / 60, 1),
+            'completed': completed
+        }
+
+    def _check_mount():
+        # Montage défaillant : arrêter aussi les sections suivantes
+        if health_check_fn is None or stop_event is None:
+            return
+        if not health_check_fn().get('healthy', True):
+            stop_event.set()
+
+    def _cancelled():
+        if stop_event is not None and stop_event.is_set():
+            print(f"\n   ⏭️  '{section_name}' annulée (montage S3 défaillant)")
+            return True
+        return False
+
+    # Scan de la section
+    if _cancelled():
+        return _result(False)
+    print(f"\n   🔍 Scan de '{section_name}' (ID: {info['id']}, type: {info['type']})")
+    trigger_section_scan(ip, 'plex', plex_token, info['id'], force=force)
+    idle = wait_section_idle(ip, 'plex', plex_token, info['id'],
+                             section_type=info['type'], phase='scan',
+                             config_path=config_path, timeout=timeout,
+                             health_check_fn=health_check_fn)
+    if not idle:
+        _check_mount()
+        return _result(False)
+
+    if not analyze:
+        return _result(True)
+
+    # Préchauffage du cache VFS avant analyse
+    if warm_cache:
+        warm_vfs_cache(ip, config_path, info['id'], mount_point)
+
+    # Analyse de la section
+    if _cancelled():
+        return _result(False)
+    print(f"\n   🔬 Analyse de '{section_name}' (ID: {info['id']})")
+    trigger_section_analyze(ip, 'plex', plex_token, info['id'])
+    idle = wait_section_idle(ip, 'plex', plex_token, info['id'],
+                             section_type=info['type'], phase='analyze',
+                             config_path=config_path, timeout=timeout,
+                             health_check_fn=health_check_fn)
+    if not idle:
+        _check_mount()
+        return _result(False)
+
+    return _result(True)
+
+
+def run_other_sections(ip, plex_token, sections, max_workers=1, health_check_fn=None,
+                       **section_kwargs):
+    """
+    Traite les sections non-musicales (process_other_section), en séquentiel
+    ou dans un ThreadPoolExecutor (--parallel-sections N).
+
+    Une section est en échec si elle lève une exception, n'aboutit pas
+    (completed=False : timeout, montage défaillant) ou est annulée avant
+    de démarrer. Le pool est toujours drainé avant le retour.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        plex_token: Token d'authentification Plex
+        sections: Liste de (section_name, info)
+        max_workers: 1 = séquentiel, N > 1 = parallèle
+        health_check_fn: Fonction de vérification du montage (optionnel)
+        **section_kwargs: Options transmises à process_other_section()
+
+    Returns:
+        tuple: (sections terminées, sections en échec) - listes de noms
+    """
+    stop_event = threading.Event()
+    completed, failed = [], []
+
+    def _record(section_name, get_result):
+        try:
+            section_result = get_result()
+        except Exception as e:
+            print(f"\n   ❌ '{section_name}' en échec: {e}")
+            failed.append(section_name)
+            return
+        if section_result['completed']:
+            print(f"\n   ✅ '{section_name}' terminée ({section_result['duration_minutes']} min)")
+            completed.append(section_name)
+        else:
+            print(f"\n   ⚠️  '{section_name}' interrompue ({section_result['duration_minutes']} min)")
+            failed.append(section_name)
+
+    if max_workers == 1:
+        for section_name, info in sections:
+            _record(section_name, lambda: process_other_section(
+                ip, plex_token, section_name, info, health_check_fn=health_check_fn,
+                stop_event=stop_event, **section_kwargs))
+    else:
+        # Opt-in : le traitement parallèle a été instable par le passé
+        # (contention CPU/I/O), réservé aux grosses instances
+        print("   ⚠️  Mode expérimental : les logs des sections sont entrelacés")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(process_other_section, ip, plex_token, section_name, info,
+                            health_check_fn=health_check_fn, stop_event=stop_event,
+                            **section_kwargs): section_name
+                for section_name, info in sections
+            }
+            for future in as_completed(futures):
+                section_name = futures[future]
+                if future.cancelled():
+                    print(f"\n   ⏭️  '{section_name}' annulée (montage S3 défaillant)")
+                    failed.append(section_name)
+                    continue
+                _record(section_name, future.result)
+
+                # Montage défaillant : ne pas démarrer les sections en attente
+                if stop_event.is_set():
+                    for pending in futures:
+                        pending.cancel()
+
+    if stop_event.is_set():
+        print("\n⚠️  Sections restantes interrompues : montage S3 défaillant")
+
+    return completed, failed
+
+
 def export_intermediate(ip, container, config_path, output_dir, label="checkpoint"):
     """
     Export de sécurité après une phase critique (export à chaud, sans arrêter Plex).
 
+    Ne contient que l'état courant de la DB (db, blobs, WAL) : les sauvegardes
+    datées que Plex crée lui-même dans le dossier Databases (*.db-AAAA-MM-JJ)
+    sont exclues, elles doublent la taille sans rien apporter au point de reprise.
+
     Args:
         ip: 'localhost' ou IP remote
         container: Nom du conteneur
@@ -1513,7 +2272,7 @@ def export_intermediate(ip, container, config_path, output_dir, label="checkpoin
         str: Chemin de l'archive ou None si échec
     """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    archive_name = f"plex_{label}_{timestamp}.tar.gz"
+    archive_name = f"plex_{label}_{timestamp}{ARCHIVE_EXT}"
 
     print(f"💾 Export intermédiaire ({label})...")
 
@@ -1522,12 +2281,11 @@ def export_intermediate(ip, container, config_path, output_dir, label="checkpoin
     else:
         archive_path = f"/tmp/{archive_name}"
 
-    # Export DB only (pas de Metadata, trop lourd)
-    db_path = f"{config_path}/Library/Application Support/Plex Media Server/Plug-in Support/Databases"
-
+    # Export DB only (pas de Metadata, trop lourd), sans les backups Plex datés
     tar_cmd = f"""
-        tar -czf {archive_path} \
+        tar {tar_compress_option(archive_path)} -cf {archive_path} \
         --ignore-failed-read \
+        --exclude='*.db-[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' \
         -C '{config_path}/Library/Application Support/Plex Media Server' \
         'Plug-in Support/Databases' \
         2>/dev/null || echo 'Erreur tar'
@@ -1567,7 +2325,7 @@ def export_metadata(ip, container='plex', archive_name=None, config_path=None):
     """
     if not archive_name:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        archive_name = f"plex_metadata_{timestamp}.tar.gz"
+        archive_name = f"plex_metadata_{timestamp}{ARCHIVE_EXT}"
 
     print(f"\n📦 Export des métadonnées Plex...")
 
@@ -1581,13 +2339,13 @@ def export_metadata(ip, container='plex', archive_name=None, config_path=None):
             archive_path = f"./{archive_name}"
 
             tar_cmd = f"""
-                tar -czf {archive_path} \
+                tar {tar_compress_option(archive_path)} -cf {archive_path} \
                 --ignore-failed-read \
                 -C '{base_path}' \
                 'Plug-in Support/Databases' \
                 'Metadata' \
                 'Media' 2>/dev/null || \
-                tar -czf {archive_path} \
+                tar {tar_compress_option(archive_path)} -cf {archive_path} \
                 --ignore-failed-read \
                 -C '{base_path}' \
                 'Plug-in Support/Databases' \
@@ -1612,13 +2370,13 @@ def export_metadata(ip, container='plex', archive_name=None, config_path=None):
             archive_path = f"/root/{archive_name}"
 
             tar_cmd = f"""
-                tar -czf {archive_path} \
+                tar {tar_compress_option(archive_path)} -cf {archive_path} \
                 --ignore-failed-read \
                 -C '{base_path}' \
                 'Plug-in Support/Databases' \
                 'Metadata' \
                 'Media' 2>/dev/null || \
-                tar -czf {archive_path} \
+                tar {tar_compress_option(archive_path)} -cf {archive_path} \
                 --ignore-failed-read \
                 -C '{base_path}' \
                 'Plug-in Support/Databases' \
@@ -1636,3 +2394,28 @@ def export_metadata(ip, container='plex', archive_name=None, config_path=None):
     except Exception as e:
         print(f"   ❌ Échec de l'export : {e}")
         return None
+
+
+def stream_export_metadata(ip, local_path, config_path='/opt/plex_data/config'):
+    """
+    Variante de export_metadata() qui streame l'archive vers la machine locale.
+
+    Même contenu (Databases, Metadata, Media) mais sans archive intermédiaire
+    sur l'instance : utile quand le disque ne peut pas contenir DB + archive.
+
+    Args:
+        ip: IP de l'instance
+        local_path: Chemin de l'archive locale
+        config_path: Chemin du volume config Plex sur l'instance
+
+    Returns:
+        str: Chemin de l'archive locale, ou None en cas d'échec
+    """
+    print(f"\n📦 Export des métadonnées Plex (stream direct)...")
+
+    base_path = f"{config_path}/Library/Application Support/Plex Media Server"
+    members = ['Plug-in Support/Databases', 'Metadata', 'Media']
+
+    if stream_tar_download(ip, base_path, members, local_path):
+        return local_path
+    return None
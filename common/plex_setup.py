@@ -5,9 +5,32 @@ Gestion du cycle de vie Plex : montage, démarrage, configuration
 import time
 import os
 import re
+import select
+import shlex
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from .executor import execute_command, docker_exec, transfer_file_to_remote, execute_script
-from .config import get_rclone_config_path, get_rclone_profile, get_rclone_remote_name
+from .executor import execute_command, docker_exec, transfer_file_to_remote, download_file_from_remote, execute_script, popen_command, PollBackoff
+from .plex_scan import parse_library_sections
+from .config import get_rclone_config_path, get_rclone_profile, get_rclone_remote_name, RCLONE_RC_ADDR, LOG_ARCHIVE_COMPRESSLEVEL
+
+
+# === PATTERNS XML (compilés une fois à l'import) ===
+USERNAME_ATTR_PATTERN = re.compile(r'username="([^"]+)"')
+SUBSCRIPTION_ACTIVE_PATTERN = re.compile(r'subscriptionActive="([^"]+)"')
+SUBSCRIPTION_STATE_PATTERN = re.compile(r'subscriptionState="([^"]+)"')
+SUBSCRIPTION_PLAN_PATTERN = re.compile(r'subscriptionPlan="([^"]+)"')
+FEATURE_ID_PATTERN = re.compile(r'<Feature id="([^"]+)"')
+CLAIMED_ATTR_PATTERN = re.compile(r'claimed="([01])"')
+
+# Sonde de wait_plex_fully_ready : corps /identity, code HTTP, nb de processus
+IDENTITY_PROBE_PATTERN = re.compile(r'(?P<body>.*)\n(?P<code>\d{3})\n(?P<procs>\d+)\s*$', re.DOTALL)
+
+# Format des tokens https://www.plex.tv/claim (ex: claim-AbCd1234...)
+PLEX_CLAIM_PATTERN = re.compile(r'claim-[A-Za-z0-9_-]{20,}')
+
 
 def apply_system_optimizations(ip):
     """
@@ -131,6 +154,50 @@ def mount_s3(ip, rclone_remote, profile='lite', mount_point='/mnt/s3-media', cac
 
     config = get_rclone_profile(profile)
 
+    # Lectures de chunks en parallèle (rclone ≥ 1.68) : masque la latence S3 par
+    # requête sur les gros fichiers (Sonic). Omis à 0 pour les rclone plus anciens.
+    read_chunk_streams = ""
+    if config['read_chunk_streams'] != '0':
+        read_chunk_streams = f"\n  --vfs-read-chunk-streams {config['read_chunk_streams']} \\"
+
+    # S3 ne supporte pas ChangeNotify : --poll-interval 0 évite un polling inutile.
+    # --vfs-fast-fingerprint : pas de hash/modtime S3 supplémentaire à chaque ouverture.
+    # --rc (127.0.0.1 uniquement) : permet vfs/refresh pour préremplir le cache de répertoires.
+    rclone_cmd = f"""rclone mount {remote_name}:{rclone_remote} {mount_point} \\
+  --config {config_path} \\
+  --cache-dir={cache_dir} \\
+  --vfs-cache-mode full \\
+  --vfs-cache-max-size {config['cache_size']} \\
+  --vfs-cache-max-age 72h \\
+  --vfs-cache-poll-interval 10s \\
+  --vfs-fast-fingerprint \\
+  --vfs-read-ahead {config['read_ahead']} \\
+  --vfs-read-chunk-size {config['read_chunk']} \\
+  --vfs-read-chunk-size-limit 1G \\{read_chunk_streams}
+  --buffer-size {config['buffer_size']} \\
+  --transfers {config['transfers']} \\
+  --checkers {config['checkers']} \\
+  --timeout {config['timeout']} \\
+  --contimeout {config['contimeout']} \\
+  --low-level-retries {config['low_level_retries']} \\
+  --retries {config['retries']} \\
+  --retries-sleep {config['retries_sleep']} \\
+  --dir-cache-time {config['dir_cache']} \\
+  --attr-timeout {config['attr_timeout']} \\
+  --poll-interval 0 \\
+  --rc \\
+  --rc-addr {RCLONE_RC_ADDR} \\
+  --rc-no-auth \\
+  --s3-no-head \\
+  --no-checksum \\
+  --allow-other \\
+  --uid 1000 \\
+  --gid 1000 \\
+  --log-level INFO \\
+  --log-file={log_file} \\
+  --stats 5m \\
+  --stats-log-level INFO"""
+
     mount_script = f"""#!/bin/bash
 set -e
 
@@ -163,39 +230,14 @@ if ! grep -q "^user_allow_other" /etc/fuse.conf 2>/dev/null; then
 fi
 
 echo "🔧 Lancement du montage rclone..."
-nohup rclone mount {remote_name}:{rclone_remote} {mount_point} \\
-  --config {config_path} \\
-  --cache-dir={cache_dir} \\
-  --vfs-cache-mode full \\
-  --vfs-cache-max-size {config['cache_size']} \\
-  --vfs-cache-max-age 72h \\
-  --vfs-read-ahead {config['buffer_size']} \\
-  --vfs-read-chunk-size {config['read_chunk']} \\
-  --vfs-read-chunk-size-limit 1G \\
-  --buffer-size {config['buffer_size']} \\
-  --transfers {config['transfers']} \\
-  --checkers {config['checkers']} \\
-  --timeout {config['timeout']} \\
-  --contimeout {config['contimeout']} \\
-  --low-level-retries {config['low_level_retries']} \\
-  --retries {config['retries']} \\
-  --retries-sleep {config['retries_sleep']} \\
-  --dir-cache-time {config['dir_cache']} \\
-  --attr-timeout {config['attr_timeout']} \\
-  --poll-interval 1m \\
-  --s3-no-head \\
-  --no-checksum \\
-  --allow-other \\
-  --uid 1000 \\
-  --gid 1000 \\
-  --log-level INFO \\
-  --log-file={log_file} \\
-  --stats 5m \\
-  --stats-log-level INFO \\
+nohup {rclone_cmd} \\
   --daemon </dev/null >/dev/null 2>&1 &
 
-echo "⏳ Attente de stabilisation du montage (10s)..."
-sleep 10
+echo "⏳ Attente du montage (10s max)..."
+for i in $(seq 1 20); do
+    mountpoint -q {mount_point} && break
+    sleep 0.5
+done
 
 # Vérifications multiples
 echo "🔍 Vérification 1: mountpoint"
@@ -212,8 +254,9 @@ if ! stat {mount_point} > /dev/null 2>&1; then
 fi
 echo "✅ stat OK"
 
+# Un seul listing (lecture + permissions) : un seul LIST S3 si le cache est froid
 echo "🔍 Vérification 3: ls (test de lecture)"
-if ! ls {mount_point} > /dev/null 2>&1; then
+if ! listing=$(ls -la {mount_point} 2>/dev/null); then
     echo "❌ Impossible de lire le contenu du point de montage"
     tail -20 {log_file}
     exit 1
@@ -221,48 +264,116 @@ fi
 echo "✅ ls OK"
 
 echo "🔍 Vérification 4: Permissions"
-ls -la {mount_point} | head -5
+echo "$listing" | head -5
 
 echo "✅ Montage S3 complet et validé"
 """
 
-    print(f"""
-rclone mount {remote_name}:{rclone_remote} {mount_point} \\
-    --config {config_path} \\
-    --cache-dir={cache_dir} \\
-    --vfs-cache-mode full \\
-    --vfs-cache-max-size {config['cache_size']} \\
-    --vfs-cache-max-age 72h \\
-    --vfs-read-ahead {config['buffer_size']} \\
-    --vfs-read-chunk-size {config['read_chunk']} \\
-    --vfs-read-chunk-size-limit 1G \\
-    --buffer-size {config['buffer_size']} \\
-    --transfers {config['transfers']} \\
-    --checkers {config['checkers']} \\
-    --timeout {config['timeout']} \\
-    --contimeout {config['contimeout']} \\
-    --low-level-retries {config['low_level_retries']} \\
-    --retries {config['retries']} \\
-    --retries-sleep {config['retries_sleep']} \\
-    --dir-cache-time {config['dir_cache']} \\
-    --attr-timeout {config['attr_timeout']} \\
-    --poll-interval 1m \\
-    --s3-no-head \\
-    --no-checksum \\
-    --allow-other \\
-    --uid 1000 \\
-    --gid 1000 \\
-    --log-level INFO \\
-    --log-file={log_file} \\
-    --stats 5m \\
-    --stats-log-level INFO \\
-    --daemon
-    """)
+    print(f"\n{rclone_cmd} \\\n  --daemon\n")
 
     execute_script(ip, mount_script, '/tmp/mount_s3.sh')
     print(f"✅ S3 monté et accessible par Docker sur {mount_point}")
 
 
+def prompt_plex_claim(timeout=900):
+    """
+    Demande le PLEX_CLAIM avec validation du format et délai maximum.
+
+    Le token n'est valide que ~4 minutes : il doit être saisi juste avant
+    le démarrage de Plex, donc instance déjà provisionnée. Le délai évite
+    qu'une instance facturée attende indéfiniment une saisie ; une saisie
+    mal formée est redemandée plutôt que d'abandonner le run.
+
+    Args:
+        timeout: Délai maximum de saisie en secondes (défaut: 15min)
+
+    Returns:
+        str: Token valide, ou None si délai dépassé / saisie vide / EOF
+    """
+    deadline = time.monotonic() + timeout
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"\n⏰ Aucun PLEX_CLAIM saisi en {timeout // 60}min")
+            return None
+
+        print("\n🔑 Entrez votre PLEX_CLAIM (depuis https://www.plex.tv/claim) : ", end='', flush=True)
+        ready, _, _ = select.select([sys.stdin], [], [], remaining)
+        if not ready:
+            print(f"\n⏰ Aucun PLEX_CLAIM saisi en {timeout // 60}min")
+            return None
+
+        line = sys.stdin.readline()
+        if not line:
+            return None
+
+        plex_claim = line.strip()
+        if not plex_claim:
+            return None
+        if PLEX_CLAIM_PATTERN.fullmatch(plex_claim):
+            return plex_claim
+
+        print("   ⚠️  Format invalide (attendu: claim-XXXXXXXXXXXXXXXXXXXX), réessayez")
+
+
+def _pull_plex_image(ip, version):
+    """docker pull de l'image Plex, sans affichage (exécuté dans un thread)."""
+    image = f"plexinc/pms-docker:{version}"
+    result = execute_command(ip, f"docker pull {image}", capture_output=True, check=False)
+    output = f"{result.stdout or ''}{result.stderr or ''}".lower()
+    return {
+        'image': image,
+        'success': result.returncode == 0,
+        'up_to_date': 'up to date' in output
+    }
+
+
+def start_plex_image_pull(ip, version='latest'):
+    """
+    Lance le pull de l'image Plex en arrière-plan.
+
+    Le téléchargement (plusieurs minutes si l'image n'est pas en cache)
+    chevauche l'injection DB et le montage S3 au lieu de les précéder.
+    Le résultat est attendu par report_plex_image_pull() avant le PLEX_CLAIM,
+    pour que docker run ne consomme pas la durée de vie du token.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        version: Tag de l'image plexinc/pms-docker
+
+    Returns:
+        concurrent.futures.Future: Résultat {'image', 'success', 'up_to_date'}
+    """
+    print(f"🐳 Pull de l'image Docker plexinc/pms-docker:{version} en arrière-plan...")
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(_pull_plex_image, ip, version)
+    pool.shutdown(wait=False)
+    return future
+
+
+def report_plex_image_pull(future):
+    """
+    Attend la fin du pull lancé par start_plex_image_pull() et affiche le résultat.
+
+    Returns:
+        bool: True si l'image est disponible
+    """
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"   ⚠️  Pull échoué ({e}), docker run tentera le téléchargement")
+        return False
+
+    if not result['success']:
+        print("   ⚠️  Pull échoué, docker run tentera le téléchargement")
+    elif result['up_to_date']:
+        print(f"   ✅ Image {result['image']} déjà à jour")
+    else:
+        print(f"   ✅ Image {result['image']} téléchargée")
+    return result['success']
+
+
 def start_plex_container(ip, claim_token, version='latest', container_name='plex',
                         config_path='/opt/plex_data/config',
                         media_path='/mnt/s3-media',
@@ -342,8 +453,16 @@ docker run -d \\
     -v "{transcode_path}:/transcode" \\
     plexinc/pms-docker:{version}
 
-echo "⏳ Attente de stabilisation (60s)..."
-sleep 60
+# Sonde /identity (port publié sur l'hôte) plutôt qu'une pause fixe :
+# on rend la main dès que Plex écoute, au plus 60s comme avant
+echo "⏳ Attente de l'API Plex (60s max)..."
+for i in $(seq 1 30); do
+    if curl -sf -o /dev/null --max-time 2 http://localhost:32400/identity; then
+        echo "✅ API Plex joignable après ~$((i * 2))s"
+        break
+    fi
+    sleep 2
+done
 
 echo "✅ Conteneur Plex lancé"
 docker logs "{container_name}" 2>&1 | tail -20
@@ -536,6 +655,7 @@ def wait_plex_ready(ip, container='plex', timeout=180):
     print("⏳ Attente du démarrage complet de Plex...")
 
     start_time = time.time()
+    backoff = PollBackoff(initial=1, max_interval=5)
 
     while time.time() - start_time < timeout:
         elapsed = int(time.time() - start_time)
@@ -547,7 +667,7 @@ def wait_plex_ready(ip, container='plex', timeout=180):
         if docker_result.returncode != 0 or docker_result.stdout.strip() != 'true':
             if elapsed % 10 == 0:  # Log toutes les 10s
                 print(f"   ⏳ [{elapsed}s] Conteneur pas encore démarré...")
-            time.sleep(5)
+            backoff.sleep()
             continue
 
         # 2. Vérifier l'API Plex via docker exec curl (plus fiable que requests)
@@ -562,7 +682,7 @@ def wait_plex_ready(ip, container='plex', timeout=180):
         if elapsed > 0 and elapsed % 30 == 0:
             print(f"   ⏳ API Plex pas encore prête... ({elapsed}s/{timeout}s)")
 
-        time.sleep(5)
+        backoff.sleep()
 
     raise TimeoutError(f"❌ Plex n'a pas démarré dans les {timeout}s")
 
@@ -575,6 +695,8 @@ def wait_plex_fully_ready(ip, container='plex', timeout=300):
     1. L'API /identity répond HTTP 200 avec claimed="1"
     2. Au moins 3 processus Plex actifs dans le conteneur
 
+    Polling en backoff (2s → 30s), réinitialisé dès que le statut API change.
+
     Args:
         ip: 'localhost' ou IP remote
         container: Nom du conteneur
@@ -588,25 +710,33 @@ def wait_plex_fully_ready(ip, container='plex', timeout=300):
     last_api_status = "inconnu"
     last_api_response = ""
     is_claimed = False
+    backoff = PollBackoff(initial=2, max_interval=30)
 
     while time.time() - start_time < timeout:
         elapsed = int(time.time() - start_time)
 
-        # Vérifier que Plex répond ET que le serveur est claimé
-        cmd = "curl -s -w '\\n%{http_code}' http://localhost:32400/identity 2>&1"
-        result = docker_exec(ip, container, cmd, capture_output=True, check=False)
+        # API /identity (claim) + processus Plex : un seul aller-retour SSH
+        cmd = (
+            f"docker exec {container} curl -s -w '\\n%{{http_code}}\\n' http://localhost:32400/identity 2>&1; "
+            f"docker exec {container} ps aux | grep -i plex | grep -v grep | wc -l"
+        )
+        result = execute_command(ip, cmd, capture_output=True, check=False)
 
-        # Parser la réponse : body + code HTTP
-        lines = result.stdout.strip().split('\n')
-        http_code = lines[-1] if lines else "0"
-        api_body = '\n'.join(lines[:-1]) if len(lines) > 1 else ""
+        # Parser la sonde : body + code HTTP + nombre de processus
+        match = IDENTITY_PROBE_PATTERN.search(result.stdout or '')
+        api_body = match.group('body') if match else ""
+        http_code = match.group('code') if match else "0"
+        plex_processes = int(match.group('procs')) if match else 0
         last_api_response = api_body[:200]
 
         # Analyser le statut de l'API - vérifier le claim
-        if http_code == "200" and 'claimed="1"' in api_body:
+        previous_api_status = last_api_status
+        claimed_match = CLAIMED_ATTR_PATTERN.search(api_body)
+        claimed = claimed_match.group(1) if claimed_match else None
+        if http_code == "200" and claimed == "1":
             last_api_status = "OK (claimé)"
             is_claimed = True
-        elif http_code == "200" and 'claimed="0"' in api_body:
+        elif http_code == "200" and claimed == "0":
             last_api_status = "Non claimé (PLEX_CLAIM invalide/expiré?)"
             is_claimed = False
         elif http_code == "200":
@@ -619,11 +749,6 @@ def wait_plex_fully_ready(ip, container='plex', timeout=300):
             last_api_status = "pas de réponse"
             is_claimed = False
 
-        # Vérifier aussi les processus système Plex
-        processes_cmd = "ps aux | grep -i plex | grep -v grep | wc -l"
-        processes_result = docker_exec(ip, container, processes_cmd, capture_output=True, check=False)
-        plex_processes = int(processes_result.stdout.strip()) if processes_result.stdout.strip().isdigit() else 0
-
         # Critère de succès : serveur claimé + au moins 3 processus
         if is_claimed and plex_processes >= 3:
             print(f"✅ Plex complètement initialisé après {elapsed}s")
@@ -631,7 +756,9 @@ def wait_plex_fully_ready(ip, container='plex', timeout=300):
 
         # Log de progression avec détails
         print(f"   [{elapsed}s] Processus: {plex_processes}, API: {last_api_status}")
-        time.sleep(30)
+        if last_api_status != previous_api_status:
+            backoff.reset()  # Plex progresse : re-poll rapide
+        backoff.sleep()
 
     # Timeout atteint - diagnostic détaillé
     print(f"\n⚠️  Plex n'est pas complètement initialisé après {timeout}s")
@@ -663,6 +790,7 @@ def wait_plex_ready_for_libraries(ip, container, plex_token, timeout=120):
     print("⏳ Attente que Plex soit prêt pour les bibliothèques...")
 
     start = time.time()
+    backoff = PollBackoff(initial=1, max_interval=5)
     while time.time() - start < timeout:
         # Test si on peut créer une bibliothèque test
         cmd = f"curl -s 'http://localhost:32400/library/sections' -H 'X-Plex-Token: {plex_token}'"
@@ -674,22 +802,24 @@ def wait_plex_ready_for_libraries(ip, container, plex_token, timeout=120):
             time.sleep(5)  # Sécurité supplémentaire
             return True
 
-        time.sleep(5)
+        backoff.sleep()
 
     print("⚠️ Timeout")
     return False
 
 
-def add_library(ip, container, library_config, plex_token):
-    """Version ultra simple pour debug"""
-    title = library_config['title']
-    print(f"📚 Ajout de '{title}'...")
+def _library_create_url(library_config, plex_token):
+    """
+    URL de création d'une bibliothèque (paramètres GET encodés).
 
+    Returns:
+        tuple: (url, location)
+    """
     # Utiliser une URL simple avec paramètres GET (plus fiable que POST avec -F)
     from urllib.parse import quote
 
     params = {
-        'name': title,
+        'name': library_config['title'],
         'type': library_config['type'],
         'agent': library_config.get('agent', 'tv.plex.agents.movie'),
         'scanner': library_config.get('scanner', 'Plex Movie'),
@@ -704,15 +834,25 @@ def add_library(ip, container, library_config, plex_token):
     #     params['scanner'] = "Plex Series Scanner"
     #     params['language'] = "fr-FR"
 
-    # Construire l'URL avec paramètres
+    # Construire l'URL avec paramètres (quote encode aussi les apostrophes)
     url_params = '&'.join([f"{k}={quote(str(v))}" for k, v in params.items()])
-    curl_cmd = f"curl -X POST 'http://localhost:32400/library/sections?{url_params}&X-Plex-Token={plex_token}'"
+    url = f"http://localhost:32400/library/sections?{url_params}&X-Plex-Token={plex_token}"
+    return url, params['location']
+
+
+def add_library(ip, container, library_config, plex_token):
+    """Version ultra simple pour debug"""
+    title = library_config['title']
+    print(f"📚 Ajout de '{title}'...")
+
+    url, location = _library_create_url(library_config, plex_token)
+    curl_cmd = f"curl -X POST '{url}'"
 
     result = docker_exec(ip, container, curl_cmd, capture_output=True, check=False)
 
     # Debug : toujours voir ce qui se passe
     if result.stdout:
-        print(f"   Location: {params['location']}")
+        print(f"   Location: {location}")
         print(f"   Réponse: {result.stdout[:200]}")
     if result.stderr:
         print(f"   Erreur: {result.stderr[:200]}")
@@ -730,6 +870,68 @@ def add_library(ip, container, library_config, plex_token):
         return False
 
 
+def add_libraries(ip, container, libraries, plex_token, timeout=30):
+    """
+    Crée toutes les bibliothèques en un seul appel, puis attend qu'elles soient visibles.
+
+    Les POST partent dans un seul docker exec (un aller-retour SSH pour N
+    bibliothèques, sans pause fixe entre elles) ; la visibilité est ensuite
+    vérifiée par un poll de /library/sections jusqu'à ce que tous les titres
+    apparaissent.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        container: Nom du conteneur
+        libraries: Liste des configs de bibliothèques (plex_libraries.json)
+        plex_token: Token d'authentification Plex
+        timeout: Délai max d'apparition des bibliothèques en secondes
+
+    Returns:
+        dict: {'created': [titres visibles], 'missing': [titres absents]}
+    """
+    if not libraries:
+        return {'created': [], 'missing': []}
+
+    # Une ligne par bibliothèque : "<index> <code HTTP>"
+    lines = []
+    for index, lib in enumerate(libraries):
+        url, location = _library_create_url(lib, plex_token)
+        print(f"📚 Ajout de '{lib['title']}' ({location})...")
+        lines.append(f"printf '{index} '; curl -s -o /dev/null -w '%{{http_code}}\\n' -X POST '{url}'")
+    script = "\n".join(lines)
+
+    result = execute_command(
+        ip, f"docker exec {container} sh -c {shlex.quote(script)}",
+        capture_output=True, check=False
+    )
+    for line in (result.stdout or '').splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0].isdigit() and parts[1] != '200':
+            print(f"   ⚠️  '{libraries[int(parts[0])]['title']}' : HTTP {parts[1]}")
+
+    # Attendre que toutes les bibliothèques soient visibles
+    pending = [lib['title'] for lib in libraries]
+    verify_cmd = f"curl -s 'http://localhost:32400/library/sections' -H 'X-Plex-Token: {plex_token}'"
+    start = time.time()
+    backoff = PollBackoff(initial=1, max_interval=5)
+    while True:
+        verify_result = docker_exec(ip, container, verify_cmd, capture_output=True, check=False)
+        # Titres exacts des sections ("Music" ne doit pas matcher "Music Videos")
+        visible = parse_library_sections(verify_result.stdout)
+        pending = [title for title in pending if title not in visible]
+        if not pending or time.time() - start >= timeout:
+            break
+        backoff.sleep()
+
+    created = [lib['title'] for lib in libraries if lib['title'] not in pending]
+    for title in created:
+        print(f"   ✅ '{title}' créée")
+    for title in pending:
+        print(f"   ❌ '{title}' non trouvée")
+
+    return {'created': created, 'missing': pending}
+
+
 def create_library_section(ip, container, library_config, plex_token):
     """Juste la création via curl"""
     form_data = [
@@ -755,9 +957,46 @@ def create_library_section(ip, container, library_config, plex_token):
     return True
 
 
+def wait_for_section_count(ip, container, plex_token, expected, timeout=30, interval=0.5):
+    """
+    Attend que Plex expose au moins `expected` sections, toutes finalisées.
+
+    Remplace la pause fixe après création des bibliothèques : sort dès que
+    /library/sections liste le nombre attendu de sections sans aucune en
+    cours de rafraîchissement.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        container: Nom du conteneur
+        plex_token: Token d'authentification Plex
+        expected: Nombre minimal de sections attendues
+        timeout: Délai max en secondes
+        interval: Intervalle initial de poll en secondes
+
+    Returns:
+        bool: True si les sections sont prêtes, False si timeout
+    """
+    cmd = f"curl -s 'http://localhost:32400/library/sections' -H 'X-Plex-Token: {plex_token}'"
+    start = time.time()
+    backoff = PollBackoff(initial=interval, max_interval=2)
+    sections = {}
+
+    while time.time() - start < timeout:
+        result = docker_exec(ip, container, cmd, capture_output=True, check=False)
+        sections = parse_library_sections(result.stdout)
+        if len(sections) >= expected and not any(s['refreshing'] for s in sections.values()):
+            print(f"✅ {len(sections)} section(s) prête(s) en {time.time() - start:.1f}s")
+            return True
+        backoff.sleep()
+
+    print(f"⚠️ Timeout : {len(sections)}/{expected} section(s) prête(s) après {timeout}s")
+    return False
+
+
 def wait_library_visible(ip, container, title, plex_token, max_wait=30):
     """Attendre que la bibliothèque soit visible dans l'API"""
     print(f"   ⏳ Attente visibilité...")
+    section_pattern = re.compile(rf'key="(\d+)"[^>]*title="{re.escape(title)}"')
 
     for i in range(max_wait):
         time.sleep(1)
@@ -766,7 +1005,7 @@ def wait_library_visible(ip, container, title, plex_token, max_wait=30):
         result = docker_exec(ip, container, cmd, capture_output=True, check=False)
 
         # Chercher la section
-        match = re.search(rf'key="(\d+)"[^>]*title="{re.escape(title)}"', result.stdout)
+        match = section_pattern.search(result.stdout)
         if match:
             return match.group(1)
 
@@ -1017,7 +1256,7 @@ def collect_plex_logs(ip, container, output_dir="logs", prefix="plex", terminal_
         # Si on a un terminal_log, on peut quand même créer une archive avec juste ce log
         if terminal_log and os.path.exists(terminal_log):
             terminal_only_archive = os.path.join(output_dir, f"{timestamp}_terminal_{prefix}.tar.gz")
-            with tarfile.open(terminal_only_archive, 'w:gz') as tar:
+            with tarfile.open(terminal_only_archive, 'w:gz', compresslevel=LOG_ARCHIVE_COMPRESSLEVEL) as tar:
                 tar.add(terminal_log, arcname='terminal.log')
             # Supprimer le fichier terminal brut (maintenant dans l'archive)
             if not keep_terminal_log:
@@ -1063,42 +1302,33 @@ def collect_plex_logs(ip, container, output_dir="logs", prefix="plex", terminal_
     temp_dir = tempfile.mkdtemp(prefix="plex_logs_")
 
     try:
-        # Extraire l'archive Plex dans un sous-dossier
-        plex_logs_dir = os.path.join(temp_dir, "plex_logs")
-        os.makedirs(plex_logs_dir)
-
+        # Archive Plex lue en flux (pas d'extraction sur disque)
         if ip == 'localhost':
-            with tarfile.open(archive_path, 'r:gz') as tar:
-                tar.extractall(plex_logs_dir)
+            local_plex_archive = archive_path
         else:
             # Télécharger l'archive remote d'abord
             local_plex_archive = os.path.join(temp_dir, "plex_logs.tar.gz")
-            execute_command(
-                'localhost',
-                f"scp -o StrictHostKeyChecking=no root@{ip}:{archive_path} {local_plex_archive}",
-                check=False
-            )
-            if os.path.exists(local_plex_archive):
-                with tarfile.open(local_plex_archive, 'r:gz') as tar:
-                    tar.extractall(plex_logs_dir)
+            try:
+                download_file_from_remote(ip, archive_path, local_plex_archive)
+            except subprocess.CalledProcessError:
+                pass
 
         # Si rclone_log est sur un remote, le télécharger
         if has_rclone and ip != 'localhost':
             local_rclone_log = os.path.join(temp_dir, "rclone.log")
-            execute_command(
-                'localhost',
-                f"scp -o StrictHostKeyChecking=no root@{ip}:{rclone_log} {local_rclone_log}",
-                check=False
-            )
+            try:
+                download_file_from_remote(ip, rclone_log, local_rclone_log)
+            except subprocess.CalledProcessError:
+                pass
             if not os.path.exists(local_rclone_log):
                 local_rclone_log = None
                 has_rclone = False
 
         # Créer l'archive combinée
-        with tarfile.open(combined_archive, 'w:gz') as tar:
-            # Ajouter les logs Plex
-            for item in os.listdir(plex_logs_dir):
-                tar.add(os.path.join(plex_logs_dir, item), arcname=f"plex_logs/{item}")
+        with tarfile.open(combined_archive, 'w:gz', compresslevel=LOG_ARCHIVE_COMPRESSLEVEL) as tar:
+            # Ajouter les logs Plex (copie membre à membre sous plex_logs/)
+            if os.path.exists(local_plex_archive):
+                _copy_tar_members(local_plex_archive, tar, prefix="plex_logs/")
             # Ajouter le log terminal
             if has_terminal:
                 tar.add(terminal_log, arcname='terminal.log')
@@ -1120,6 +1350,11 @@ def collect_plex_logs(ip, container, output_dir="logs", prefix="plex", terminal_
 
     except Exception as e:
         print(f"   ⚠️  Erreur archive combinée: {e}")
+        # Pas d'archive combinée tronquée sous son nom final
+        try:
+            os.remove(combined_archive)
+        except FileNotFoundError:
+            pass
         # Fallback: retourner l'archive Plex seule
         if ip == 'localhost' and os.path.exists(archive_path):
             size_mb = os.path.getsize(archive_path) / (1024*1024)
@@ -1131,6 +1366,99 @@ def collect_plex_logs(ip, container, output_dir="logs", prefix="plex", terminal_
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
+def _copy_tar_members(source_archive, tar, prefix=""):
+    """
+    Copie en flux les membres d'une archive .tar.gz dans une archive ouverte en écriture.
+
+    Pas d'extraction sur disque : chaque fichier est lu depuis l'archive source
+    et écrit directement dans tar.
+
+    Args:
+        source_archive: Chemin de l'archive .tar.gz source
+        tar: tarfile.TarFile ouvert en écriture
+        prefix: Préfixe ajouté au nom de chaque membre (ex: 'plex_logs/')
+
+    Raises:
+        FileNotFoundError: Archive source absente
+        tarfile.TarError: Archive source corrompue
+    """
+    import tarfile
+
+    with tarfile.open(source_archive, 'r|gz') as source_tar:
+        for member in source_tar:
+            fileobj = source_tar.extractfile(member) if member.isfile() else None
+            if prefix:
+                member.name = f"{prefix}{os.path.normpath(member.name)}"
+            tar.addfile(member, fileobj)
+
+
+def create_final_log_archive(terminal_log_path, plex_logs_archive, run_timestamp, output_dir='logs'):
+    """
+    Crée l'archive finale combinée (logs Plex + terminal complet) en fin de run.
+
+    Copie membre à membre en flux (pas d'extraction), écriture dans un
+    fichier .part renommé atomiquement : une interruption ne laisse jamais
+    d'archive tronquée sous le nom final, et le .part est supprimé en cas
+    d'échec. Les fichiers sources absents sont gérés par exception plutôt
+    que par tests d'existence préalables. Une archive Plex illisible est
+    conservée telle quelle et l'archive finale est refaite sans elle.
+
+    Args:
+        terminal_log_path: Log terminal complet (TeeLogger déjà arrêté)
+        plex_logs_archive: Archive des logs Plex (optionnelle, supprimée après fusion)
+        run_timestamp: Horodatage du run (nom de l'archive)
+        output_dir: Répertoire de destination
+
+    Returns:
+        str: Chemin de l'archive finale, ou None si le log terminal est absent
+    """
+    import tarfile
+
+    final_archive = os.path.join(output_dir, f"{run_timestamp}_logs_final_all.tar.gz")
+    partial_archive = f"{final_archive}.part"
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"\n📦 Création archive finale combinée...")
+    try:
+        with tarfile.open(partial_archive, 'w:gz', compresslevel=LOG_ARCHIVE_COMPRESSLEVEL) as tar:
+            # Terminal en premier : son absence annule l'archive
+            tar.add(terminal_log_path, arcname=f"output_{run_timestamp}.txt")
+
+            # Logs Plex si disponibles
+            if plex_logs_archive:
+                try:
+                    _copy_tar_members(plex_logs_archive, tar)
+                except FileNotFoundError:
+                    plex_logs_archive = None
+
+        os.replace(partial_archive, final_archive)
+    except FileNotFoundError:
+        print(f"⚠️  Terminal log non trouvé: {terminal_log_path}")
+        return None
+    except (tarfile.TarError, OSError) as e:
+        if not plex_logs_archive:
+            print(f"⚠️  Échec archive finale: {e}")
+            return None
+        print(f"⚠️  Archive logs Plex illisible ({e}), conservée: {plex_logs_archive}")
+        return create_final_log_archive(terminal_log_path, None, run_timestamp, output_dir)
+    finally:
+        # Échec en cours d'écriture : pas de .part orphelin
+        try:
+            os.remove(partial_archive)
+        except FileNotFoundError:
+            pass
+
+    size_mb = os.path.getsize(final_archive) / (1024*1024)
+    print(f"   ✅ Archive finale: {final_archive} ({size_mb:.1f} MB)")
+
+    # Supprimer les sources (remplacées par l'archive combinée)
+    os.remove(terminal_log_path)
+    if plex_logs_archive:
+        os.remove(plex_logs_archive)
+
+    return final_archive
+
+
 def stop_plex(ip, container='plex', timeout=30):
     """
     Arrête proprement le conteneur Plex avec timeout et fallback
@@ -1142,6 +1470,8 @@ def stop_plex(ip, container='plex', timeout=30):
 
     Cette fonction tente d'abord un arrêt gracieux avec timeout.
     Si ça échoue, elle force l'arrêt avec docker kill.
+    docker stop est synchrone : au retour, Plex est sorti et la DB est
+    fermée, l'export peut suivre sans pause.
     """
     print(f"⏸️  Arrêt du conteneur {container}...")
 
@@ -1217,6 +1547,45 @@ def verify_rclone_mount_healthy_simple(ip, mount_point='/mnt/s3-media', timeout=
     }
 
 
+def stream_log(ip, log_file, on_line, stop_event):
+    """
+    Suit un fichier de log en continu (tail -F) et appelle on_line pour chaque ligne.
+
+    Un seul flux SSH longue durée remplace le polling périodique : les erreurs
+    sont vues dès qu'elles sont écrites.
+
+    Args:
+        ip: 'localhost' ou IP remote
+        log_file: Fichier de log à suivre (ex: /var/log/rclone.log)
+        on_line: Callback appelé avec chaque ligne (str, sans retour chariot)
+        stop_event: threading.Event arrêtant le flux quand il est positionné
+
+    Returns:
+        threading.Thread: Thread daemon de lecture (déjà démarré)
+    """
+    # exec : tail remplace le shell, terminate() l'atteint directement
+    proc = popen_command(ip, f"exec tail -n 0 -F '{log_file}' 2>/dev/null")
+
+    def reader():
+        try:
+            for line in proc.stdout:
+                if stop_event.is_set():
+                    break
+                on_line(line.rstrip('\n'))
+        finally:
+            proc.terminate()
+
+    def stopper():
+        # Débloque reader() si aucune ligne n'arrive après stop()
+        stop_event.wait()
+        proc.terminate()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    threading.Thread(target=stopper, daemon=True).start()
+    return thread
+
+
 def verify_rclone_mount_healthy(ip, mount_point='/mnt/s3-media', timeout=30):
     """
     Vérifie que le montage rclone est fonctionnel (pas de socket déconnecté).
@@ -1226,6 +1595,9 @@ def verify_rclone_mount_healthy(ip, mount_point='/mnt/s3-media', timeout=30):
     2. Lecture du contenu du répertoire (metadata)
     3. Lecture réelle d'un fichier (détecte les I/O bloqués silencieusement)
 
+    Les 3 tests s'enchaînent dans un seul appel (un aller-retour SSH par
+    check au lieu de trois) ; le script renvoie l'étape atteinte et son code.
+
     Args:
         ip: 'localhost' ou IP remote
         mount_point: Point de montage à vérifier
@@ -1241,32 +1613,6 @@ def verify_rclone_mount_healthy(ip, mount_point='/mnt/s3-media', timeout=30):
     import time as time_module
     start = time_module.time()
 
-    # Test 1: Vérifier que le point de montage existe
-    result = execute_command(ip, f"mountpoint -q {mount_point}", check=False, capture_output=True)
-    if result.returncode != 0:
-        return {
-            'healthy': False,
-            'error': f"Point de montage {mount_point} non actif",
-            'response_time': time_module.time() - start
-        }
-
-    # Test 2: Vérifier l'accès avec timeout (détecte les sockets morts)
-    test_cmd = f"timeout {timeout} ls {mount_point} > /dev/null 2>&1"
-    result = execute_command(ip, test_cmd, check=False, capture_output=True)
-
-    if result.returncode == 124:  # Timeout
-        return {
-            'healthy': False,
-            'error': f"Timeout ({timeout}s) - socket probablement déconnecté",
-            'response_time': time_module.time() - start
-        }
-    elif result.returncode != 0:
-        return {
-            'healthy': False,
-            'error': f"Erreur d'accès au montage (code {result.returncode})",
-            'response_time': time_module.time() - start
-        }
-
     # Test 3: Lecture réelle d'un fichier (pas juste metadata)
     # Détecte les cas où ls passe mais l'I/O est bloqué silencieusement
     # Note: On limite la recherche à maxdepth 3 pour éviter un scan complet du bucket
@@ -1280,26 +1626,45 @@ def verify_rclone_mount_healthy(ip, mount_point='/mnt/s3-media', timeout=30):
         fi
         if [ -n "$file" ]; then
             head -c 100 "$file" > /dev/null 2>&1
-            echo "OK: $file"
-        else
-            # Pas de fichier trouvé, mais le mount semble OK
-            echo "OK: no_file_found"
         fi
     '"""
-    result = execute_command(ip, test_read_cmd, check=False, capture_output=True)
+
+    # Tests 1 → 3 enchaînés, arrêt à la première étape en échec
+    check_cmd = f"""
+        mountpoint -q {mount_point} || {{ echo "mount 1"; exit 0; }}
+        timeout {timeout} ls {mount_point} > /dev/null 2>&1; rc=$?
+        [ $rc -eq 0 ] || {{ echo "ls $rc"; exit 0; }}
+        {test_read_cmd} > /dev/null 2>&1
+        echo "read $?"
+    """
+    result = execute_command(ip, check_cmd, check=False, capture_output=True)
 
     response_time = time_module.time() - start
 
-    if result.returncode == 124:  # Timeout sur la lecture
+    try:
+        stage, code = result.stdout.strip().splitlines()[-1].split()
+        code = int(code)
+    except (ValueError, IndexError, AttributeError):
         return {
             'healthy': False,
-            'error': f"Timeout lecture fichier ({timeout}s) - I/O bloqué",
+            'error': f"Vérification du montage impossible (code {result.returncode})",
             'response_time': response_time
         }
 
+    if stage == 'mount':
+        error = f"Point de montage {mount_point} non actif"
+    elif stage == 'ls' and code == 124:  # Timeout
+        error = f"Timeout ({timeout}s) - socket probablement déconnecté"
+    elif stage == 'ls':
+        error = f"Erreur d'accès au montage (code {code})"
+    elif code == 124:  # Timeout sur la lecture
+        error = f"Timeout lecture fichier ({timeout}s) - I/O bloqué"
+    else:
+        error = None
+
     return {
-        'healthy': True,
-        'error': None,
+        'healthy': error is None,
+        'error': error,
         'response_time': response_time
     }
 
@@ -1538,10 +1903,10 @@ def verify_plex_pass_active(ip, container='plex', plex_token=None, timeout=120,
                 continue
 
             # Parser la réponse XML
-            username_match = re.search(r'username="([^"]+)"', response)
-            sub_active_match = re.search(r'subscriptionActive="([^"]+)"', response)
-            sub_state_match = re.search(r'subscriptionState="([^"]+)"', response)
-            sub_plan_match = re.search(r'subscriptionPlan="([^"]+)"', response)
+            username_match = USERNAME_ATTR_PATTERN.search(response)
+            sub_active_match = SUBSCRIPTION_ACTIVE_PATTERN.search(response)
+            sub_state_match = SUBSCRIPTION_STATE_PATTERN.search(response)
+            sub_plan_match = SUBSCRIPTION_PLAN_PATTERN.search(response)
 
             username = username_match.group(1) if username_match else None
             sub_active = sub_active_match.group(1) if sub_active_match else "0"
@@ -1549,7 +1914,7 @@ def verify_plex_pass_active(ip, container='plex', plex_token=None, timeout=120,
             sub_plan = sub_plan_match.group(1) if sub_plan_match else None
 
             # Extraire les features premium
-            features = re.findall(r'<Feature id="([^"]+)"', response)
+            features = FEATURE_ID_PATTERN.findall(response)
 
             # Vérifier le statut
             is_active = sub_active == "1"
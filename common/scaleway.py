@@ -20,7 +20,7 @@ import time
 import json
 
 from .config import load_env
-from .executor import execute_command, read_state_file, write_state_file
+from .executor import execute_command, open_ssh_connection, read_state_file, write_state_file
 
 # === FICHIERS D'ÉTAT ===
 INSTANCE_ID_FILE = ".current_instance_id"
@@ -128,6 +128,10 @@ def wait_ssh_ready(ip, timeout=120):
     """
     Attend que SSH soit accessible sur l'instance
 
+    La sonde est la connexion maître elle-même : dès qu'elle réussit, elle
+    reste ouverte et wait_cloud_init() puis toutes les commandes suivantes
+    la réutilisent (pas de nouveau handshake à chaque poll).
+
     Args:
         ip: IP de l'instance
         timeout: Timeout en secondes (défaut: 120)
@@ -140,16 +144,8 @@ def wait_ssh_ready(ip, timeout=120):
     start_time = time.time()
 
     while time.time() - start_time < timeout:
-        result = subprocess.run(
-            ["ssh", "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null",
-             "-o", "ConnectTimeout=5", "-o", "ServerAliveInterval=30",
-             "-o", "ServerAliveCountMax=5", f"root@{ip}", "echo ok"],
-            capture_output=True,
-            text=True
-        )
-
-        if result.returncode == 0:
-            print("✅ SSH accessible")
+        if open_ssh_connection(ip):
+            print("✅ SSH accessible (connexion persistante ouverte)")
             return True
 
         time.sleep(5)
@@ -172,23 +168,27 @@ def wait_cloud_init(ip, timeout=600):
 
     start_time = time.time()
 
+    # Attente côté instance : un seul appel SSH bloque jusqu'au sentinel
+    # natif de cloud-init (au lieu d'un aller-retour toutes les 10s).
+    # Boucle externe seulement si la connexion tombe (reboot, réseau).
     while time.time() - start_time < timeout:
+        remaining = max(1, int(timeout - (time.time() - start_time)))
         result = execute_command(
             ip,
-            "[ -f /var/lib/cloud/instance/boot-finished ] && echo 'ready' || echo 'waiting'",
+            f"timeout {remaining} sh -c 'until [ -f /var/lib/cloud/instance/boot-finished ]; do sleep 2; done' "
+            "&& echo 'ready'",
             check=False,
             capture_output=True
         )
 
         if result.returncode == 0 and 'ready' in result.stdout:
-            print("✅ Cloud-init terminé")
+            elapsed = int(time.time() - start_time)
+            print(f"✅ Cloud-init terminé ({elapsed}s)")
             return True
 
         elapsed = int(time.time() - start_time)
-        if elapsed % 30 == 0:
-            print(f"   ⏳ Attente... ({elapsed}s)")
-
-        time.sleep(10)
+        print(f"   ⏳ Attente... ({elapsed}s)")
+        time.sleep(5)
 
     raise TimeoutError(f"Cloud-init n'a pas terminé dans les {timeout}s")
 
@@ -21,10 +21,21 @@ Usage:
 """
 
 # === IMPORTS ===
+import atexit
 import os
+import signal
 import sys
+import threading
 from datetime import datetime
 
+# Fichier log écrit par blocs : un thread vide le buffer toutes les N secondes
+# (et aux flush() explicites, ex: en-têtes de phase) plutôt qu'à chaque print().
+# Perte maximale en cas de kill -9 : cette fenêtre.
+LOG_FLUSH_INTERVAL = 1.0
+
+# Lignes flushées immédiatement (warnings/erreurs : les plus utiles après un crash)
+LOG_URGENT_MARKERS = ('⚠️', '❌')
+
 
 # ============================================================================
 # TEE LOGGER
@@ -49,27 +60,58 @@ class TeeLogger:
         self.original_stdout = sys.stdout
         self.original_stderr = sys.stderr
         self._started = False
+        self._lock = threading.RLock()  # Réentrant : le handler SIGTERM peut interrompre write()
+        self._dirty = False
+        self._flush_stop = threading.Event()
+        self._flush_thread = None
+        self._previous_sigterm = None
 
     def write(self, message):
         """Écrit le message au terminal ET au fichier log."""
         self.original_stdout.write(message)
-        if self.log_file:
-            self.log_file.write(message)
-            self.log_file.flush()  # Flush immédiat pour crash recovery
+        with self._lock:
+            if self.log_file:
+                self.log_file.write(message)
+                self._dirty = True
+                if any(marker in message for marker in LOG_URGENT_MARKERS):
+                    self._flush_log()
 
     def flush(self):
         """Flush les buffers (requis pour compatibilité avec print())."""
         self.original_stdout.flush()
-        if self.log_file:
+        with self._lock:
+            self._flush_log()
+
+    def _flush_log(self):
+        """Vide le buffer du fichier log s'il contient des données (lock tenu)."""
+        if self.log_file and self._dirty:
             self.log_file.flush()
+            self._dirty = False
+
+    def _periodic_flush(self):
+        """Thread de flush : vide le buffer toutes les LOG_FLUSH_INTERVAL secondes."""
+        while not self._flush_stop.wait(LOG_FLUSH_INTERVAL):
+            with self._lock:
+                self._flush_log()
+
+    def _handle_sigterm(self, signum, frame):
+        """SIGTERM : flush du log puis comportement précédent (sortie par défaut)."""
+        with self._lock:
+            self._flush_log()
+        previous = self._previous_sigterm
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            # SystemExit : déclenche les finally et atexit (footer du log)
+            raise SystemExit(128 + signum)
 
     def start(self):
         """Active la capture stdout/stderr."""
         if self._started:
             return
 
-        # Ouvrir le fichier en mode line-buffered
-        self.log_file = open(self.log_path, 'w', encoding='utf-8', buffering=1)
+        # Ouvrir le fichier avec un buffer bloc (flush géré par le thread et flush())
+        self.log_file = open(self.log_path, 'w', encoding='utf-8', buffering=65536)
 
         # Écrire header
         self.log_file.write(f"# Terminal log started at {datetime.now().isoformat()}\n")
@@ -82,21 +124,49 @@ class TeeLogger:
         sys.stderr = self
         self._started = True
 
+        self._flush_stop.clear()
+        self._flush_thread = threading.Thread(target=self._periodic_flush, daemon=True)
+        self._flush_thread.start()
+
+        # Sortie anormale (sys.exit hors finally, exception non gérée) : vider le buffer
+        atexit.register(self.stop)
+
+        # kill/timeout (SIGTERM) : sans handler, Python quitte sans flush ni atexit
+        try:
+            self._previous_sigterm = signal.signal(signal.SIGTERM, self._handle_sigterm)
+        except ValueError:
+            self._previous_sigterm = None  # Hors thread principal : pas de handler
+
     def stop(self):
         """Désactive la capture et ferme le fichier."""
         if not self._started:
             return
 
+        atexit.unregister(self.stop)
+
+        if self._previous_sigterm is not None:
+            try:
+                signal.signal(signal.SIGTERM, self._previous_sigterm)
+            except ValueError:
+                pass
+            self._previous_sigterm = None
+
+        self._flush_stop.set()
+        if self._flush_thread:
+            self._flush_thread.join()
+            self._flush_thread = None
+
         # Restaurer stdout/stderr
         sys.stdout = self.original_stdout
         sys.stderr = self.original_stderr
 
         # Écrire footer et fermer
-        if self.log_file:
-            self.log_file.write("\n" + "=" * 60 + "\n")
-            self.log_file.write(f"# Terminal log ended at {datetime.now().isoformat()}\n")
-            self.log_file.close()
-            self.log_file = None
+        with self._lock:
+            if self.log_file:
+                self.log_file.write("\n" + "=" * 60 + "\n")
+                self.log_file.write(f"# Terminal log ended at {datetime.now().isoformat()}\n")
+                self.log_file.close()
+                self.log_file = None
 
         self._started = False
 
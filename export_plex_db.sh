@@ -43,6 +43,16 @@ fi
 OUTPUT_DIR="/tmp"
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
 
+# Compression : zstd multi-thread si disponible (3-5x plus rapide), sinon gzip
+# --long=27 : répétitions cherchées sur 128 Mo (extraction avec un simple zstd -d)
+if command -v zstd > /dev/null 2>&1; then
+    ARCHIVE_EXT="tar.zst"
+    TAR_COMPRESS=(-I "zstd -T0 -3 --long=27")
+else
+    ARCHIVE_EXT="tar.gz"
+    TAR_COMPRESS=(-z)
+fi
+
 # === VÉRIFICATIONS ===
 echo "============================================================"
 echo "EXPORT BASE DE DONNÉES PLEX"
@@ -94,22 +104,22 @@ fi
 
 # === CRÉATION DE L'ARCHIVE ===
 if [[ "$WITH_METADATA" == "true" ]]; then
-    ARCHIVE_NAME="plex_db_metadata_${TIMESTAMP}.tar.gz"
+    ARCHIVE_NAME="plex_db_metadata_${TIMESTAMP}.${ARCHIVE_EXT}"
     echo ""
     echo "📦 Création de l'archive COMPLÈTE (DB + Metadata)..."
     echo "   ⏳ Cela peut prendre plusieurs minutes..."
 
-    tar -czf "${OUTPUT_DIR}/${ARCHIVE_NAME}" \
+    tar "${TAR_COMPRESS[@]}" -cf "${OUTPUT_DIR}/${ARCHIVE_NAME}" \
         -C "$PLEX_BASE" \
         "Plug-in Support/Databases" \
         "Metadata"
 else
-    ARCHIVE_NAME="plex_db_only_${TIMESTAMP}.tar.gz"
+    ARCHIVE_NAME="plex_db_only_${TIMESTAMP}.${ARCHIVE_EXT}"
     echo ""
     echo "📦 Création de l'archive DB seule..."
     echo "   (Utilisez --with-metadata pour inclure les artwork)"
 
-    tar -czf "${OUTPUT_DIR}/${ARCHIVE_NAME}" \
+    tar "${TAR_COMPRESS[@]}" -cf "${OUTPUT_DIR}/${ARCHIVE_NAME}" \
         -C "$PLEX_BASE" \
         "Plug-in Support/Databases"
 fi
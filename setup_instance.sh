@@ -22,7 +22,7 @@ apt-get upgrade -y
 
 # 2. Installation des dépendances et outils utiles
 echo "Installation des dépendances (unzip, docker, outils...)"
-apt-get install -y htop iotop wget curl jq unzip fuse3 sqlite3
+apt-get install -y htop iotop wget curl jq unzip fuse3 sqlite3 zstd
 
 # 2b. Configuration de FUSE pour permettre à rclone + Docker de fonctionner
 echo "Configuration de FUSE (user_allow_other)..."
@@ -19,7 +19,7 @@ Prérequis:
 - Fichier .env avec S3_BUCKET, S3_ACCESS_KEY, S3_SECRET_KEY, PLEX_VERSION
 - FUSE configuré avec user_allow_other (/etc/fuse.conf)
 - Archive DB exportée depuis ZimaBoard (via export_zimaboard_db.sh)
-  Format: plex_db_only_XXXXXX.tar.gz ou plex_metadata_XXXXXX.tar.gz
+  Format: plex_db_only_XXXXXX.tar.zst (ou .tar.gz) ou plex_metadata_XXXXXX.tar.zst
 
 Usage:
     # Delta sync avec auto-détection de l'archive la plus récente
@@ -57,9 +57,7 @@ Usage:
 # === IMPORTS ===
 import argparse
 import os
-import re
 import sys
-import time
 from datetime import datetime
 from pathlib import Path
 
@@ -70,6 +68,8 @@ from common.local import setup_local_test_env, cleanup_local_test_env, find_late
 from common.plex_setup import (
     setup_rclone_config,
     mount_s3,
+    start_plex_image_pull,
+    report_plex_image_pull,
     start_plex_container,
     wait_plex_fully_ready,
     get_plex_token,
@@ -78,10 +78,14 @@ from common.plex_setup import (
     disable_all_background_tasks,
     enable_music_analysis_only,
     enable_all_analysis,
-    collect_plex_logs
+    collect_plex_logs,
+    prompt_plex_claim,
+    create_final_log_archive
 )
 from common.plex_scan import (
+    parse_library_sections,
     trigger_sonic_analysis,
+    get_unanalyzed_track_ids,
     get_monitoring_params,
     export_metadata,
     scan_section_incrementally,
@@ -91,7 +95,8 @@ from common.plex_scan import (
     trigger_section_scan,
     trigger_section_analyze,
     export_intermediate,
-    warm_vfs_cache
+    warm_vfs_cache,
+    get_sonic_diagnostic_from_db
 )
 from common.delta_sync import (
     inject_existing_db,
@@ -168,7 +173,7 @@ def main():
             print("Pour créer une archive depuis le ZimaBoard:")
             print("  1. Copiez export_zimaboard_db.sh sur le ZimaBoard")
             print("  2. Exécutez: ./export_zimaboard_db.sh")
-            print("  3. Récupérez l'archive: scp jbo@zimaboard:/tmp/plex_db_only_*.tar.gz ./")
+            print("  3. Récupérez l'archive: scp jbo@zimaboard:/tmp/plex_db_only_*.tar.* ./")
             print("")
             print("Ou spécifiez le chemin: --archive /path/to/archive.tar.gz")
             sys.exit(1)
@@ -211,18 +216,8 @@ def main():
         setup_local_test_env(TEST_DIR, MOUNT_DIR, PLEX_CONFIG)
         setup_rclone_config(ip)
 
-        # Pre-pull image Docker (évite 30min de téléchargement pendant le scan)
-        plex_version = env.get('PLEX_VERSION', 'latest')
-        plex_image = f"plexinc/pms-docker:{plex_version}"
-        print(f"🐳 Vérification image Docker {plex_image}...")
-        pull_result = execute_command(ip, f"docker pull {plex_image}", capture_output=True, check=False)
-        if pull_result.returncode == 0:
-            if "up to date" in pull_result.stdout.lower() or "up to date" in pull_result.stderr.lower():
-                print("   ✅ Image déjà à jour")
-            else:
-                print("   ✅ Image téléchargée")
-        else:
-            print("   ⚠️  Pull échoué, docker run tentera le téléchargement")
+        # Pre-pull image Docker en arrière-plan (chevauche l'injection DB et le montage S3)
+        image_pull = start_plex_image_pull(ip, env.get('PLEX_VERSION', 'latest'))
 
         # === PHASE 2: INJECTION DB ===
         print_phase_header(2, "INJECTION DB EXISTANTE")
@@ -293,11 +288,14 @@ def main():
         # === PHASE 4: DÉMARRAGE PLEX ===
         print_phase_header(4, "DÉMARRAGE PLEX")
 
+        # Image Plex prête AVANT le claim (docker run ne doit pas consommer le token)
+        report_plex_image_pull(image_pull)
+
         # Claim token AVANT de démarrer le monitoring
         # (évite les deadlocks et messages parasites pendant l'input)
-        plex_claim = input("\n🔑 Entrez votre PLEX_CLAIM (depuis https://www.plex.tv/claim) : ").strip()
+        plex_claim = prompt_plex_claim()
         if not plex_claim:
-            print("❌ PLEX_CLAIM requis")
+            print("❌ PLEX_CLAIM requis (saisie vide ou délai dépassé)")
             sys.exit(1)
 
         # Démarrer Plex avec la DB injectée
@@ -335,14 +333,10 @@ def main():
         print_phase_header(5, "VÉRIFICATION BIBLIOTHÈQUES")
 
         # Récupérer les sections depuis l'API Plex
-        section_info = {}
         api_cmd = f"curl -s 'http://localhost:32400/library/sections' -H 'X-Plex-Token: {plex_token}'"
         result = docker_exec(ip, 'plex', api_cmd, capture_output=True, check=False)
 
-        if result.stdout:
-            for match in re.finditer(r'key="(\d+)".*?type="([^"]+)".*?title="([^"]+)"', result.stdout):
-                s_id, s_type, s_title = match.group(1), match.group(2), match.group(3)
-                section_info[s_title] = {"id": s_id, "type": s_type}
+        section_info = parse_library_sections(result.stdout)
 
         print(f"📚 Sections trouvées: {len(section_info)}")
         for name, info in section_info.items():
@@ -365,10 +359,8 @@ def main():
 
         # === PHASE 6: TRAITEMENT MUSIQUE (Sonic) ===
         # Déterminer si on doit traiter la section Musique
-        should_process_music = (
-            not args.section
-            or any(section_info.get(s, {}).get('type') == 'artist' for s in args.section)
-        )
+        artist_names = {name for name, info in section_info.items() if info['type'] == 'artist'}
+        should_process_music = not args.section or bool(artist_names & set(args.section))
 
         # Initialiser stats_after_scan pour le cas où la phase Music est skippée
         stats_after_scan = stats_before
@@ -470,7 +462,8 @@ def main():
                         wait_section_idle(ip, 'plex', plex_token, music_section_id,
                                           section_type='artist', phase='scan', config_path=str(PLEX_CONFIG),
                                           timeout=metadata_params['absolute_timeout'],
-                                          check_interval=metadata_params['check_interval'])
+                                          check_interval=metadata_params['check_interval'],
+                                          max_interval=metadata_params['check_interval'] * 4)
                         print("   ✅ Refresh metadata terminé.")
 
                         # 6.3b Stabilisation avant Sonic
@@ -483,8 +476,17 @@ def main():
                                              timeout=1800)
 
                     # 6.3c Lancer Sonic (sans --force, le refresh a été fait séparément)
+                    # Delta vide : rien à lancer ; sinon Sonic de section (pas de déclencheur
+                    # Sonic par item, Plex ne traite que les pistes encore sans analyse)
                     print("\n6.3c Lancement analyse Sonic...")
-                    trigger_sonic_analysis(ip, music_section_id, 'plex')
+                    unanalyzed_ids = get_unanalyzed_track_ids(ip, str(PLEX_CONFIG), music_section_id)
+
+                    if unanalyzed_ids == []:
+                        print("   ✅ Aucune piste à analyser (delta vide)")
+                    else:
+                        if unanalyzed_ids:
+                            print(f"   🎯 {len(unanalyzed_ids)} piste(s) sans analyse Sonic")
+                        trigger_sonic_analysis(ip, music_section_id, 'plex')
 
                     # Monitoring avec profil adapté (centralisé dans MONITORING_PROFILES)
                     monitoring_profile = 'cloud_intensive' if args.monitoring == 'cloud' else 'local_delta'
@@ -582,11 +584,10 @@ def main():
         # 8.2 Arrêt Plex
         print("\n8.2 Arrêt de Plex...")
         stop_plex(ip, container='plex')
-        time.sleep(3)
 
         # 8.3 Export complet (utilise RUN_TIMESTAMP pour cohérence)
         print("\n8.3 Export complet...")
-        archive_name = f'plex_delta_sync_{RUN_TIMESTAMP}.tar.gz'
+        archive_name = f'plex_delta_sync_{RUN_TIMESTAMP}.tar.zst'
 
         archive_path_out = export_metadata(
             ip,
@@ -625,10 +626,14 @@ def main():
 
     except KeyboardInterrupt:
         print("\n\n⚠️  Test interrompu par l'utilisateur")
+    except (BrokenPipeError, ConnectionResetError) as e:
+        # Coupure réseau/pipe : la pile (subprocess/ssh) n'apporte rien
+        print(f"\n❌ Connexion interrompue: {e}")
     except Exception as e:
         print(f"\n❌ Erreur: {e}")
         import traceback
-        traceback.print_exc()
+        # 25 dernières frames : le site de l'erreur, pas toute la pile d'appel
+        traceback.print_exc(limit=-25)
     finally:
         # === DIAGNOSTIC POST-MORTEM ===
         print("\n" + "=" * 60)
@@ -648,17 +653,14 @@ def main():
         # === DIAGNOSTIC SONIC (seulement si musique sélectionnée) ===
         if should_process_music:
             print("\n🎹 DIAGNOSTIC SONIC:")
-            db_path = "/config/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
-
-            # 1. Comparer les méthodes de comptage Sonic
-            sonic_count_cmd = f'''docker exec plex sqlite3 "{db_path}" "
-                SELECT
-                    (SELECT COUNT(*) FROM media_item_settings WHERE loudness != 0) as loudness_count,
-                    (SELECT COUNT(*) FROM media_parts WHERE extra_data LIKE '%hasSonicAnalysis%1%') as sonic_flag_count
-            " 2>/dev/null || echo "DB inaccessible"'''
-            sonic_result = execute_command(ip, sonic_count_cmd, capture_output=True, check=False)
+
+            # 1. Comparer les méthodes de comptage Sonic (+ préférences, même requête)
+            sonic_diag = get_sonic_diagnostic_from_db(ip, str(PLEX_CONFIG))
             print(f"   Comptage Sonic (loudness vs extra_data):")
-            print(f"   {sonic_result.stdout.strip()}")
+            if sonic_diag:
+                print(f"   {sonic_diag['loudness']}|{sonic_diag['sonic_flag']}")
+            else:
+                print("   DB inaccessible")
 
             # 2. Logs Sonic spécifiques
             print("\n   Logs Sonic (dernières entrées):")
@@ -672,12 +674,11 @@ def main():
 
             # 4. Vérifier l'état des préférences Sonic
             print("\n   Préférences analyse Plex:")
-            prefs_cmd = f'''docker exec plex sqlite3 "{db_path}" "
-                SELECT name, value FROM preferences
-                WHERE name LIKE '%sonic%' OR name LIKE '%loudness%' OR name LIKE '%musicAnalysis%'
-                LIMIT 10
-            " 2>/dev/null || echo "Préférences inaccessibles"'''
-            execute_command(ip, prefs_cmd, check=False)
+            if sonic_diag:
+                for name, value in sonic_diag['prefs']:
+                    print(f"   {name}|{value}")
+            else:
+                print("   Préférences inaccessibles")
 
         # Dernières logs
         print("\n📋 Dernières logs Docker:")
@@ -689,42 +690,7 @@ def main():
             tee_logger.stop()
 
             # Créer l'archive finale combinée (Plex logs + terminal complet)
-            if os.path.exists(terminal_log_path):
-                import tarfile
-                import tempfile
-                import shutil
-
-                final_archive = f"logs/{RUN_TIMESTAMP}_logs_final_all.tar.gz"
-                os.makedirs("logs", exist_ok=True)
-
-                print(f"\n📦 Création archive finale combinée...")
-                temp_dir = tempfile.mkdtemp(prefix="final_logs_")
-                try:
-                    # Extraire les logs Plex si disponibles
-                    if plex_logs_archive and os.path.exists(plex_logs_archive):
-                        with tarfile.open(plex_logs_archive, 'r:gz') as tar:
-                            tar.extractall(temp_dir)
-                        # Supprimer l'archive Plex seule (remplacée par la combinée)
-                        os.remove(plex_logs_archive)
-
-                    # Ajouter le terminal log complet
-                    shutil.copy(terminal_log_path, os.path.join(temp_dir, f"output_{RUN_TIMESTAMP}.txt"))
-
-                    # Créer l'archive finale
-                    with tarfile.open(final_archive, 'w:gz') as tar:
-                        for item in os.listdir(temp_dir):
-                            tar.add(os.path.join(temp_dir, item), arcname=item)
-
-                    size_mb = os.path.getsize(final_archive) / (1024*1024)
-                    print(f"   ✅ Archive finale: {final_archive} ({size_mb:.1f} MB)")
-
-                finally:
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-
-                # Supprimer le fichier terminal brut
-                os.remove(terminal_log_path)
-            else:
-                print(f"⚠️  Terminal log non trouvé: {terminal_log_path}")
+            create_final_log_archive(terminal_log_path, plex_logs_archive, RUN_TIMESTAMP)
 
         # Nettoyage
         if not args.keep:
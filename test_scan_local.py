@@ -39,8 +39,6 @@ Usage:
 
 # === IMPORTS ===
 import argparse
-import os
-import re
 import time
 from datetime import datetime
 from pathlib import Path
@@ -53,19 +51,25 @@ from common.plex_setup import (
     apply_system_optimizations,
     setup_rclone_config,
     mount_s3,
+    start_plex_image_pull,
+    report_plex_image_pull,
     start_plex_container,
     wait_plex_fully_ready,
     get_plex_token,
-    add_library,
+    add_libraries,
+    wait_for_section_count,
     stop_plex,
     wait_plex_ready_for_libraries,
     verify_plex_pass_active,
     collect_plex_logs,
     disable_all_background_tasks,
     enable_music_analysis_only,
-    enable_all_analysis
+    enable_all_analysis,
+    prompt_plex_claim,
+    create_final_log_archive
 )
 from common.plex_scan import (
+    parse_library_sections,
     trigger_sonic_analysis,
     get_monitoring_params,
     export_metadata,
@@ -76,7 +80,8 @@ from common.plex_scan import (
     trigger_section_scan,
     trigger_section_analyze,
     wait_sonic_complete,
-    export_intermediate
+    export_intermediate,
+    get_sonic_diagnostic_from_db
 )
 
 # === CONFIGURATION ===
@@ -167,17 +172,8 @@ def main():
         # 4. Configuration rclone
         setup_rclone_config(ip)
 
-        # Pre-pull image Docker (évite un long téléchargement pendant le scan)
-        plex_image = f"plexinc/pms-docker:{env['PLEX_VERSION']}"
-        print(f"🐳 Vérification image Docker {plex_image}...")
-        pull_result = execute_command(ip, f"docker pull {plex_image}", capture_output=True, check=False)
-        if pull_result.returncode == 0:
-            if "up to date" in pull_result.stdout.lower() or "up to date" in pull_result.stderr.lower():
-                print("   ✅ Image déjà à jour")
-            else:
-                print("   ✅ Image téléchargée")
-        else:
-            print("   ⚠️  Pull échoué, docker run tentera le téléchargement")
+        # Pre-pull image Docker en arrière-plan (chevauche le montage S3)
+        image_pull = start_plex_image_pull(ip, env['PLEX_VERSION'])
 
         # 5. Montage S3
         print_phase_header(2, "MONTAGE S3")
@@ -231,11 +227,14 @@ def main():
         print(f"  ✅ {PLEX_CONFIG}")
         print(f"  ✅ {PLEX_CONFIG / 'transcode'}")
 
+        # Image Plex prête AVANT le claim (docker run ne doit pas consommer le token)
+        report_plex_image_pull(image_pull)
+
         # Claim Token AVANT de démarrer le monitoring
         # (évite les deadlocks et messages parasites pendant l'input)
-        plex_claim = input("\n🔑 Entrez votre PLEX_CLAIM (depuis https://www.plex.tv/claim) : ").strip()
+        plex_claim = prompt_plex_claim()
         if not plex_claim:
-            print("❌ PLEX_CLAIM requis")
+            print("❌ PLEX_CLAIM requis (saisie vide ou délai dépassé)")
             return
 
         # 6. Lancement Plex
@@ -302,31 +301,26 @@ def main():
             print("⚠️ Plex pas prêt, on continue quand même...")
 
         # Phase 5 avec la fonction simplifiée
-        success_count = 0
-        for lib in libraries:
-            if add_library(ip, 'plex', lib, plex_token):
-                success_count += 1
-            time.sleep(2)  # Pause entre chaque création
+        # Toutes les créations en un seul appel, puis poll de visibilité
+        library_result = add_libraries(ip, 'plex', libraries, plex_token)
+        success_count = len(library_result['created'])
 
         print(f"\n📊 Résumé: {success_count}/{len(libraries)} bibliothèques créées")
 
         # Attendre que Plex finisse d'initialiser les bibliothèques
         if success_count > 0:
-            print("⏳ Pause de 10s pour finalisation des bibliothèques...")
-            time.sleep(10)
+            print("⏳ Attente de finalisation des bibliothèques...")
+            wait_for_section_count(ip, 'plex', plex_token, success_count)
 
         if args.skip_scan:
             print("\n⏭️  Phase de scan désactivée (--skip-scan)")
         else:
             # Récupérer les sections réelles de Plex (avant filtrage --section)
             print("\n📚 Identification des sections...")
-            section_info = {}
             api_cmd = f"curl -s 'http://localhost:32400/library/sections' -H 'X-Plex-Token: {plex_token}'"
             result = docker_exec(ip, 'plex', api_cmd, capture_output=True, check=False)
 
-            for match in re.finditer(r'key="(\d+)".*?type="([^"]+)".*?title="([^"]+)"', result.stdout):
-                s_id, s_type, s_title = match.group(1), match.group(2), match.group(3)
-                section_info[s_title] = {"id": s_id, "type": s_type}
+            section_info = parse_library_sections(result.stdout)
 
             print(f"   📚 Sections trouvées: {len(section_info)}")
             for name, info in section_info.items():
@@ -343,10 +337,8 @@ def main():
 
             # === PHASE 6: TRAITEMENT MUSIQUE (Sonic) ===
             # Déterminer si on doit traiter la section Musique
-            should_process_music = (
-                not args.section
-                or any(section_info.get(s, {}).get('type') == 'artist' for s in args.section)
-            )
+            artist_names = {name for name, info in section_info.items() if info['type'] == 'artist'}
+            should_process_music = not args.section or bool(artist_names & set(args.section))
 
             if should_process_music:
                 print_phase_header(6, "TRAITEMENT MUSIQUE (Sonic)")
@@ -432,7 +424,8 @@ def main():
                         wait_section_idle(ip, 'plex', plex_token, music_section_id,
                                           section_type='artist', phase='scan', config_path=str(PLEX_CONFIG),
                                           timeout=metadata_params['absolute_timeout'],
-                                          check_interval=metadata_params['check_interval'])
+                                          check_interval=metadata_params['check_interval'],
+                                          max_interval=metadata_params['check_interval'] * 4)
                         print("   ✅ Refresh metadata terminé.")
 
                         # 6.3b Stabilisation avant Sonic
@@ -527,11 +520,10 @@ def main():
         # 8.2 Arrêter Plex
         print("\n8.2 Arrêt de Plex...")
         stop_plex(ip, container='plex')
-        time.sleep(3)
 
         # 8.3 Export complet (utilise RUN_TIMESTAMP pour cohérence)
         print("\n8.3 Export complet...")
-        archive_name = f'plex_metadata_local_{RUN_TIMESTAMP}.tar.gz'
+        archive_name = f'plex_metadata_local_{RUN_TIMESTAMP}.tar.zst'
 
         # ✅ APRÈS - Logique conditionnelle
         archive_path = export_metadata(
@@ -559,10 +551,14 @@ def main():
 
     except KeyboardInterrupt:
         print("\n\n⚠️  Test interrompu par l'utilisateur")
+    except (BrokenPipeError, ConnectionResetError) as e:
+        # Coupure réseau/pipe : la pile (subprocess/ssh) n'apporte rien
+        print(f"\n❌ Connexion interrompue: {e}")
     except Exception as e:
         print(f"\n❌ Erreur: {e}")
         import traceback
-        traceback.print_exc()
+        # 25 dernières frames : le site de l'erreur, pas toute la pile d'appel
+        traceback.print_exc(limit=-25)
     finally:
         # === DIAGNOSTIC POST-MORTEM ===
         print("\n" + "=" * 60)
@@ -583,16 +579,12 @@ def main():
         # Diagnostic Sonic (seulement si musique sélectionnée)
         if should_process_music:
             print("\n🎹 DIAGNOSTIC SONIC:")
-            db_path = "/config/Library/Application Support/Plex Media Server/Plug-in Support/Databases/com.plexapp.plugins.library.db"
-
-            sonic_count_cmd = f'''docker exec plex sqlite3 "{db_path}" "
-                SELECT
-                    (SELECT COUNT(*) FROM media_item_settings WHERE loudness != 0) as loudness_count,
-                    (SELECT COUNT(*) FROM media_parts WHERE extra_data LIKE '%hasSonicAnalysis%1%') as sonic_flag_count
-            " 2>/dev/null || echo "DB inaccessible"'''
-            sonic_result = execute_command(ip, sonic_count_cmd, capture_output=True, check=False)
+            sonic_diag = get_sonic_diagnostic_from_db(ip, str(PLEX_CONFIG))
             print(f"   Comptage Sonic (loudness vs extra_data):")
-            print(f"   {sonic_result.stdout.strip()}")
+            if sonic_diag:
+                print(f"   {sonic_diag['loudness']}|{sonic_diag['sonic_flag']}")
+            else:
+                print("   DB inaccessible")
 
         # Afficher les dernières logs système du conteneur
         print("\n📋 Dernières logs Docker:")
@@ -604,42 +596,7 @@ def main():
             tee_logger.stop()
 
             # Créer l'archive finale combinée (Plex logs + terminal complet)
-            if os.path.exists(terminal_log_path):
-                import tarfile
-                import tempfile
-                import shutil
-
-                final_archive = f"logs/{RUN_TIMESTAMP}_logs_final_all.tar.gz"
-                os.makedirs("logs", exist_ok=True)
-
-                print(f"\n📦 Création archive finale combinée...")
-                temp_dir = tempfile.mkdtemp(prefix="final_logs_")
-                try:
-                    # Extraire les logs Plex si disponibles
-                    if plex_logs_archive and os.path.exists(plex_logs_archive):
-                        with tarfile.open(plex_logs_archive, 'r:gz') as tar:
-                            tar.extractall(temp_dir)
-                        # Supprimer l'archive Plex seule (remplacée par la combinée)
-                        os.remove(plex_logs_archive)
-
-                    # Ajouter le terminal log complet
-                    shutil.copy(terminal_log_path, os.path.join(temp_dir, f"output_{RUN_TIMESTAMP}.txt"))
-
-                    # Créer l'archive finale
-                    with tarfile.open(final_archive, 'w:gz') as tar:
-                        for item in os.listdir(temp_dir):
-                            tar.add(os.path.join(temp_dir, item), arcname=item)
-
-                    size_mb = os.path.getsize(final_archive) / (1024*1024)
-                    print(f"   ✅ Archive finale: {final_archive} ({size_mb:.1f} MB)")
-
-                finally:
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-
-                # Supprimer le fichier terminal brut
-                os.remove(terminal_log_path)
-            else:
-                print(f"⚠️  Terminal log non trouvé: {terminal_log_path}")
+            create_final_log_archive(terminal_log_path, plex_logs_archive, RUN_TIMESTAMP)
 
         # Nettoyage
         if not args.keep:
@@ -59,13 +59,13 @@ ARCHIVE_PATH="$1"
 # === DÉTECTION ARCHIVE ===
 if [ -z "$ARCHIVE_PATH" ]; then
     # Auto-détection de la dernière archive
-    ARCHIVE_PATH=$(ls -t plex_metadata_*.tar.gz plex_delta_sync_*.tar.gz 2>/dev/null | head -n 1)
+    ARCHIVE_PATH=$(ls -t plex_metadata_*.tar.zst plex_delta_sync_*.tar.zst plex_metadata_*.tar.gz plex_delta_sync_*.tar.gz 2>/dev/null | head -n 1)
 fi
 
 # === VÉRIFICATIONS ===
 if [ -z "$ARCHIVE_PATH" ]; then
     echo "❌ Aucune archive trouvée."
-    echo "   Patterns recherchés : plex_metadata_*.tar.gz, plex_delta_sync_*.tar.gz"
+    echo "   Patterns recherchés : plex_metadata_*.tar.{zst,gz}, plex_delta_sync_*.tar.{zst,gz}"
     echo ""
     echo "Usage: $0 [archive.tar.gz]"
     exit 1
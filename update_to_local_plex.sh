@@ -29,13 +29,13 @@ AUTO_CONFIRM="$3"
 # === DÉTECTION ARCHIVE ===
 if [ -z "$ARCHIVE_NAME" ]; then
     # Cherche plex_metadata_* ou plex_delta_sync_* (le plus récent)
-    ARCHIVE_NAME=$(ls -t plex_metadata_*.tar.gz plex_delta_sync_*.tar.gz 2>/dev/null | head -n 1)
+    ARCHIVE_NAME=$(ls -t plex_metadata_*.tar.zst plex_delta_sync_*.tar.zst plex_metadata_*.tar.gz plex_delta_sync_*.tar.gz 2>/dev/null | head -n 1)
 fi
 
 # === VÉRIFICATIONS ===
 if [ -z "$ARCHIVE_NAME" ]; then
     echo "❌ Aucune archive trouvée."
-    echo "   Patterns recherchés : plex_metadata_*.tar.gz, plex_delta_sync_*.tar.gz"
+    echo "   Patterns recherchés : plex_metadata_*.tar.{zst,gz}, plex_delta_sync_*.tar.{zst,gz}"
     echo ""
     echo "Usage: $0 [plex_data_path] [archive.tar.gz] [-y]"
     exit 1
@@ -80,9 +80,16 @@ sudo systemctl stop plexmediaserver
 
 echo ""
 echo "2. 💾 Création backup local..."
-BACKUP_ARCHIVE="plex_local_backup_${TIMESTAMP}.tar.gz"
+# Compression : zstd multi-thread si disponible (3-5x plus rapide), sinon gzip
+if command -v zstd > /dev/null 2>&1; then
+    BACKUP_ARCHIVE="plex_local_backup_${TIMESTAMP}.tar.zst"
+    BACKUP_COMPRESS=(-I "zstd -T0 -3")
+else
+    BACKUP_ARCHIVE="plex_local_backup_${TIMESTAMP}.tar.gz"
+    BACKUP_COMPRESS=(-z)
+fi
 # Backup des dossiers existants (ignore les erreurs si dossiers absents)
-if sudo tar -czf "$BACKUP_ARCHIVE" -C "$PLEX_DATA_PATH/.." \
+if sudo tar "${BACKUP_COMPRESS[@]}" -cf "$BACKUP_ARCHIVE" -C "$PLEX_DATA_PATH/.." \
     "Plex Media Server/Plug-in Support/Databases" \
     "Plex Media Server/Metadata" \
     "Plex Media Server/Media" 2>/dev/null; then
@@ -100,7 +107,12 @@ echo "   ✅ Anciennes données supprimées"
 
 echo ""
 echo "4. 🚀 Extraction de l'archive..."
-sudo tar -xzf "$ARCHIVE_NAME" -C "$PLEX_DATA_PATH/.."
+# .tar.zst (workflow actuel, zstd multi-thread) ou .tar.gz (anciennes archives)
+if [[ "$ARCHIVE_NAME" == *.zst ]]; then
+    sudo tar -I 'zstd -T0' -xf "$ARCHIVE_NAME" -C "$PLEX_DATA_PATH/.."
+else
+    sudo tar -xzf "$ARCHIVE_NAME" -C "$PLEX_DATA_PATH/.."
+fi
 echo "   ✅ Archive extraite"
 
 echo ""